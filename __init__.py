@@ -1,3 +1,8 @@
 from . import models
 from . import controllers
-from . import wizards
\ No newline at end of file
+from . import wizards
+
+
+def post_init_hook(env):
+    """Carga el libro de deuda con los pedidos y regalías existentes al instalar el módulo"""
+    env['gelroy.debt.ledger']._backfill()
\ No newline at end of file
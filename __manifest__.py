@@ -10,7 +10,7 @@ Herramienta digital que centraliza y automatiza la administración de franquicia
     'author': "Franco Dell Aguila Ureña",
     'website': "https://www.linkedin.com/in/franco-dell-aguila/",
     'category': 'Franchising',
-    'version': '17.0.1.0.0',
+    'version': '17.0.1.1.0',
     'license': 'LGPL-3',
     'depends': [
         'base', 
@@ -24,9 +24,14 @@ Herramienta digital que centraliza y automatiza la administración de franquicia
     'data': [
         'security/franchise_security.xml',
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'views/franchise_views.xml', 
         'views/royalty_payment_views.xml',
+        'views/royalty_run_views.xml',
         'views/stock_order_views.xml', 
+        'views/stock_order_bulk_approve_views.xml',
+        'views/invoice_batch_views.xml',
+        'views/debt_ledger_views.xml',
         'views/product_views.xml',
         'views/recipe_views.xml',
         'views/production_views.xml',
@@ -35,10 +40,11 @@ Herramienta digital que centraliza y automatiza la administración de franquicia
     ],
     'assets': {
         'web.assets_backend': [
-            'web/static/src/xml/**/*',
+            'gelroy/static/src/**/*',
         ],
     },
     'demo': ['demo/demo.xml'],
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'application': True,
     'auto_install': False,
@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Carga el libro de deuda con los pedidos y regalías existentes al actualizar el módulo"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['gelroy.debt.ledger']._backfill()
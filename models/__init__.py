@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
 
 from . import franchise
+from . import franchise_sequence
 from . import royalty_payment
+from . import royalty_run
 from . import stock_order
 from . import stock_order_line
+from . import stock_reservation
+from . import debt_ledger
 from . import product_extension
 from . import invoice
+from . import invoice_batch
+from . import stock_picking
 from . import recipe
 from . import production
-from . import franchise_dashboard 
\ No newline at end of file
+from . import kpi_engine
+from . import kpi_snapshot
+from . import overdue_engine
+from . import franchise_dashboard
+from . import franchise_leaderboard
\ No newline at end of file
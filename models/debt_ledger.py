@@ -0,0 +1,251 @@
+from collections import defaultdict
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import float_is_zero
+
+# Tramos de antigüedad de la deuda: (clave, días de atraso desde, hasta)
+AGING_BUCKETS = (
+    ('not_due', None, 0),
+    ('1_30', 1, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('over_90', 91, None),
+)
+# Estados de pedidos con deuda pendiente
+DEBT_STOCK_STATES = ('delivered', 'overdue')
+# Modelos cuyos documentos generan movimientos en el libro de deuda
+DEBT_DOCUMENT_MODELS = ('gelroy.stock.order', 'gelroy.royalty.payment')
+
+
+class DebtLedger(models.Model):
+    _name = 'gelroy.debt.ledger'
+    _description = 'Franchise Debt Ledger'
+    _order = 'franchise_id, date desc, id desc'
+    _rec_name = 'document_name'
+
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', required=True,
+                                   readonly=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', related='franchise_id.currency_id', readonly=True)
+    date = fields.Date(string='Posting Date', required=True, readonly=True,
+                       default=fields.Date.context_today)
+    event_type = fields.Selection([
+        ('royalty_calculated', 'Royalty Calculated'),
+        ('order_delivered', 'Order Delivered'),
+        ('payment', 'Invoice Paid'),
+        ('reversal', 'Reversal'),
+    ], string='Event', required=True, readonly=True)
+
+    # Documento de origen (referencia genérica: el movimiento sobrevive al documento)
+    res_model = fields.Char(string='Document Model', required=True, readonly=True, index=True)
+    res_id = fields.Integer(string='Document ID', required=True, readonly=True)
+    document_name = fields.Char(string='Document', readonly=True)
+    due_date = fields.Date(string='Due Date', readonly=True)
+
+    debit = fields.Monetary(string='Debit', readonly=True)
+    credit = fields.Monetary(string='Credit', readonly=True)
+    amount = fields.Monetary(string='Amount', readonly=True, help='Debit minus credit')
+    balance = fields.Monetary(string='Running Balance', readonly=True,
+                              help='Franchise debt right after this entry')
+
+    def init(self):
+        """
+        Índices del libro:
+        - (franquicia, fecha, id): saldo actual e histórico = la última fila del rango
+        - (modelo, documento): saldo abierto de cada documento al registrar un cambio
+        """
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS gelroy_debt_ledger_franchise_date_idx
+                ON gelroy_debt_ledger (franchise_id, date, id) INCLUDE (amount, balance)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS gelroy_debt_ledger_document_idx
+                ON gelroy_debt_ledger (res_model, res_id)
+        """)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Asienta los movimientos calculando el saldo acumulado de cada franquicia.
+        Las franquicias afectadas se bloquean para que dos transacciones no partan
+        del mismo saldo anterior. Un movimiento nunca queda fechado antes del último de
+        su franquicia (se asienta en esa fecha): así el saldo de la última fila del
+        rango (franquicia, fecha) es siempre el saldo a esa fecha.
+        """
+        franchise_ids = sorted({vals['franchise_id'] for vals in vals_list})
+        last_entries = self._get_last_entries(franchise_ids, lock=True)
+        for vals in vals_list:
+            amount = vals.get('amount', 0.0)
+            vals.setdefault('date', fields.Date.context_today(self))
+            vals['date'] = fields.Date.to_date(vals['date'])
+            vals['debit'] = max(amount, 0.0)
+            vals['credit'] = max(-amount, 0.0)
+            last_date, last_balance = last_entries.get(vals['franchise_id'], (None, 0.0))
+            if last_date and vals['date'] < last_date:
+                vals['date'] = last_date
+            vals['balance'] = last_balance + amount
+            last_entries[vals['franchise_id']] = (vals['date'], vals['balance'])
+        return super().create(vals_list)
+
+    def write(self, vals):
+        raise UserError(_("Debt ledger entries cannot be modified. Post a reversal instead."))
+
+    def unlink(self):
+        raise UserError(_("Debt ledger entries cannot be deleted. Post a reversal instead."))
+
+    @api.model
+    def _get_last_entries(self, franchise_ids, lock=False):
+        """Fecha y saldo del último movimiento de cada franquicia: {franchise_id: (fecha, saldo)}"""
+        if not franchise_ids:
+            return {}
+        cr = self.env.cr
+        if lock:
+            cr.execute("""
+                SELECT id FROM gelroy_franchise WHERE id = ANY(%s) ORDER BY id FOR NO KEY UPDATE
+            """, [list(franchise_ids)])
+        self.flush_model()
+        cr.execute("""
+            SELECT DISTINCT ON (franchise_id) franchise_id, date, balance
+              FROM gelroy_debt_ledger
+             WHERE franchise_id = ANY(%s)
+          ORDER BY franchise_id, date DESC, id DESC
+        """, [list(franchise_ids)])
+        return {franchise_id: (date, balance) for franchise_id, date, balance in cr.fetchall()}
+
+    @api.model
+    def _sync_documents(self, documents, removed=False, decrease_event='reversal'):
+        """
+        Registra en el libro la variación de deuda de los documentos (pedidos o regalías).
+        Compara la deuda abierta de cada documento según el libro con la que indica
+        el documento (_get_debt_ledger_values) y asienta solo la diferencia:
+        - aumento: royalty_calculated / order_delivered
+        - baja a cero con el documento pagado: payment
+        - cualquier otra baja: decrease_event, reversal salvo que la indique un cobro
+          (cancelación, vuelta atrás, borrado, cambio de franquicia); la sincronización
+          de cobros de facturas pasa payment para los pagos parciales
+        Con removed=True la deuda esperada es cero (el documento se va a eliminar).
+        Con el libro vacío (base actualizada sin migrar) primero se carga el historial con
+        _backfill; si no, el primer cambio asentaría toda la deuda del documento con fecha de hoy.
+        """
+        if not documents:
+            return self.browse()
+        if not self.sudo().search_count([], limit=1):
+            self._backfill()
+        targets = {} if removed else documents._get_debt_ledger_values()
+        booked = defaultdict(float)
+        for franchise, res_id, amount in self.sudo()._read_group(
+            [('res_model', '=', documents._name), ('res_id', 'in', documents.ids)],
+            ['franchise_id', 'res_id'], ['amount:sum'],
+        ):
+            booked[(franchise.id, res_id)] += amount
+
+        keys = set(booked)
+        keys.update((values['franchise_id'], res_id) for res_id, values in targets.items())
+        today = fields.Date.context_today(self)
+        vals_list = []
+        for franchise_id, res_id in sorted(keys):
+            values = targets.get(res_id, {})
+            target = values.get('amount', 0.0) if values.get('franchise_id') == franchise_id else 0.0
+            delta = target - booked.get((franchise_id, res_id), 0.0)
+            if float_is_zero(delta, precision_digits=2):
+                continue
+            if delta > 0:
+                event_type = values['debit_event']
+            elif float_is_zero(target, precision_digits=2) and values.get('settled'):
+                event_type = 'payment'
+            else:
+                event_type = decrease_event
+            vals_list.append({
+                'franchise_id': franchise_id,
+                'date': today,
+                'event_type': event_type,
+                'res_model': documents._name,
+                'res_id': res_id,
+                'document_name': values.get('name') or documents.browse(res_id).display_name,
+                'due_date': values.get('due_date') or False,
+                'amount': delta,
+            })
+        return self.sudo().create(vals_list) if vals_list else self.browse()
+
+    @api.model
+    def _backfill(self):
+        """
+        Carga inicial del libro desde los documentos existentes, en orden cronológico:
+        cada documento con deuda (o ya pagado) genera su débito en la fecha de origen
+        y los pagados, además, su crédito en la fecha de pago.
+        """
+        vals_list = []
+        for model_name in DEBT_DOCUMENT_MODELS:
+            documents = self.env[model_name].with_context(active_test=False).search([])
+            booked = set(self.sudo()._read_group(
+                [('res_model', '=', model_name)], ['res_id'], [],
+            ))
+            documents = documents.filtered(lambda document: (document.id,) not in booked)
+            for res_id, values in documents._get_debt_ledger_values(history=True).items():
+                if float_is_zero(values['debit_amount'], precision_digits=2):
+                    continue
+                entry = {
+                    'franchise_id': values['franchise_id'],
+                    'res_model': model_name,
+                    'res_id': res_id,
+                    'document_name': values['name'],
+                    'due_date': values.get('due_date') or False,
+                }
+                vals_list.append(dict(entry, date=values['debit_date'],
+                                      event_type=values['debit_event'], amount=values['debit_amount']))
+                if values.get('settled'):
+                    credit_date = max(values['credit_date'] or values['debit_date'], values['debit_date'])
+                    vals_list.append(dict(entry, date=credit_date,
+                                          event_type='payment', amount=-values['debit_amount']))
+        vals_list.sort(key=lambda vals: (vals['franchise_id'], vals['date']))
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def _get_balances(self, franchise_ids, as_of=None):
+        """
+        Saldo de deuda de cada franquicia a una fecha (hoy si no se indica): {franchise_id: saldo}.
+        Cada saldo es la última fila del rango (franquicia, fecha <= as_of) del índice.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT franchise.id, last_entry.balance
+              FROM unnest(%s::integer[]) AS franchise(id)
+              CROSS JOIN LATERAL (
+                  SELECT balance
+                    FROM gelroy_debt_ledger
+                   WHERE franchise_id = franchise.id
+                     AND date <= %s
+                ORDER BY date DESC, id DESC
+                   LIMIT 1
+              ) AS last_entry
+        """, [list(franchise_ids), as_of or fields.Date.context_today(self)])
+        balances = dict.fromkeys(franchise_ids, 0.0)
+        balances.update(self.env.cr.fetchall())
+        return balances
+
+    @api.model
+    def _get_aging(self, franchise_ids, as_of=None):
+        """
+        Deuda abierta a una fecha repartida por antigüedad: {franchise_id: {tramo: monto}}.
+        Una consulta sobre el rango (franquicia, fecha <= as_of): saldo abierto por documento
+        y atraso según su vencimiento.
+        """
+        as_of = as_of or fields.Date.context_today(self)
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT franchise_id, %s - MAX(due_date) AS days_overdue, SUM(amount) AS open_amount
+              FROM gelroy_debt_ledger
+             WHERE franchise_id = ANY(%s)
+               AND date <= %s
+          GROUP BY franchise_id, res_model, res_id
+            HAVING SUM(amount) > 0.005
+        """, [as_of, list(franchise_ids), as_of])
+        aging = {franchise_id: dict.fromkeys([bucket for bucket, _start, _end in AGING_BUCKETS], 0.0)
+                 for franchise_id in franchise_ids}
+        for franchise_id, days_overdue, open_amount in self.env.cr.fetchall():
+            days_overdue = days_overdue or 0
+            for bucket, start, end in AGING_BUCKETS:
+                if (start is None or days_overdue >= start) and (end is None or days_overdue <= end):
+                    aging[franchise_id][bucket] += open_amount
+                    break
+        return aging
@@ -1,7 +1,24 @@
+import logging
+from collections import defaultdict
+
 from odoo import models, fields, api, _ 
 from odoo.exceptions import UserError
+from odoo.tools import float_is_zero
 from dateutil.relativedelta import relativedelta
 
+_logger = logging.getLogger(__name__)
+
+# Resumen financiero mantenido por deltas (ver _apply_financial_summary_deltas)
+FINANCIAL_SUMMARY_AMOUNT_FIELDS = (
+    'total_royalties_due', 'total_royalties_paid', 'outstanding_royalties',
+    'outstanding_stock_orders', 'total_outstanding_debt',
+)
+FINANCIAL_SUMMARY_COUNT_FIELDS = ('pending_royalty_payments', 'pending_stock_orders_count')
+FINANCIAL_SUMMARY_FIELDS = FINANCIAL_SUMMARY_AMOUNT_FIELDS + FINANCIAL_SUMMARY_COUNT_FIELDS
+PENDING_ROYALTY_STATES = ('calculated', 'confirmed', 'overdue')
+# Campos de fecha que delimitan el ámbito de la caché de KPIs de los pagos de regalías
+ROYALTY_KPI_SCOPE_FIELDS = ('period_start_date', 'period_end_date')
+
 class Franchise(models.Model):
     _name = "gelroy.franchise"
     _description = "Franchise Information"
@@ -55,41 +72,79 @@ class Franchise(models.Model):
     currency_id = fields.Many2one('res.currency', string='Currency', 
                                   default=lambda self: self.env.company.currency_id,
                                   help="Currency used for this franchise")
+    invoicing_policy = fields.Selection([
+        ('per_order', 'Per Order'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ], string='Stock Order Invoicing', default='per_order', required=True, tracking=True,
+        help="Per Order: one invoice per stock order. Weekly/Monthly: one consolidated invoice "
+             "per period covering all the stock orders of the franchise.")
     
     # Relaciones
     royalty_payment_ids = fields.One2many('gelroy.royalty.payment', 'franchise_id', string="Royalty Payments") 
-    royalty_payment_count = fields.Integer(compute='_compute_royalty_payment_count', string="Royalty Payments Count")
+    royalty_payment_count = fields.Integer(compute='_compute_related_counts', string="Royalty Payments Count")
+    overdue_royalty_payment_count = fields.Integer(compute='_compute_related_counts', string="Overdue Royalty Payments")
 
     # campos para pedidos de stock
     stock_order_ids = fields.One2many('gelroy.stock.order', 'franchise_id', string="Stock Orders")
-    stock_order_count = fields.Integer(compute='_compute_stock_order_count', string="Stock Orders Count")
-
-    # Campos financieros calculados
-    total_royalties_due = fields.Monetary(string='Total Royalties Due', 
-                                         compute='_compute_financial_summary', store=True)
-    total_royalties_paid = fields.Monetary(string='Total Royalties Paid', 
-                                          compute='_compute_financial_summary', store=True)
-    outstanding_royalties = fields.Monetary(string='Outstanding Royalties', 
-                                           compute='_compute_financial_summary', store=True)
+    stock_order_count = fields.Integer(compute='_compute_related_counts', string="Stock Orders Count")
+    overdue_stock_order_count = fields.Integer(compute='_compute_related_counts', string="Overdue Stock Orders")
+
+    # Resumen financiero: se mantiene por deltas al cambiar pedidos y regalías
+    # y lo verifica a diario la acción de conciliación (_reconcile_financial_summary)
+    total_royalties_due = fields.Monetary(string='Total Royalties Due', readonly=True)
+    total_royalties_paid = fields.Monetary(string='Total Royalties Paid', readonly=True)
+    outstanding_royalties = fields.Monetary(string='Outstanding Royalties', readonly=True)
     
     # Deuda de pedidos de mercadería
-    outstanding_stock_orders = fields.Monetary(string='Outstanding Stock Orders', 
-                                              compute='_compute_financial_summary', store=True)
+    outstanding_stock_orders = fields.Monetary(string='Outstanding Stock Orders', readonly=True)
     
     # Deuda total combinada
-    total_outstanding_debt = fields.Monetary(string='Total Debt', 
-                                            compute='_compute_financial_summary', store=True)
+    total_outstanding_debt = fields.Monetary(string='Total Debt', readonly=True)
     
     # Contadores
-    pending_royalty_payments = fields.Integer(string='Pending Royalty Payments', 
-                                             compute='_compute_financial_summary', store=True)
-    pending_stock_orders_count = fields.Integer(string='Pending Stock Orders', 
-                                               compute='_compute_financial_summary', store=True)
+    pending_royalty_payments = fields.Integer(string='Pending Royalty Payments', readonly=True)
+    pending_stock_orders_count = fields.Integer(string='Pending Stock Orders', readonly=True)
 
     _sql_constraints = [
         ('franchise_code_unique', 'unique(franchise_code)', 'Franchise Code must be unique!')
     ]
 
+    def _get_invoicing_period(self, day):
+        """Período de facturación consolidada (inicio, fin) que contiene la fecha 'day'"""
+        self.ensure_one()
+        if self.invoicing_policy == 'weekly':
+            period_start = day - relativedelta(days=day.weekday())
+            return period_start, period_start + relativedelta(days=6)
+        if self.invoicing_policy == 'monthly':
+            period_start = day.replace(day=1)
+            return period_start, period_start + relativedelta(months=1, days=-1)
+        return day, day
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        franchises = super().create(vals_list)
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(franchises)
+        return franchises
+
+    def write(self, vals):
+        """Invalida la caché de KPIs de la franquicia y los KPIs globales"""
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(self)
+        res = super().write(vals)
+        # Cambiar el porcentaje recalcula todas las regalías sin pasar por su write():
+        # resumen, libro de deuda y caché de KPIs de sus períodos
+        if 'royalty_fee_percentage' in vals:
+            self._reconcile_financial_summary()
+            self.env['gelroy.debt.ledger']._sync_documents(self.royalty_payment_ids)
+            self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(
+                self.royalty_payment_ids, ROYALTY_KPI_SCOPE_FIELDS,
+            )
+        return res
+
+    def unlink(self):
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(self)
+        return super().unlink()
+
     # Calcula la duración del contrato en meses.
     @api.depends('contract_start_date', 'contract_end_date')
     def _compute_contract_duration(self):
@@ -100,23 +155,35 @@ class Franchise(models.Model):
             else:
                 rec.contract_duration_months = 0
 
-    # Calcula el número de registros de pago de regalías asociados a esta franquicia.
-    @api.depends('royalty_payment_ids')
-    def _compute_royalty_payment_count(self):
-        for franchise in self:
-            # Asigna la cantidad de elementos en la relación One2many.
-            franchise.royalty_payment_count = len(franchise.royalty_payment_ids)
-
-    # método para contar pedidos de stock
-    @api.depends('stock_order_ids')
-    def _compute_stock_order_count(self):
+    # Contadores de pagos de regalías y pedidos de stock (totales y vencidos).
+    # Los pendientes son parte del resumen financiero almacenado.
+    @api.depends('royalty_payment_ids.state', 'stock_order_ids.state')
+    def _compute_related_counts(self):
+        """
+        Cuenta los documentos de todas las franquicias de la página con un conteo agrupado
+        por modelo relacionado, sin cargar los registros: la cantidad de consultas no
+        depende de cuántas franquicias se muestren.
+        """
+        counts = defaultdict(lambda: defaultdict(int))
+        franchise_ids = self._origin.ids
+        for model_name, prefix in (('gelroy.royalty.payment', 'royalty_payment'), ('gelroy.stock.order', 'stock_order')):
+            for franchise, state, count in self.env[model_name]._read_group(
+                [('franchise_id', 'in', franchise_ids)], ['franchise_id', 'state'], ['__count'],
+            ):
+                counts[franchise.id][f'{prefix}_count'] += count
+                if state == 'overdue':
+                    counts[franchise.id][f'overdue_{prefix}_count'] += count
         for franchise in self:
-            franchise.stock_order_count = len(franchise.stock_order_ids)
+            franchise_counts = counts[franchise._origin.id]
+            franchise.royalty_payment_count = franchise_counts['royalty_payment_count']
+            franchise.overdue_royalty_payment_count = franchise_counts['overdue_royalty_payment_count']
+            franchise.stock_order_count = franchise_counts['stock_order_count']
+            franchise.overdue_stock_order_count = franchise_counts['overdue_stock_order_count']
 
     def _calculate_and_create_royalty_payment(self, period_start, period_end, sales_basis):
         """
         Calcula la regalía para un período y base dados, luego crea un registro de Pago de Regalía.
-        Llamado por una acción planificada.
+        Para calcular varias franquicias a la vez usar gelroy.royalty.run.
 
         :param date period_start: Fecha de inicio del período de cálculo.
         :param date period_end: Fecha de fin del período de cálculo.
@@ -138,33 +205,31 @@ class Franchise(models.Model):
         if not self.currency_id:
             raise UserError(_("Cannot calculate royalty for franchise '%s' without a defined currency.") % self.name)
 
-        # Calcula el monto de la regalía.
-        calculated_amount = (sales_basis * self.royalty_fee_percentage) / 100.0
-
-        # Calcula la fecha de vencimiento (ej. 15 días después del fin de período).
-        due_date = period_end + relativedelta(days=15)
-
-        # Prepara los valores para crear el nuevo registro de pago.
-        payment_vals = {
-            'franchise_id': self.id,
-            'calculation_date': fields.Date.context_today(self), # Fecha actual
-            'period_start_date': period_start,
-            'period_end_date': period_end,
-            'royalty_rate': self.royalty_fee_percentage, # Tasa de regalía usada
-            'calculated_amount': calculated_amount, # Monto calculado
-            'payment_due_date': due_date, # Fecha de vencimiento
-            'state': 'calculated', # Estado inicial
-            'currency_id': self.currency_id.id, # Moneda
-        }
-
         # Crea el registro de pago de regalía.
-        royalty_payment = self.env['gelroy.royalty.payment'].create(payment_vals)
+        royalty_payment = self.env['gelroy.royalty.payment'].create(
+            self._prepare_royalty_payment_vals(period_start, period_end, sales_basis)
+        )
         # Registra un mensaje en el chatter de la franquicia.
         self.message_post(body=_("Pago de regalía calculado para el período %s a %s.") % (period_start, period_end))
 
         # Devuelve el registro creado.
         return royalty_payment
 
+    def _prepare_royalty_payment_vals(self, period_start, period_end, sales_basis):
+        """
+        Valores del pago de regalías del período. El monto calculado, la tasa, la moneda
+        y el vencimiento los completa el propio pago a partir de la franquicia.
+        """
+        self.ensure_one()
+        return {
+            'franchise_id': self.id,
+            'calculation_date': fields.Date.context_today(self),
+            'period_start_date': period_start,
+            'period_end_date': period_end,
+            'period_revenue': sales_basis,
+            'state': 'calculated',
+        }
+
     def action_view_royalty_payments(self):
         """Ver todos los pagos de regalías de esta franquicia"""
         return {
@@ -208,9 +273,13 @@ class Franchise(models.Model):
         }
 
     def action_view_all_debts(self):
-        """Ver un resumen consolidado de todas las deudas"""
-        # Aquí podrías crear una vista especial o dashboard
-        pass
+        """Ver un resumen consolidado de todas las deudas: el libro de deuda agrupado por documento"""
+        action = self.env['ir.actions.act_window']._for_xml_id('gelroy.action_debt_ledger')
+        action['domain'] = [('franchise_id', 'in', self.ids)]
+        action['context'] = {'search_default_group_by_document': 1}
+        if len(self) == 1:
+            action['name'] = _('Debts - %s') % self.name
+        return action
 
     def action_franchisee_dashboard(self):
         """Panel específico para franquiciados de sus pedidos de stock."""
@@ -227,47 +296,98 @@ class Franchise(models.Model):
             }
         }
 
-    @api.depends('royalty_payment_ids.state', 'royalty_payment_ids.calculated_amount', 
-                 'royalty_payment_ids.paid_amount', 'stock_order_ids.state', 'stock_order_ids.total_amount')
-    def _compute_financial_summary(self):
-        for franchise in self:
-            # PEDIDOS DE STOCK
-            stock_orders = franchise.stock_order_ids
-            
-            # Deuda de pedidos entregados pero no pagados
-            delivered_unpaid_orders = stock_orders.filtered(
-                lambda o: o.state == 'delivered'
-            )
-            outstanding_stock_orders = sum(delivered_unpaid_orders.mapped('total_amount'))
-            
-            # Contador de pedidos pendientes de pago
-            pending_stock_count = len(delivered_unpaid_orders)
-            
-            # REGALÍAS
-            royalty_payments = franchise.royalty_payment_ids
-            
-            # Totales de regalías
-            total_royalties_due = sum(payment.calculated_amount for payment in royalty_payments 
-                                     if payment.state in ['calculated', 'confirmed', 'overdue'])
-            total_royalties_paid = sum(payment.paid_amount for payment in royalty_payments)
-            outstanding_royalties = sum(payment.outstanding_amount for payment in royalty_payments 
-                                       if payment.state != 'paid')
-            
-            # Contadores de regalías
-            pending_royalty_count = len(royalty_payments.filtered(
-                lambda p: p.state in ['calculated', 'confirmed', 'overdue']
-            ))
-            
-            # TOTALES COMBINADOS
-            total_debt = outstanding_royalties + outstanding_stock_orders
-            
-            franchise.update({
-                'total_royalties_due': total_royalties_due,
-                'total_royalties_paid': total_royalties_paid,
-                'outstanding_royalties': outstanding_royalties,
-                'outstanding_stock_orders': outstanding_stock_orders,
-                'total_outstanding_debt': total_debt,
-                'pending_royalty_payments': pending_royalty_count,
-                'pending_stock_orders_count': pending_stock_count,
-            })
+    @api.model
+    def _apply_financial_summary_deltas(self, before, after):
+        """
+        Actualiza el resumen financiero aplicando solo la diferencia de los documentos modificados.
+        before/after: listas de (franchise_id, {campo: valor}) con el aporte de cada documento
+        antes y después del cambio (ver _get_financial_contributions en pedidos y regalías).
+        Un único UPDATE con sumas en la base de datos: dos transacciones que modifican la
+        misma franquicia no se pisan los totales.
+        """
+        deltas = defaultdict(lambda: defaultdict(float))
+        for sign, contributions in ((-1, before), (1, after)):
+            for franchise_id, values in contributions:
+                for field_name, value in values.items():
+                    deltas[franchise_id][field_name] += sign * value
+        rows = [(franchise_id, values) for franchise_id, values in deltas.items()
+                if franchise_id and any(not float_is_zero(value, precision_digits=6) for value in values.values())]
+        if not rows:
+            return
+        self.flush_model(FINANCIAL_SUMMARY_FIELDS)
+        assignments = ', '.join(
+            f"{field_name} = COALESCE(franchise.{field_name}, 0) + delta.{field_name}"
+            for field_name in FINANCIAL_SUMMARY_FIELDS
+        )
+        columns = ', '.join(FINANCIAL_SUMMARY_FIELDS)
+        arrays = ', '.join(['%s::numeric[]'] * len(FINANCIAL_SUMMARY_AMOUNT_FIELDS)
+                           + ['%s::integer[]'] * len(FINANCIAL_SUMMARY_COUNT_FIELDS))
+        self.env.cr.execute(f"""
+            UPDATE gelroy_franchise AS franchise
+               SET {assignments}
+              FROM unnest(%s::integer[], {arrays}) AS delta(id, {columns})
+             WHERE franchise.id = delta.id
+        """, [[franchise_id for franchise_id, _values in rows]] + [
+            [round(values.get(field_name, 0.0)) if field_name in FINANCIAL_SUMMARY_COUNT_FIELDS
+             else values.get(field_name, 0.0) for _franchise_id, values in rows]
+            for field_name in FINANCIAL_SUMMARY_FIELDS
+        ])
+        self.browse([franchise_id for franchise_id, _values in rows]).invalidate_recordset(FINANCIAL_SUMMARY_FIELDS)
+
+    def _get_financial_aggregates(self):
+        """Resumen financiero completo de las franquicias con dos consultas agrupadas: {id: {campo: valor}}"""
+        summary = {franchise.id: dict.fromkeys(FINANCIAL_SUMMARY_FIELDS, 0.0) for franchise in self}
+
+        # PEDIDOS DE STOCK: deuda de pedidos entregados pero no pagados
+        for franchise, amount, count in self.env['gelroy.stock.order'].sudo()._read_group(
+            [('franchise_id', 'in', self.ids), ('state', '=', 'delivered')],
+            ['franchise_id'], ['total_amount:sum', '__count'],
+        ):
+            summary[franchise.id]['outstanding_stock_orders'] = amount or 0.0
+            summary[franchise.id]['pending_stock_orders_count'] = count
+
+        # REGALÍAS
+        for franchise, state, calculated, paid, outstanding, count in self.env['gelroy.royalty.payment'].sudo()._read_group(
+            [('franchise_id', 'in', self.ids)],
+            ['franchise_id', 'state'],
+            ['calculated_amount:sum', 'paid_amount:sum', 'outstanding_amount:sum', '__count'],
+        ):
+            values = summary[franchise.id]
+            values['total_royalties_paid'] += paid or 0.0
+            if state in PENDING_ROYALTY_STATES:
+                values['total_royalties_due'] += calculated or 0.0
+                values['pending_royalty_payments'] += count
+            if state != 'paid':
+                values['outstanding_royalties'] += outstanding or 0.0
+
+        # TOTALES COMBINADOS
+        for values in summary.values():
+            values['total_outstanding_debt'] = values['outstanding_royalties'] + values['outstanding_stock_orders']
+        return summary
+
+    def _reconcile_financial_summary(self):
+        """
+        Compara el resumen mantenido por deltas con el agregado completo y corrige las diferencias.
+        Devuelve las franquicias corregidas.
+        """
+        repaired = self.browse()
+        for franchise_id, values in self._get_financial_aggregates().items():
+            franchise = self.browse(franchise_id)
+            drift = {
+                field_name: value for field_name, value in values.items()
+                if not float_is_zero(franchise[field_name] - value, precision_digits=2)
+            }
+            if drift:
+                franchise.write(drift)
+                repaired |= franchise
+        return repaired
+
+    @api.model
+    def _cron_reconcile_financial_summary(self):
+        """Acción planificada: verificar el resumen financiero de todas las franquicias"""
+        franchises = self.with_context(active_test=False).search([])
+        repaired = franchises._reconcile_financial_summary()
+        if repaired:
+            _logger.warning("Financial summary drift repaired for franchises: %s", ', '.join(repaired.mapped('name')))
+        return True
 
@@ -1,7 +1,31 @@
-from odoo import models, fields, api
+import time
+
+from odoo import models, fields, api, Command, _
+from odoo.exceptions import UserError
 from datetime import date,datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from .kpi_engine import DELIVERED_STOCK_STATES
+
+# Secciones del dashboard ejecutivo que el cliente carga de forma independiente
+EXECUTIVE_SECTIONS = {
+    'royalties': [
+        'total_royalties_calculated', 'total_royalties_paid', 'outstanding_royalties',
+        'collection_rate', 'performance_status', 'overdue_payments_count',
+        'overdue_payments_amount', 'average_royalty_per_franchise',
+    ],
+    'stock': [
+        'stock_debt_total', 'pending_approval_orders', 'pending_delivery_orders',
+        'average_stock_debt', 'delivered_unpaid_orders_count',
+        'stock_overdue_orders_count', 'stock_overdue_orders_amount',
+    ],
+    'franchises': [
+        'active_franchises', 'contracts_expiring', 'average_contract_duration',
+        'new_franchises_month', 'new_franchises_quarter', 'new_franchises_year',
+        'closed_franchises_month', 'closed_franchises_quarter', 'closed_franchises_year',
+    ],
+}
+
 # MODELO 1: DASHBOARD FILTRABLE (SOLO CAMPOS FILTRABLES)
 class FranchiseDashboard(models.TransientModel):
     _name = 'gelroy.franchise.dashboard'
@@ -14,32 +38,36 @@ class FranchiseDashboard(models.TransientModel):
     
     # CAMPOS KPI FILTRABLES     
     # Regalías KPIs 
-    total_royalties_calculated = fields.Monetary(string='Calculated Royalties', compute='_compute_royalty_kpis', help='Total royalties calculated in the period')
-    total_royalties_paid = fields.Monetary(string='Paid Royalties', compute='_compute_royalty_kpis', help='Total royalties paid in the period')
-    total_royalties_outstanding = fields.Monetary(string='Outstanding Royalties', compute='_compute_royalty_kpis', help='Pending royalties to be paid')
-    royalty_collection_rate = fields.Float(string='Royalty Collection Rate', compute='_compute_royalty_kpis', help='Percentage of collected royalties')
-    overdue_royalty_payments_count = fields.Integer(string='Overdue Royalties Count', compute='_compute_royalty_kpis', help='Number of overdue payments')
-    overdue_royalty_payments_amount = fields.Monetary(string='Overdue Royalties Amount', compute='_compute_royalty_kpis', help='Amount of overdue royalties')
-    average_royalty_per_franchise = fields.Monetary(string='Average Royalty per Active Franchise', compute='_compute_royalty_kpis', help='Average royalty per active franchise')
+    total_royalties_calculated = fields.Monetary(string='Calculated Royalties', compute='_compute_kpis', help='Total royalties calculated in the period')
+    total_royalties_paid = fields.Monetary(string='Paid Royalties', compute='_compute_kpis', help='Total royalties paid in the period')
+    total_royalties_outstanding = fields.Monetary(string='Outstanding Royalties', compute='_compute_kpis', help='Pending royalties to be paid')
+    royalty_collection_rate = fields.Float(string='Royalty Collection Rate', compute='_compute_kpis', help='Percentage of collected royalties')
+    overdue_royalty_payments_count = fields.Integer(string='Overdue Royalties Count', compute='_compute_kpis', help='Number of overdue payments')
+    overdue_royalty_payments_amount = fields.Monetary(string='Overdue Royalties Amount', compute='_compute_kpis', help='Amount of overdue royalties')
+    average_royalty_per_franchise = fields.Monetary(string='Average Royalty per Active Franchise', compute='_compute_kpis', help='Average royalty per active franchise')
     
     # Stock KPIs 
-    total_stock_orders_value = fields.Monetary(string='Total S.O. Amount', compute='_compute_stock_kpis', help='Total value of stock orders')
-    total_stock_orders_count = fields.Integer(string='Total S.O. Count', compute='_compute_stock_kpis', help='Total number of stock orders')
-    average_order_value = fields.Monetary(string='Average S.O. Value', compute='_compute_stock_kpis', help='Average value per stock order')
-    stock_debt_total = fields.Monetary(string='Outstanding S.O. Amount', compute='_compute_stock_kpis', help='Total debt from delivered but unpaid orders')
-    stock_debt_orders_count = fields.Integer(string='Outstanding Stock Orders', compute='_compute_stock_kpis', help='Number of delivered but unpaid orders')
+    total_stock_orders_value = fields.Monetary(string='Total S.O. Amount', compute='_compute_kpis', help='Total value of stock orders')
+    total_stock_orders_count = fields.Integer(string='Total S.O. Count', compute='_compute_kpis', help='Total number of stock orders')
+    average_order_value = fields.Monetary(string='Average S.O. Value', compute='_compute_kpis', help='Average value per stock order')
+    stock_debt_total = fields.Monetary(string='Outstanding S.O. Amount', compute='_compute_kpis', help='Total debt from delivered but unpaid orders')
+    stock_debt_orders_count = fields.Integer(string='Outstanding Stock Orders', compute='_compute_kpis', help='Number of delivered but unpaid orders')
     
-    stock_overdue_orders_count = fields.Integer(string='Overdue Stock Orders Count', compute='_compute_stock_kpis', help='Number of overdue stock orders')
-    stock_overdue_orders_amount = fields.Monetary(string='Overdue Stock Orders Amount', compute='_compute_stock_kpis', help='Total amount of overdue stock orders')
+    stock_overdue_orders_count = fields.Integer(string='Overdue Stock Orders Count', compute='_compute_kpis', help='Number of overdue stock orders')
+    stock_overdue_orders_amount = fields.Monetary(string='Overdue Stock Orders Amount', compute='_compute_kpis', help='Total amount of overdue stock orders')
     
     # Stock Operations KPIs
-    pending_approval_orders = fields.Integer(string='Orders Pending Approval', compute='_compute_stock_operations_kpis', help='Orders waiting for approval')
-    pending_delivery_orders = fields.Integer(string='Orders Pending Shipment', compute='_compute_stock_operations_kpis', help='Orders approved and ready for delivery')
-    in_transit_orders = fields.Integer(string='Orders In Transit', compute='_compute_stock_operations_kpis', help='Orders currently in transit')
-    delivered_orders = fields.Integer(string='Delivered Orders', compute='_compute_stock_operations_kpis', help='Orders delivered and paid')  # ✅ NUEVO
-    average_delivery_time = fields.Float(string='Average Delivery Time from Shipped (Days)', compute='_compute_stock_operations_kpis', help='Average delivery time in days')
-    on_time_delivery_rate = fields.Float(string='On-Time Delivery Rate', compute='_compute_stock_operations_kpis', help='Percentage of on-time deliveries')
-    average_delivery_from_approval = fields.Float(string='Average Delivery Time from Approval (Days)', compute='_compute_stock_operations_kpis', help='Average time from approval to delivery')
+    pending_approval_orders = fields.Integer(string='Orders Pending Approval', compute='_compute_kpis', help='Orders waiting for approval')
+    pending_delivery_orders = fields.Integer(string='Orders Pending Shipment', compute='_compute_kpis', help='Orders approved and ready for delivery')
+    in_transit_orders = fields.Integer(string='Orders In Transit', compute='_compute_kpis', help='Orders currently in transit')
+    delivered_orders = fields.Integer(string='Delivered Orders', compute='_compute_kpis', help='Orders delivered and paid')  # ✅ NUEVO
+    average_delivery_time = fields.Float(string='Average Delivery Time from Shipped (Days)', compute='_compute_kpis', help='Average delivery time in days')
+    on_time_delivery_rate = fields.Float(string='On-Time Delivery Rate', compute='_compute_kpis', help='Percentage of on-time deliveries')
+    average_delivery_from_approval = fields.Float(string='Average Delivery Time from Approval (Days)', compute='_compute_kpis', help='Average time from approval to delivery')
+    lead_time_p50 = fields.Float(string='Lead Time P50 (Days)', compute='_compute_kpis', help='Median approval to delivery time')
+    lead_time_p90 = fields.Float(string='Lead Time P90 (Days)', compute='_compute_kpis', help='90% of orders are delivered within this many days after approval')
+    lead_time_p99 = fields.Float(string='Lead Time P99 (Days)', compute='_compute_kpis', help='99% of orders are delivered within this many days after approval')
+    lead_time_line_ids = fields.One2many('gelroy.franchise.dashboard.lead.time', 'dashboard_id', string='Lead Time by Franchise', compute='_compute_kpis')
     
     # Performance Status 
     performance_status = fields.Char(string='Collection Rate Status', compute='_compute_performance_status', help='Performance status based on collection rate')
@@ -53,172 +81,68 @@ class FranchiseDashboard(models.TransientModel):
 
     # MÉTODOS COMPUTE FILTRABLES 
     @api.depends('franchise_id', 'date_from', 'date_to')
-    def _compute_royalty_kpis(self):
-        """
-        Calcular KPIs de Regalías basados en los filtros seleccionados.
-        - Respeta filtro de franquicia específica
-        - Respeta rango de fechas seleccionado
-        - Calcula métricas de cobranza y vencimientos
-        """
-        for dashboard in self:
-            # Construir domain base para búsqueda
-            royalty_domain = [('state', '!=', 'draft')]
-            
-            # Aplicar filtros si están definidos
-            if dashboard.franchise_id:
-                royalty_domain.append(('franchise_id', '=', dashboard.franchise_id.id))
-            if dashboard.date_from:
-                royalty_domain.append(('period_start_date', '>=', dashboard.date_from))
-            if dashboard.date_to:
-                royalty_domain.append(('period_end_date', '<=', dashboard.date_to))
-            
-            # Buscar pagos de regalías
-            royalty_payments = self.env['gelroy.royalty.payment'].search(royalty_domain)
-            
-            # Calcular métricas básicas
-            dashboard.total_royalties_calculated = sum(royalty_payments.mapped('calculated_amount'))
-            dashboard.total_royalties_paid = sum(royalty_payments.mapped('paid_amount'))
-            dashboard.total_royalties_outstanding = sum(royalty_payments.mapped('outstanding_amount'))
-            
-            # Calcular tasa de cobranza
-            if dashboard.total_royalties_calculated > 0:
-                dashboard.royalty_collection_rate = dashboard.total_royalties_paid / dashboard.total_royalties_calculated
-            else:
-                dashboard.royalty_collection_rate = 1.0
-            
-            # Calcular vencidos
-            overdue_payments = royalty_payments.filtered(lambda p: p.state == 'overdue')
-            dashboard.overdue_royalty_payments_count = len(overdue_payments)
-            dashboard.overdue_royalty_payments_amount = sum(overdue_payments.mapped('outstanding_amount'))
-            
-            # Promedio por franquicia activa
-            active_franchises_count = len(self.env['gelroy.franchise'].search([('active', '=', True)])) or 1
-            dashboard.average_royalty_per_franchise = dashboard.total_royalties_calculated / active_franchises_count
-
-    @api.depends('franchise_id', 'date_from', 'date_to')
-    def _compute_stock_kpis(self):
+    def _compute_kpis(self):
         """
-        Calcular KPIs de Stock basados en los filtros seleccionados.
+        Calcular todos los KPIs filtrables (regalías, stock y operaciones).
+        - Las sumas y conteos se agregan en la base de datos (gelroy.kpi.engine)
+        - El número de consultas no depende de la cantidad de pagos o pedidos
+        - Respeta filtro de franquicia y rango de fechas seleccionado
         """
+        engine = self.env['gelroy.kpi.engine']
+        # Promedio por franquicia activa (común a todos los dashboards)
+        active_franchises_count = self.env['gelroy.franchise'].search_count([('active', '=', True)]) or 1
         for dashboard in self:
-            # Construir domain para pedidos de stock
-            stock_domain = [('state', '!=', 'draft')]
-            if dashboard.franchise_id:
-                stock_domain.append(('franchise_id', '=', dashboard.franchise_id.id))
-            if dashboard.date_from:
-                stock_domain.append(('order_date', '>=', dashboard.date_from))
-            if dashboard.date_to:
-                stock_domain.append(('order_date', '<=', dashboard.date_to))
-
-            # Buscar pedidos de stock
-            stock_orders = self.env['gelroy.stock.order'].search(stock_domain)
-            
-            # Métricas básicas
-            dashboard.total_stock_orders_value = sum(stock_orders.mapped('total_amount'))
-            dashboard.total_stock_orders_count = len(stock_orders)
-            dashboard.average_order_value = (dashboard.total_stock_orders_value / dashboard.total_stock_orders_count 
-                                           if dashboard.total_stock_orders_count > 0 else 0.0)
-            
-            # Deuda de stock (entregados sin pagar)
-            delivered_unpaid = stock_orders.filtered(lambda o: o.state == 'delivered')
-            dashboard.stock_debt_total = sum(delivered_unpaid.mapped('total_amount'))
-            dashboard.stock_debt_orders_count = len(delivered_unpaid)
-
-            # Stock Orders Overdue
-            overdue_orders = stock_orders.filtered(lambda o: o.state == 'overdue')
-            dashboard.stock_overdue_orders_count = len(overdue_orders)
-            dashboard.stock_overdue_orders_amount = sum(overdue_orders.mapped('outstanding_amount'))
-    
-    @api.depends('franchise_id', 'date_from', 'date_to')
-    def _compute_stock_operations_kpis(self):
-        """Calcular KPIs Operacionales de Stock."""
-        for dashboard in self:
-            # Construir domain para pedidos de stock
-            stock_domain = [('state', '!=', 'draft')]
-            if dashboard.franchise_id:
-                stock_domain.append(('franchise_id', '=', dashboard.franchise_id.id))
-            if dashboard.date_from:
-                stock_domain.append(('order_date', '>=', dashboard.date_from))
-            if dashboard.date_to:
-                stock_domain.append(('order_date', '<=', dashboard.date_to))
+            kpis = engine._get_cached_kpis(
+                'franchise_dashboard',
+                lambda: engine._get_dashboard_kpis(
+                    franchise_ids=dashboard.franchise_id.ids,
+                    date_from=dashboard.date_from,
+                    date_to=dashboard.date_to,
+                ),
+                franchise_id=dashboard.franchise_id.id,
+                date_from=dashboard.date_from,
+                date_to=dashboard.date_to,
+            )
+            royalty, stock, delivery = kpis['royalty'], kpis['stock'], kpis['delivery']
+            empty_state = {'count': 0, 'amount': 0.0, 'outstanding': 0.0}
+            stock_states = stock['states']
+            delivered = stock_states.get('delivered', empty_state)
+            overdue = stock_states.get('overdue', empty_state)
 
-            # Buscar pedidos de stock
-            stock_orders = self.env['gelroy.stock.order'].search(stock_domain)
-            
-            # Métricas operacionales básicas
-            dashboard.pending_approval_orders = len(stock_orders.filtered(lambda o: o.state == 'submitted'))
-            dashboard.pending_delivery_orders = len(stock_orders.filtered(lambda o: o.state == 'approved'))  
-            dashboard.in_transit_orders = len(stock_orders.filtered(lambda o: o.state == 'in_transit'))
-            dashboard.delivered_orders = len(stock_orders.filtered(lambda o: o.state in ['delivered', 'paid', 'overdue']))
-            
-            # CALCULAR TIEMPOS DE ENTREGA
-            delivered_orders = stock_orders.filtered(lambda o: o.state in ['delivered', 'paid', 'overdue'])
-            
-            if delivered_orders:
-                # Tiempo desde shipped → delivered
-                shipping_times = []
-                for order in delivered_orders:
-                    if order.delivered_date and order.shipped_date:
-                        if hasattr(order.delivered_date, 'date'):
-                            delivered_date = order.delivered_date.date()
-                        else:
-                            delivered_date = order.delivered_date
-                        
-                        if hasattr(order.shipped_date, 'date'):
-                            shipped_date = order.shipped_date.date()
-                        else:
-                            shipped_date = order.shipped_date
-                        
-                        shipping_time_days = (delivered_date - shipped_date).days
-                        if shipping_time_days >= 0:
-                            shipping_times.append(shipping_time_days)
-                
-                dashboard.average_delivery_time = sum(shipping_times) / len(shipping_times) if shipping_times else 0.0
-                
-                # Tiempo desde approval → delivered  
-                approval_times = []
-                for order in delivered_orders:
-                    if order.delivered_date and order.approved_date:
-                        if hasattr(order.delivered_date, 'date'):
-                            delivered_date = order.delivered_date.date()
-                        else:
-                            delivered_date = order.delivered_date
-                        
-                        if hasattr(order.approved_date, 'date'):
-                            approved_date = order.approved_date.date()
-                        else:
-                            approved_date = order.approved_date
-                        
-                        approval_time_days = (delivered_date - approved_date).days
-                        if approval_time_days >= 0:
-                            approval_times.append(approval_time_days)
-                
-                dashboard.average_delivery_from_approval = sum(approval_times) / len(approval_times) if approval_times else 0.0
-                
-                # On-time delivery rate
-                on_time_orders = 0
-                total_orders_with_dates = 0
-                
-                for order in delivered_orders:
-                    if order.delivered_date and order.requested_delivery_date:
-                        if hasattr(order.delivered_date, 'date'):
-                            delivered_date = order.delivered_date.date()
-                        else:
-                            delivered_date = order.delivered_date
-                        
-                        requested_date = order.requested_delivery_date
-                        
-                        total_orders_with_dates += 1
-                        if delivered_date <= requested_date:
-                            on_time_orders += 1
-                
-                dashboard.on_time_delivery_rate = (on_time_orders / total_orders_with_dates) if total_orders_with_dates > 0 else 0.0
-                
-            else:
-                # No hay órdenes entregadas
-                dashboard.average_delivery_time = 0.0
-                dashboard.average_delivery_from_approval = 0.0
-                dashboard.on_time_delivery_rate = 0.0
+            dashboard.update({
+                # Regalías
+                'total_royalties_calculated': royalty['calculated'],
+                'total_royalties_paid': royalty['paid'],
+                'total_royalties_outstanding': royalty['outstanding'],
+                'royalty_collection_rate': (royalty['paid'] / royalty['calculated']
+                                            if royalty['calculated'] > 0 else 1.0),
+                'overdue_royalty_payments_count': royalty['overdue_count'],
+                'overdue_royalty_payments_amount': royalty['overdue_amount'],
+                'average_royalty_per_franchise': royalty['calculated'] / active_franchises_count,
+                # Stock
+                'total_stock_orders_value': stock['amount'],
+                'total_stock_orders_count': stock['count'],
+                'average_order_value': stock['amount'] / stock['count'] if stock['count'] else 0.0,
+                'stock_debt_total': delivered['amount'],
+                'stock_debt_orders_count': delivered['count'],
+                'stock_overdue_orders_count': overdue['count'],
+                'stock_overdue_orders_amount': overdue['outstanding'],
+                # Operaciones
+                'pending_approval_orders': stock_states.get('submitted', empty_state)['count'],
+                'pending_delivery_orders': stock_states.get('approved', empty_state)['count'],
+                'in_transit_orders': stock_states.get('in_transit', empty_state)['count'],
+                'delivered_orders': sum(stock_states.get(state, empty_state)['count']
+                                        for state in DELIVERED_STOCK_STATES),
+                'average_delivery_time': delivery['average_delivery_time'],
+                'average_delivery_from_approval': delivery['average_delivery_from_approval'],
+                'on_time_delivery_rate': delivery['on_time_delivery_rate'],
+                'lead_time_p50': delivery['lead_time_p50'],
+                'lead_time_p90': delivery['lead_time_p90'],
+                'lead_time_p99': delivery['lead_time_p99'],
+                'lead_time_line_ids': [Command.clear()] + [
+                    Command.create(line) for line in delivery['by_franchise']
+                ],
+            })
             
     @api.depends('royalty_collection_rate')
     def _compute_performance_status(self):
@@ -246,6 +170,45 @@ class FranchiseDashboard(models.TransientModel):
             dashboard.total_overdue_amount = dashboard.overdue_royalty_payments_amount + dashboard.stock_overdue_orders_amount
 
 
+    @api.model
+    def get_kpi_series(self, kpis=None, interval='month', franchise_id=False, date_from=None, date_to=None):
+        """
+        Series temporales de KPIs para gráficos de tendencia (día, semana o mes).
+        Una sola llamada devuelve todos los intervalos, sin calcular el dashboard por intervalo.
+        Ver gelroy.kpi.engine._get_kpi_series para el formato del resultado.
+        """
+        engine = self.env['gelroy.kpi.engine']
+        kpis = list(kpis or ())
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        return engine._get_cached_kpis(
+            f"kpi_series_{interval}_{','.join(kpis)}",
+            lambda: engine._get_kpi_series(
+                kpis, interval, [franchise_id] if franchise_id else None, date_from, date_to,
+            ),
+            franchise_id=franchise_id,
+            date_from=date_from,
+            date_to=date_to,
+        )
+
+
+# DESGLOSE DE TIEMPOS DE ENTREGA POR FRANQUICIA (líneas del dashboard filtrable)
+class FranchiseDashboardLeadTime(models.TransientModel):
+    _name = 'gelroy.franchise.dashboard.lead.time'
+    _description = 'Franchise Dashboard Lead Time Breakdown'
+    _order = 'lead_time_p90 desc'
+
+    dashboard_id = fields.Many2one('gelroy.franchise.dashboard', string='Dashboard', ondelete='cascade')
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', readonly=True)
+    delivered_count = fields.Integer(string='Delivered Orders', readonly=True)
+    average_delivery_time = fields.Float(string='Avg from Shipped (Days)', readonly=True)
+    average_delivery_from_approval = fields.Float(string='Avg from Approval (Days)', readonly=True)
+    on_time_delivery_rate = fields.Float(string='On-Time Rate', readonly=True)
+    lead_time_p50 = fields.Float(string='P50 (Days)', readonly=True)
+    lead_time_p90 = fields.Float(string='P90 (Days)', readonly=True)
+    lead_time_p99 = fields.Float(string='P99 (Days)', readonly=True)
+
+
 # MODELO 2: EXECUTIVE DASHBOARD - MISMA LÓGICA QUE EL FILTRABLE
 class ExecutiveDashboard(models.TransientModel):
     _name = 'gelroy.executive.dashboard'
@@ -306,46 +269,34 @@ class ExecutiveDashboard(models.TransientModel):
             - Calcula el total de regalías calculadas, pagadas y pendientes.
             - Calcula el collection rate considerando únicamente los pagos del último mes.
             - Determina la cantidad y monto de pagos vencidos.
-            - Calcula el promedio de regalías por franquicia activa."""
+            - Calcula el promedio de regalías por franquicia activa.
+            Los valores salen de los snapshots diarios (gelroy.kpi.snapshot)."""
+        engine = self.env['gelroy.kpi.engine']
+        royalty = engine._get_snapshot_kpis()['royalty']
+
+        # COLLECTION RATE - SOLO ÚLTIMO MES (por fin de período)
+        today = fields.Date.today()
+        month_ago = today - timedelta(days=30)
+        monthly_states = engine._get_snapshot_groups([
+            ('document_type', '=', 'royalty'),
+            ('state', '!=', 'draft'),
+            ('period_end_date', '>=', month_ago),
+            ('period_end_date', '<=', today),
+        ])['royalty']
+        monthly_calculated = sum(values['amount'] for values in monthly_states.values())
+        monthly_paid = sum(values['paid'] for values in monthly_states.values())
+
+        active_franchises_count = self.env['gelroy.franchise'].search_count([('active', '=', True)]) or 1
         for dashboard in self:
-            # buscar TODOS los pagos HISTÓRICOS (para la mayoría de campos)
-            royalty_domain = [('state', '!=', 'draft')]
-            royalty_payments = self.env['gelroy.royalty.payment'].search(royalty_domain)
-            
             # CAMPOS GLOBALES/HISTÓRICOS 
-            dashboard.total_royalties_calculated = sum(royalty_payments.mapped('calculated_amount'))
-            dashboard.total_royalties_paid = sum(royalty_payments.mapped('paid_amount'))
-            dashboard.outstanding_royalties = sum(royalty_payments.mapped('outstanding_amount'))
-            
-            # COLLECTION RATE - SOLO ÚLTIMO MES
-            today = fields.Date.today()
-            month_ago = today - timedelta(days=30)
-            
-            # Buscar pagos SOLO del último mes para collection rate
-            monthly_domain = [
-                ('state', '!=', 'draft'),
-                ('period_end_date', '>=', month_ago),
-                ('period_end_date', '<=', today),
-            ]
-            monthly_payments = self.env['gelroy.royalty.payment'].search(monthly_domain)
-            
-            # Collection rate SOLO del último mes
-            monthly_calculated = sum(monthly_payments.mapped('calculated_amount'))
-            monthly_paid = sum(monthly_payments.mapped('paid_amount'))
-            
-            if monthly_calculated > 0:
-                dashboard.collection_rate = monthly_paid / monthly_calculated
-            else:
-                dashboard.collection_rate = 0.0
-            
-            # CAMPOS GLOBALES/HISTÓRICOS 
-            overdue_payments = royalty_payments.filtered(lambda p: p.state == 'overdue')
-            dashboard.overdue_payments_count = len(overdue_payments)
-            dashboard.overdue_payments_amount = sum(overdue_payments.mapped('outstanding_amount'))
-            
+            dashboard.total_royalties_calculated = royalty['calculated']
+            dashboard.total_royalties_paid = royalty['paid']
+            dashboard.outstanding_royalties = royalty['outstanding']
+            dashboard.collection_rate = monthly_paid / monthly_calculated if monthly_calculated > 0 else 0.0
+            dashboard.overdue_payments_count = royalty['overdue_count']
+            dashboard.overdue_payments_amount = royalty['overdue_amount']
             # Promedio por franquicia activa (global/histórico)
-            active_franchises_count = len(self.env['gelroy.franchise'].search([('active', '=', True)])) or 1
-            dashboard.average_royalty_per_franchise = dashboard.total_royalties_calculated / active_franchises_count
+            dashboard.average_royalty_per_franchise = royalty['calculated'] / active_franchises_count
 
     def _compute_global_stock_kpis(self):
         """
@@ -355,23 +306,23 @@ class ExecutiveDashboard(models.TransientModel):
         - Cuenta los pedidos pendientes de aprobación y de entrega.
         - Calcula el promedio del valor de los pedidos de stock.
         - Cuenta la cantidad de pedidos entregados y no pagados.
-        - OVERDUE: Tiempo promedio global de entrega (order_date → delivered_date)
+        - OVERDUE: cantidad y monto pendiente de pedidos vencidos
+        Los valores salen de los snapshots diarios (gelroy.kpi.snapshot).
         """
+        stock = self.env['gelroy.kpi.engine']._get_snapshot_kpis()['stock']
+        empty_state = {'count': 0, 'amount': 0.0, 'outstanding': 0.0}
+        delivered = stock['states'].get('delivered', empty_state)
+        overdue = stock['states'].get('overdue', empty_state)
         for dashboard in self:
-            stock_domain = [('state', '!=', 'draft')]
-            stock_orders = self.env['gelroy.stock.order'].search(stock_domain)
-            
-            delivered_unpaid = stock_orders.filtered(lambda o: o.state == 'delivered')
-            dashboard.stock_debt_total = sum(delivered_unpaid.mapped('total_amount'))
-            dashboard.pending_approval_orders = len(stock_orders.filtered(lambda o: o.state == 'submitted'))
-            dashboard.pending_delivery_orders = len(stock_orders.filtered(lambda o: o.state == 'approved'))
-            dashboard.average_stock_debt = sum(stock_orders.mapped('total_amount')) / len(stock_orders) if stock_orders else 0.0
-            dashboard.delivered_unpaid_orders_count = len(delivered_unpaid)
+            dashboard.stock_debt_total = delivered['amount']
+            dashboard.pending_approval_orders = stock['states'].get('submitted', empty_state)['count']
+            dashboard.pending_delivery_orders = stock['states'].get('approved', empty_state)['count']
+            dashboard.average_stock_debt = stock['amount'] / stock['count'] if stock['count'] else 0.0
+            dashboard.delivered_unpaid_orders_count = delivered['count']
 
             # Stock Orders Overdue globales
-            overdue_orders = stock_orders.filtered(lambda o: o.state == 'overdue')
-            dashboard.stock_overdue_orders_count = len(overdue_orders)
-            dashboard.stock_overdue_orders_amount = sum(overdue_orders.mapped('outstanding_amount'))
+            dashboard.stock_overdue_orders_count = overdue['count']
+            dashboard.stock_overdue_orders_amount = overdue['outstanding']
             
     def _compute_global_franchise_kpis(self):
         """Calcula los KPIs globales para el dashboard de franquicias.
@@ -380,51 +331,26 @@ class ExecutiveDashboard(models.TransientModel):
             - Determina la cantidad de nuevas franquicias creadas en el último mes, trimestre y año.
             - Calcula la cantidad de franquicias cerradas en el último mes, trimestre y año.
             - Calcula la duración promedio de los contratos activos en meses.
+            Todo sale de una única consulta (gelroy.kpi.engine._get_franchise_lifecycle_kpis).
         """
+        lifecycle = self.env['gelroy.kpi.engine']._get_franchise_lifecycle_kpis()
         for dashboard in self:
-            all_franchises = self.env['gelroy.franchise'].search([])
-            active_franchises = all_franchises.filtered(lambda f: f.active)
-            dashboard.active_franchises = len(active_franchises)
+            dashboard.active_franchises = lifecycle['active']
+            dashboard.contracts_expiring = lifecycle['expiring']
 
-            # Contratos por vencer
-            today = fields.Date.today()
-            expiring_contracts = self.env['gelroy.franchise'].search([
-                ('contract_end_date', '>=', today),
-                ('contract_end_date', '<=', today + timedelta(days=90))
-            ])
-            dashboard.contracts_expiring = len(expiring_contracts)
-            
-            # Nuevas franquicias por período
-            dashboard.new_franchises_month = self.env['gelroy.franchise'].search_count([('create_date', '>=', today - timedelta(days=30))])
-            dashboard.new_franchises_quarter = self.env['gelroy.franchise'].search_count([('create_date', '>=', today - timedelta(days=90))])
-            dashboard.new_franchises_year = self.env['gelroy.franchise'].search_count([('create_date', '>=', today - timedelta(days=365))])
+            # Nuevas franquicias y franquicias cerradas por período
+            dashboard.new_franchises_month = lifecycle['new']['month']
+            dashboard.new_franchises_quarter = lifecycle['new']['quarter']
+            dashboard.new_franchises_year = lifecycle['new']['year']
+            dashboard.closed_franchises_month = lifecycle['closed']['month']
+            dashboard.closed_franchises_quarter = lifecycle['closed']['quarter']
+            dashboard.closed_franchises_year = lifecycle['closed']['year']
 
-            # LÓGICA PARA FRANQUICIAS CERRADAS
-            month_ago = today - timedelta(days=30)
-            quarter_ago = today - timedelta(days=90)
-            year_ago = today - timedelta(days=365)
-            
-            dashboard.closed_franchises_month = self.env['gelroy.franchise'].search_count([
-                ('active', '=', False),
-                ('write_date', '>=', fields.Datetime.to_datetime(month_ago))
-            ])
-            dashboard.closed_franchises_quarter = self.env['gelroy.franchise'].search_count([
-                ('active', '=', False),
-                ('write_date', '>=', fields.Datetime.to_datetime(quarter_ago))
-            ])
-            dashboard.closed_franchises_year = self.env['gelroy.franchise'].search_count([
-                ('active', '=', False),
-                ('write_date', '>=', fields.Datetime.to_datetime(year_ago))
-            ])
-            
-            #DURACIÓN PROMEDIO DE CONTRATOS
-            contracts_with_dates = active_franchises.filtered(lambda f: f.contract_start_date and f.contract_end_date)
-            if contracts_with_dates:
-                total_duration_days = sum([(f.contract_end_date - f.contract_start_date).days for f in contracts_with_dates])
-                average_duration_days = total_duration_days / len(contracts_with_dates)
-                dashboard.average_contract_duration = average_duration_days / 30.44 
+            # DURACIÓN PROMEDIO DE CONTRATOS
+            if lifecycle['average_contract_days'] is not None:
+                dashboard.average_contract_duration = lifecycle['average_contract_days'] / 30.44
             else:
-                dashboard.average_contract_duration = 1.0  
+                dashboard.average_contract_duration = 1.0
 
     @api.depends('collection_rate')
     def _compute_global_performance(self):
@@ -446,25 +372,34 @@ class ExecutiveDashboard(models.TransientModel):
                 dashboard.performance_status = '⚫ Critical'
 
     @api.model
-    def default_get(self, fields_list):
-        """Forzar cálculo al crear el registro"""
-        res = super().default_get(fields_list)
-        # Crear instancia temporal para calcular
-        temp_record = self.new(res)
-        
-        # LLAMAR A LOS MÉTODOS 
-        temp_record._compute_global_royalty_kpis()
-        temp_record._compute_global_stock_kpis()
-        temp_record._compute_global_franchise_kpis()
-        temp_record._compute_global_performance()
-        temp_record._compute_total_overdue()
-        
-        # Copiar valores calculados - USAR TRY/EXCEPT EN LUGAR DE HASATTR
-        for field in fields_list:
-            try:
-                if field in temp_record._fields:  # Verificar que el campo existe
-                    res[field] = temp_record[field]
-            except (AttributeError, KeyError, RecursionError):
-                # Si hay error, simplemente saltear el campo
-                pass
-        return res
\ No newline at end of file
+    def get_section_data(self, section):
+        """
+        Devuelve los KPIs de una sección del dashboard ejecutivo.
+        El cliente pide cada sección por separado y en paralelo, así la sección
+        más lenta no bloquea a las demás. Incluye el tiempo de servidor en ms.
+        """
+        if section not in EXECUTIVE_SECTIONS:
+            raise UserError(_("Unknown dashboard section: %s") % section)
+        start = time.perf_counter()
+        values = self.env['gelroy.kpi.engine']._get_cached_kpis(
+            f'executive_{section}', lambda: self._compute_section_values(section),
+        )
+        return {
+            'section': section,
+            'values': values,
+            'currency_id': self.env.company.currency_id.id,
+            'server_time_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    @api.model
+    def get_kpi_series(self, kpis=None, interval='month', date_from=None, date_to=None):
+        """Series temporales globales de la red (mismo formato que el dashboard filtrable)"""
+        return self.env['gelroy.franchise.dashboard'].get_kpi_series(
+            kpis, interval, date_from=date_from, date_to=date_to,
+        )
+
+    @api.model
+    def _compute_section_values(self, section):
+        """Calcula solo los campos de la sección indicada sobre un registro temporal"""
+        dashboard = self.new({})
+        return {field_name: dashboard[field_name] for field_name in EXECUTIVE_SECTIONS[section]}
@@ -0,0 +1,179 @@
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError
+
+from .debt_ledger import DEBT_STOCK_STATES
+from .kpi_engine import DELIVERED_STOCK_STATES
+
+# Estados de pedidos que cuentan como volumen (pedidos efectivamente cursados)
+ORDERED_STOCK_STATES = ('submitted', 'approved', 'in_transit', 'delivered', 'overdue', 'paid')
+# Columnas por las que se puede ordenar el ranking filtrado por período
+LEADERBOARD_ORDER_COLUMNS = (
+    'collection_rank', 'debt_rank', 'volume_rank', 'delivery_rank', 'on_time_rank',
+    'collection_rate', 'outstanding_debt', 'order_count', 'order_amount',
+    'average_delivery_time', 'on_time_delivery_rate', 'franchise_name',
+)
+
+
+class FranchiseLeaderboard(models.Model):
+    _name = 'gelroy.franchise.leaderboard'
+    _description = 'Franchise Leaderboard'
+    _auto = False
+    _order = 'collection_rank, franchise_id'
+    _rec_name = 'franchise_id'
+
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', readonly=True)
+    franchise_code = fields.Char(string='Code', readonly=True)
+    currency_id = fields.Many2one('res.currency', related='franchise_id.currency_id', readonly=True)
+
+    # Regalías
+    royalties_calculated = fields.Monetary(string='Royalties Calculated', readonly=True)
+    royalties_paid = fields.Monetary(string='Royalties Paid', readonly=True)
+    collection_rate = fields.Float(string='Collection Rate', readonly=True)
+
+    # Deuda pendiente (regalías + pedidos entregados sin pagar)
+    outstanding_debt = fields.Monetary(string='Outstanding Debt', readonly=True)
+
+    # Volumen de pedidos
+    order_count = fields.Integer(string='Orders', readonly=True)
+    order_amount = fields.Monetary(string='Order Volume', readonly=True)
+
+    # Entregas
+    average_delivery_time = fields.Float(string='Avg Delivery Time (Days)', digits=(12, 1), readonly=True)
+    on_time_delivery_rate = fields.Float(string='On-Time Rate', readonly=True)
+
+    # Posiciones en el ranking (1 = mejor)
+    collection_rank = fields.Integer(string='Collection Rank', readonly=True)
+    debt_rank = fields.Integer(string='Debt Rank', readonly=True, help='1 = lowest outstanding debt')
+    volume_rank = fields.Integer(string='Volume Rank', readonly=True)
+    delivery_rank = fields.Integer(string='Delivery Rank', readonly=True, help='1 = fastest average delivery')
+    on_time_rank = fields.Integer(string='On-Time Rank', readonly=True)
+
+    @api.model
+    def _leaderboard_query(self, royalty_where='TRUE', stock_where='TRUE'):
+        """
+        Consulta del ranking: agrega pagos y pedidos por franquicia en una pasada por tabla
+        y calcula las posiciones con funciones de ventana (RANK() OVER).
+        Las franquicias sin datos en un criterio quedan al final de ese ranking.
+        """
+        return f"""
+            WITH royalty AS (
+                SELECT rp.franchise_id,
+                       SUM(COALESCE(rp.calculated_amount, 0)) AS calculated,
+                       SUM(COALESCE(rp.paid_amount, 0)) AS paid,
+                       SUM(COALESCE(rp.outstanding_amount, 0)) AS outstanding
+                  FROM gelroy_royalty_payment rp
+                 WHERE rp.state NOT IN ('draft', 'cancelled')
+                   AND {royalty_where}
+              GROUP BY rp.franchise_id
+            ), stock AS (
+                SELECT so.franchise_id,
+                       COUNT(*) FILTER (WHERE so.state IN %(ordered_states)s) AS order_count,
+                       COALESCE(SUM(so.total_amount) FILTER (WHERE so.state IN %(ordered_states)s), 0) AS order_amount,
+                       COALESCE(SUM(so.outstanding_amount) FILTER (WHERE so.state IN %(debt_states)s), 0) AS outstanding,
+                       AVG(so.delivered_date - so.shipped_date)
+                           FILTER (WHERE so.state IN %(delivered_states)s
+                                     AND so.delivered_date >= so.shipped_date) AS avg_delivery,
+                       COUNT(*) FILTER (WHERE so.state IN %(delivered_states)s
+                                          AND so.delivered_date IS NOT NULL
+                                          AND so.requested_delivery_date IS NOT NULL) AS dated_count,
+                       COUNT(*) FILTER (WHERE so.state IN %(delivered_states)s
+                                          AND so.delivered_date <= so.requested_delivery_date) AS on_time_count
+                  FROM gelroy_stock_order so
+                 WHERE {stock_where}
+              GROUP BY so.franchise_id
+            ), metrics AS (
+                SELECT f.id AS franchise_id,
+                       f.name AS franchise_name,
+                       f.franchise_code,
+                       COALESCE(r.calculated, 0) AS royalties_calculated,
+                       COALESCE(r.paid, 0) AS royalties_paid,
+                       CASE WHEN r.calculated > 0 THEN r.paid / r.calculated END AS collection_rate,
+                       COALESCE(r.outstanding, 0) + COALESCE(s.outstanding, 0) AS outstanding_debt,
+                       COALESCE(s.order_count, 0) AS order_count,
+                       COALESCE(s.order_amount, 0) AS order_amount,
+                       s.avg_delivery AS average_delivery_time,
+                       CASE WHEN s.dated_count > 0 THEN s.on_time_count::float / s.dated_count END
+                           AS on_time_delivery_rate
+                  FROM gelroy_franchise f
+             LEFT JOIN royalty r ON r.franchise_id = f.id
+             LEFT JOIN stock s ON s.franchise_id = f.id
+                 WHERE f.active
+            )
+            SELECT m.franchise_id AS id,
+                   m.franchise_id,
+                   m.franchise_name,
+                   m.franchise_code,
+                   m.royalties_calculated,
+                   m.royalties_paid,
+                   COALESCE(m.collection_rate, 0) AS collection_rate,
+                   m.outstanding_debt,
+                   m.order_count,
+                   m.order_amount,
+                   COALESCE(m.average_delivery_time, 0) AS average_delivery_time,
+                   COALESCE(m.on_time_delivery_rate, 0) AS on_time_delivery_rate,
+                   RANK() OVER (ORDER BY m.collection_rate DESC NULLS LAST) AS collection_rank,
+                   RANK() OVER (ORDER BY m.outstanding_debt ASC) AS debt_rank,
+                   RANK() OVER (ORDER BY m.order_amount DESC) AS volume_rank,
+                   RANK() OVER (ORDER BY m.average_delivery_time ASC NULLS LAST) AS delivery_rank,
+                   RANK() OVER (ORDER BY m.on_time_delivery_rate DESC NULLS LAST) AS on_time_rank
+              FROM metrics m
+        """
+
+    @api.model
+    def _leaderboard_params(self):
+        return {
+            'ordered_states': ORDERED_STOCK_STATES,
+            'debt_states': DEBT_STOCK_STATES,
+            'delivered_states': DELIVERED_STOCK_STATES,
+        }
+
+    def init(self):
+        """Vista SQL con el ranking histórico completo (ordenable y paginable desde la lista)"""
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        query = self.env.cr.mogrify(self._leaderboard_query(), self._leaderboard_params()).decode()
+        self.env.cr.execute(f"CREATE OR REPLACE VIEW {self._table} AS ({query})")
+
+    @api.model
+    def get_leaderboard(self, date_from=None, date_to=None, order='collection_rank', limit=80, offset=0):
+        """
+        Ranking restringido a un período, ordenado y paginado en el servidor.
+        Los pagos se filtran por período de regalías y los pedidos por fecha de pedido.
+        Devuelve {'records': [dict por franquicia], 'total': cantidad de franquicias}.
+        """
+        self.check_access_rights('read')
+        column, _sep, direction = (order or 'collection_rank').partition(' ')
+        direction = direction.strip().upper() or 'ASC'
+        if column not in LEADERBOARD_ORDER_COLUMNS or direction not in ('ASC', 'DESC'):
+            raise UserError(_("Invalid leaderboard order: %s") % order)
+
+        self.env['gelroy.royalty.payment'].flush_model()
+        self.env['gelroy.stock.order'].flush_model()
+        self.env['gelroy.franchise'].flush_model(['name', 'franchise_code', 'active'])
+
+        params = self._leaderboard_params()
+        royalty_where, stock_where = ['TRUE'], ['TRUE']
+        if date_from:
+            params['date_from'] = date_from
+            royalty_where.append('rp.period_start_date >= %(date_from)s')
+            stock_where.append('so.order_date >= %(date_from)s')
+        if date_to:
+            params['date_to'] = date_to
+            royalty_where.append('rp.period_end_date <= %(date_to)s')
+            stock_where.append('so.order_date <= %(date_to)s')
+        params.update(limit=limit, offset=offset)
+
+        query = self._leaderboard_query(' AND '.join(royalty_where), ' AND '.join(stock_where))
+        self.env.cr.execute(f"""
+            SELECT board.*, COUNT(*) OVER () AS total
+              FROM ({query}) board
+          ORDER BY board.{column} {direction}, board.franchise_id
+             LIMIT %(limit)s OFFSET %(offset)s
+        """, params)
+        records = self.env.cr.dictfetchall()
+        total = records[0]['total'] if records else 0
+        for record in records:
+            del record['id'], record['total']
+            for key in ('collection_rate', 'average_delivery_time', 'on_time_delivery_rate',
+                        'royalties_calculated', 'royalties_paid', 'outstanding_debt', 'order_amount'):
+                record[key] = float(record[key])
+        return {'records': records, 'total': total}
@@ -0,0 +1,75 @@
+from odoo import models, fields, api
+
+
+class FranchiseSequence(models.Model):
+    _name = 'gelroy.franchise.sequence'
+    _description = 'Franchise Document Numbering'
+    _order = 'franchise_id, code'
+    _rec_name = 'code'
+
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', required=True,
+                                   index=True, readonly=True, ondelete='cascade')
+    code = fields.Char(string='Sequence Code', required=True, readonly=True,
+                       help='Document type and period, e.g. stock_order or production_planning:2025-06')
+    number_next = fields.Integer(string='Next Number', required=True, default=1, readonly=True)
+
+    _sql_constraints = [
+        ('franchise_code_unique', 'unique(franchise_id, code)',
+         'There can only be one sequence per franchise and code.'),
+    ]
+
+    @api.model
+    def _allocate(self, franchise_id, code, count=1, seed=None):
+        """
+        Reserva 'count' números consecutivos de la secuencia (franquicia, código) y los devuelve.
+        - Un UPDATE ... RETURNING sobre una fila: O(1) sin importar cuántos documentos haya
+        - El bloqueo de la fila serializa a los creadores concurrentes: nunca se entrega un
+          número dos veces y nunca se reutiliza (la secuencia solo avanza)
+        - La primera vez se crea la fila con INSERT ... ON CONFLICT, partiendo del último
+          número ya usado que devuelva seed() (para continuar la numeración existente)
+        """
+        cr = self.env.cr
+        params = {
+            'franchise_id': franchise_id,
+            'code': code,
+            'count': count,
+            'uid': self.env.uid,
+        }
+        cr.execute("""
+            UPDATE gelroy_franchise_sequence
+               SET number_next = number_next + %(count)s,
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE franchise_id = %(franchise_id)s
+               AND code = %(code)s
+         RETURNING number_next - %(count)s
+        """, params)
+        row = cr.fetchone()
+        if row is None:
+            params['seed'] = seed() if seed else 0
+            cr.execute("""
+                INSERT INTO gelroy_franchise_sequence (
+                    franchise_id, code, number_next, create_uid, write_uid, create_date, write_date
+                )
+                VALUES (%(franchise_id)s, %(code)s, %(seed)s + 1 + %(count)s, %(uid)s, %(uid)s,
+                        NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+                ON CONFLICT (franchise_id, code) DO UPDATE
+                   SET number_next = gelroy_franchise_sequence.number_next + %(count)s,
+                       write_uid = %(uid)s,
+                       write_date = NOW() AT TIME ZONE 'UTC'
+             RETURNING number_next - %(count)s
+            """, params)
+            row = cr.fetchone()
+        self.invalidate_model(['number_next'])
+        return list(range(row[0], row[0] + count))
+
+    @api.model
+    def _get_last_number(self, table, franchise_id, extra_where='TRUE', extra_params=()):
+        """Mayor sufijo numérico de los nombres existentes (semilla para continuar la numeración)"""
+        self.env.cr.execute(f"""
+            SELECT COALESCE(MAX(substring(name FROM '-([0-9]+)$')::integer), 0)
+              FROM {table}
+             WHERE franchise_id = %s
+               AND {extra_where}
+        """, [franchise_id, *extra_params])
+        return self.env.cr.fetchone()[0]
@@ -1,6 +1,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+from .royalty_payment import KPI_SCOPE_FIELDS as ROYALTY_KPI_SCOPE_FIELDS
+from .stock_order import KPI_SCOPE_FIELDS as STOCK_KPI_SCOPE_FIELDS
+
 class AccountMove(models.Model):
     _inherit = 'account.move'
     
@@ -22,75 +25,125 @@ class AccountMove(models.Model):
         help="Royalty payment that generated this invoice"
     )
 
+    # Pedidos cubiertos por la factura (uno, o varios en la facturación consolidada)
+    stock_order_ids = fields.Many2many(
+        'gelroy.stock.order',
+        'gelroy_stock_order_invoice_rel',
+        'move_id',
+        'order_id',
+        string='Covered Stock Orders',
+        readonly=True,
+        copy=False,
+        help="Stock orders invoiced by this invoice"
+    )
+
+    invoice_batch_id = fields.Many2one(
+        'gelroy.invoice.batch',
+        string='Invoice Batch',
+        index='btree_not_null',
+        readonly=True,
+        copy=False,
+        help="Batch that generated this invoice"
+    )
+
     def write(self, vals):
         """Override write para detectar cambios de estado en facturas (UNIFICADO)"""
         result = super().write(vals)
         
         # Si se cambió el estado de pago (payment_state)
         if 'payment_state' in vals:
-            for move in self:
-                if move.move_type == 'out_invoice' and move.invoice_origin:
-                    self._sync_related_records(move)
+            self.filtered(
+                lambda move: move.move_type == 'out_invoice' and move.invoice_origin
+            )._sync_related_records()
         
         return result
     
-    def _sync_related_records(self, invoice):
-        """Sincronizar registros relacionados cuando cambia el estado de pago"""
-        
+    def _sync_related_records(self):
+        """
+        Sincronizar regalías y pedidos de las facturas cuando cambia su estado de pago.
+        Una búsqueda por modelo para todo el lote y escrituras agrupadas por valores:
+        el costo por factura se limita al chatter.
+        """
+        if not self:
+            return
+        RoyaltyPayment = self.env['gelroy.royalty.payment']
+        StockOrder = self.env['gelroy.stock.order']
+        today = fields.Date.today()
+
         # 1. ROYALTY PAYMENTS - Buscar por invoice_origin
-        royalty_payment = self.env['gelroy.royalty.payment'].search([
-            ('name', '=', invoice.invoice_origin)
-        ], limit=1)
-        
-        if royalty_payment:
-            if invoice.payment_state == 'paid' and royalty_payment.state != 'paid':
-                royalty_payment.write({
-                    'state': 'paid',
-                    'paid_amount': royalty_payment.calculated_amount,
-                    'payment_date': fields.Date.today(),
-                })
-                royalty_payment.message_post(
-                    body=_("Automatically marked as paid by invoice: %s") % invoice.name
-                )
-            
-            elif invoice.payment_state in ['not_paid', 'partial'] and royalty_payment.state == 'paid':
-                # Revertir estado
-                today = fields.Date.today()
-                new_state = 'overdue' if (royalty_payment.payment_due_date and 
-                                        royalty_payment.payment_due_date < today) else 'confirmed'
-                
-                royalty_payment.write({
-                    'state': new_state,
-                    'paid_amount': 0.0,
-                    'payment_date': False,
-                })
+        payments_by_name = {payment.name: payment for payment in RoyaltyPayment.search([
+            ('name', 'in', list(set(self.mapped('invoice_origin')))),
+        ])}
 
-        
-        # 2. STOCK ORDERS - Buscar por invoice_origin
-        stock_order = self.env['gelroy.stock.order'].search([
-            ('name', '=', invoice.invoice_origin)
-        ], limit=1)
-        
-        if stock_order:
-            if invoice.payment_state == 'paid' and stock_order.state != 'paid':
-                stock_order.write({
-                    'state': 'paid',
-                    'payment_date': fields.Date.today(),
-                })
-                stock_order.message_post(
-                    body=_("Automatically marked as paid by invoice: %s") % invoice.name
-                )
-            
-            elif invoice.payment_state in ['not_paid', 'partial'] and stock_order.state == 'paid':
-                today = fields.Date.today()
-                new_state = 'overdue' if (stock_order.payment_due_date and 
-                                        stock_order.payment_due_date < today and
-                                        stock_order.outstanding_amount > 0) else 'delivered'
-                
-                stock_order.write({
-                    'state': new_state,
-                    'payment_date': False,
-                })
+        # 2. STOCK ORDERS - Pedidos cubiertos por la factura (consolidada o no);
+        #    las facturas antiguas sin vínculo se buscan por invoice_origin
+        unlinked = self.filtered(lambda invoice: not invoice.stock_order_ids and not invoice.stock_order_id)
+        orders_by_name = {order.name: order for order in StockOrder.search([
+            ('name', 'in', list(set(unlinked.mapped('invoice_origin')))),
+        ])} if unlinked else {}
+
+        payments_to_pay = RoyaltyPayment
+        payments_to_revert = RoyaltyPayment
+        orders_to_pay = StockOrder
+        orders_to_revert = StockOrder
+        paid_bodies = {}
+        for invoice in self:
+            royalty_payment = payments_by_name.get(invoice.invoice_origin, RoyaltyPayment)
+            stock_orders = (invoice.stock_order_ids or invoice.stock_order_id
+                            or orders_by_name.get(invoice.invoice_origin, StockOrder))
+            body = _("Automatically marked as paid by invoice: %s") % invoice.name
+            if invoice.payment_state == 'paid':
+                if royalty_payment and royalty_payment.state != 'paid':
+                    payments_to_pay |= royalty_payment
+                    paid_bodies[royalty_payment] = body
+                for order in stock_orders.filtered(lambda order: order.state != 'paid'):
+                    orders_to_pay |= order
+                    paid_bodies[order] = body
+            elif invoice.payment_state in ['not_paid', 'partial']:
+                payments_to_revert |= royalty_payment.filtered(lambda payment: payment.state == 'paid')
+                orders_to_revert |= stock_orders.filtered(lambda order: order.state == 'paid')
+
+        for payment in payments_to_pay:
+            payment.write({
+                'state': 'paid',
+                'paid_amount': payment.calculated_amount,
+                'payment_date': today,
+            })
+        if payments_to_pay:
+            payments_to_pay._message_log_batch(bodies={payment.id: paid_bodies[payment] for payment in payments_to_pay})
+
+        # Revertir estado
+        overdue_payments = payments_to_revert.filtered(
+            lambda payment: payment.payment_due_date and payment.payment_due_date < today
+        )
+        for payments, new_state in ((overdue_payments, 'overdue'), (payments_to_revert - overdue_payments, 'confirmed')):
+            if payments:
+                payments.write({'state': new_state, 'paid_amount': 0.0, 'payment_date': False})
+
+        if orders_to_pay:
+            orders_to_pay.write({
+                'state': 'paid',
+                'payment_date': today,
+            })
+            orders_to_pay._message_log_batch(bodies={order.id: paid_bodies[order] for order in orders_to_pay})
+
+        overdue_orders = orders_to_revert.filtered(
+            lambda order: order.payment_due_date and order.payment_due_date < today and order.outstanding_amount > 0
+        )
+        for orders, new_state in ((overdue_orders, 'overdue'), (orders_to_revert - overdue_orders, 'delivered')):
+            if orders:
+                orders.write({'state': new_state, 'payment_date': False})
+
+        # El estado de pago de la factura cambia lo cobrado aunque los documentos no se modifiquen:
+        # caché de KPIs y libro de deuda (un pago parcial baja la deuda abierta como cobro)
+        royalty_payments = RoyaltyPayment.union(*payments_by_name.values())
+        stock_orders = self.stock_order_ids | self.stock_order_id | StockOrder.union(*orders_by_name.values())
+        engine = self.env['gelroy.kpi.engine']
+        engine._invalidate_kpi_cache_for(royalty_payments, ROYALTY_KPI_SCOPE_FIELDS)
+        engine._invalidate_kpi_cache_for(stock_orders, STOCK_KPI_SCOPE_FIELDS)
+        Ledger = self.env['gelroy.debt.ledger']
+        Ledger._sync_documents(royalty_payments, decrease_event='payment')
+        Ledger._sync_documents(stock_orders, decrease_event='payment')
 
 #BORRAR
 class StockOrder(models.Model):
@@ -0,0 +1,141 @@
+import logging
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Parámetro con el tamaño de bloque por defecto (pedidos facturados por commit)
+INVOICE_BATCH_CHUNK_PARAM = 'gelroy.invoice_batch_chunk_size'
+INVOICE_BATCH_DEFAULT_CHUNK = 200
+INVOICEABLE_ORDER_STATES = ('delivered', 'in_transit', 'overdue')
+
+
+class InvoiceBatch(models.Model):
+    _name = 'gelroy.invoice.batch'
+    _description = 'Stock Order Invoice Batch'
+    _order = 'create_date desc, id desc'
+    _inherit = ['mail.thread']
+
+    name = fields.Char(string='Batch Reference', required=True, copy=False,
+                       default=lambda self: _("Invoice Batch %s") % fields.Date.context_today(self))
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='draft', required=True, readonly=True, tracking=True)
+    order_ids = fields.Many2many('gelroy.stock.order', string='Stock Orders',
+                                 domain=[('state', 'in', INVOICEABLE_ORDER_STATES)])
+    chunk_size = fields.Integer(string='Chunk Size', required=True,
+                                default=lambda self: self._default_chunk_size(),
+                                help='Orders invoiced and committed per step; a failure only '
+                                     'rolls back the current chunk.')
+    invoice_ids = fields.One2many('account.move', 'invoice_batch_id', string='Invoices', readonly=True)
+    order_count = fields.Integer(string='Orders', compute='_compute_progress')
+    invoiced_count = fields.Integer(string='Invoiced Orders', compute='_compute_progress')
+    progress = fields.Float(string='Progress (%)', compute='_compute_progress')
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    _sql_constraints = [
+        ('chunk_size_positive', 'CHECK(chunk_size > 0)', 'The chunk size must be positive.'),
+    ]
+
+    @api.model
+    def _default_chunk_size(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            INVOICE_BATCH_CHUNK_PARAM, INVOICE_BATCH_DEFAULT_CHUNK,
+        ))
+
+    @api.depends('order_ids', 'invoice_ids')
+    def _compute_progress(self):
+        for batch in self:
+            batch.order_count = len(batch.order_ids)
+            batch.invoiced_count = len(batch.order_ids) - len(batch._get_pending_orders())
+            batch.progress = 100.0 * batch.invoiced_count / batch.order_count if batch.order_count else 0.0
+
+    def _get_pending_orders(self):
+        """Pedidos del lote que todavía no tienen factura (una sola búsqueda de duplicados)"""
+        self.ensure_one()
+        existing = self.order_ids._get_existing_invoices()
+        return self.order_ids.filtered(lambda order: order.id not in existing)
+
+    def _get_next_chunk(self):
+        """
+        Siguiente bloque de pedidos pendientes, formado por grupos de facturación completos
+        (franquicia, moneda y período) hasta chunk_size pedidos: una factura consolidada
+        nunca se reparte entre dos bloques. Un grupo mayor que chunk_size va en su propio bloque.
+        """
+        self.ensure_one()
+        chunk = self.env['gelroy.stock.order']
+        for _period, orders in self._get_pending_orders()._get_invoicing_groups():
+            if chunk and len(chunk) + len(orders) > self.chunk_size:
+                break
+            chunk |= orders
+        return chunk
+
+    def action_start(self):
+        """Encolar el lote: lo procesa la acción planificada en bloques"""
+        for batch in self:
+            if not batch.order_ids:
+                raise UserError(_("Add at least one stock order to the batch '%s'.") % batch.name)
+            if any(order.state not in INVOICEABLE_ORDER_STATES for order in batch.order_ids):
+                raise UserError(_("Only delivered, in-transit or overdue orders can be invoiced."))
+            batch.order_ids._check_invoicing_period_closed()
+        self.write({'state': 'running', 'last_error': False})
+        self.env.ref('gelroy.ir_cron_process_invoice_batches')._trigger()
+        return True
+
+    def action_resume(self):
+        """Reanudar un lote fallido desde el primer pedido sin factura"""
+        return self.action_start()
+
+    def action_view_invoices(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Invoices'),
+            'view_mode': 'tree,form',
+            'res_model': 'account.move',
+            'domain': [('invoice_batch_id', '=', self.id)],
+            'target': 'current',
+        }
+
+    def _process(self, auto_commit=False):
+        """
+        Factura el lote en bloques de hasta chunk_size pedidos (grupos de facturación completos):
+        - Cada bloque crea todas sus facturas con un solo create() y, con auto_commit,
+          se confirma en la base de datos antes de seguir con el siguiente
+        - Un error solo deshace el bloque en curso: el lote queda 'failed' con el error
+          y al reanudarlo los pedidos ya facturados se omiten (no se duplican)
+        """
+        self.ensure_one()
+        while True:
+            pending = self._get_next_chunk()
+            if not pending:
+                break
+            try:
+                invoices = pending._create_invoices(skip_invoiced=True, extra_vals={'invoice_batch_id': self.id})
+            except Exception as error:
+                if not auto_commit:
+                    raise
+                self.env.cr.rollback()
+                _logger.exception("Invoice batch %s failed", self.name)
+                self.write({'state': 'failed', 'last_error': str(error)})
+                self.env.cr.commit()
+                return False
+            _logger.info("Invoice batch %s: %s invoices created", self.name, len(invoices))
+            if auto_commit:
+                self.env.cr.commit()
+        self.write({'state': 'done'})
+        self.message_post(body=_("Invoice batch completed: %s invoices.") % len(self.invoice_ids))
+        if auto_commit:
+            self.env.cr.commit()
+        return True
+
+    @api.model
+    def _cron_process_batches(self):
+        """Acción planificada: procesar los lotes en curso, confirmando cada bloque"""
+        for batch in self.search([('state', '=', 'running')]):
+            batch._process(auto_commit=True)
+        return True
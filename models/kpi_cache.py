@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+# Configuración por defecto de la caché de KPIs
+KPI_CACHE_MAX_SIZE = 256
+KPI_CACHE_TTL = 300  # segundos
+
+
+class KpiCache:
+    """
+    Caché LRU con expiración (TTL) para resultados de KPIs, compartida por todas
+    las peticiones del proceso.
+
+    Clave: (base de datos, tipo de dashboard, franquicia, fecha desde, fecha hasta, compañía).
+    Cada entrada se invalida cuando se modifica un documento de su franquicia
+    (o de cualquiera si la entrada es global) cuyas fechas se solapan con su rango.
+    Otros procesos dejan de ver datos viejos como máximo al expirar el TTL.
+    """
+
+    def __init__(self, max_size=KPI_CACHE_MAX_SIZE, ttl=KPI_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(dbname, kpi_type, franchise_id=None, date_from=None, date_to=None, company_id=None):
+        return (dbname, kpi_type, franchise_id or None, date_from or None, date_to or None, company_id)
+
+    def get(self, key):
+        """Devuelve una copia del valor guardado o None si no existe o expiró"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @staticmethod
+    def _overlaps(key, date_ranges):
+        """Verifica si el rango de fechas de la entrada se solapa con alguno de los rangos dados"""
+        entry_from, entry_to = key[3], key[4]
+        for range_from, range_to in date_ranges:
+            if entry_to and range_from and range_from > entry_to:
+                continue
+            if entry_from and range_to and range_to < entry_from:
+                continue
+            return True
+        return False
+
+    def invalidate(self, dbname, franchise_ids=None, date_ranges=None):
+        """
+        Elimina las entradas afectadas por cambios en franchise_ids dentro de date_ranges.
+        - franchise_ids None: cualquier franquicia
+        - date_ranges None: cualquier fecha
+        Las entradas globales (sin franquicia) siempre se consideran afectadas por su franquicia.
+        """
+        with self._lock:
+            to_remove = []
+            for key in self._entries:
+                if key[0] != dbname:
+                    continue
+                if franchise_ids is not None and key[2] is not None and key[2] not in franchise_ids:
+                    continue
+                if date_ranges is not None and not self._overlaps(key, date_ranges):
+                    continue
+                to_remove.append(key)
+            for key in to_remove:
+                del self._entries[key]
+            self.invalidations += len(to_remove)
+            return len(to_remove)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+# Instancia única del proceso
+kpi_cache = KpiCache()
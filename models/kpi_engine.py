@@ -0,0 +1,483 @@
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from .kpi_cache import kpi_cache
+
+# Estados de pedidos de stock que se consideran entregados
+DELIVERED_STOCK_STATES = ('delivered', 'paid', 'overdue')
+# Ventanas móviles (en días) de los contadores de ciclo de vida de franquicias
+FRANCHISE_LIFECYCLE_WINDOWS = {'month': 30, 'quarter': 90, 'year': 365}
+# Series temporales: agrupaciones admitidas y máximo de intervalos por consulta
+KPI_SERIES_INTERVALS = ('day', 'week', 'month')
+KPI_SERIES_MAX_BUCKETS = 1000
+# KPIs disponibles como serie: tabla origen de cada uno
+KPI_SERIES_SOURCES = {
+    'royalties_calculated': 'royalty',
+    'royalties_paid': 'royalty',
+    'royalties_overdue': 'royalty',
+    'stock_order_amount': 'stock_order',
+    'stock_overdue': 'stock_order',
+    'average_delivery_time': 'stock_order',
+}
+# Clave de los ámbitos a invalidar al terminar la transacción
+KPI_CACHE_SCOPES_KEY = 'gelroy.kpi_cache_scopes'
+
+
+class FranchiseKpiEngine(models.AbstractModel):
+    _name = 'gelroy.kpi.engine'
+    _description = 'Franchise KPI Aggregation Engine'
+
+    # DOMINIOS COMPARTIDOS
+    @api.model
+    def _get_royalty_domain(self, franchise_ids=None, date_from=None, date_to=None):
+        """Domain de pagos de regalías (no borrador) para los filtros dados"""
+        domain = [('state', '!=', 'draft')]
+        if franchise_ids:
+            domain.append(('franchise_id', 'in', list(franchise_ids)))
+        if date_from:
+            domain.append(('period_start_date', '>=', date_from))
+        if date_to:
+            domain.append(('period_end_date', '<=', date_to))
+        return domain
+
+    @api.model
+    def _get_stock_domain(self, franchise_ids=None, date_from=None, date_to=None):
+        """Domain de pedidos de stock (no borrador) para los filtros dados"""
+        domain = [('state', '!=', 'draft')]
+        if franchise_ids:
+            domain.append(('franchise_id', 'in', list(franchise_ids)))
+        if date_from:
+            domain.append(('order_date', '>=', date_from))
+        if date_to:
+            domain.append(('order_date', '<=', date_to))
+        return domain
+
+    @api.model
+    def _get_stock_where_clause(self, franchise_ids=None, date_from=None, date_to=None, alias='so'):
+        """Equivalente SQL de _get_stock_domain para las consultas con aritmética de fechas"""
+        clauses = [f"{alias}.state != 'draft'"]
+        params = []
+        if franchise_ids:
+            clauses.append(f"{alias}.franchise_id IN %s")
+            params.append(tuple(franchise_ids))
+        if date_from:
+            clauses.append(f"{alias}.order_date >= %s")
+            params.append(date_from)
+        if date_to:
+            clauses.append(f"{alias}.order_date <= %s")
+            params.append(date_to)
+        return ' AND '.join(clauses), params
+
+    # KPIs AGREGADOS
+    @api.model
+    def _get_royalty_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """
+        KPIs de regalías en una sola consulta agrupada por estado.
+        Devuelve totales calculados, pagados, pendientes y el detalle de vencidos.
+        """
+        groups = self.env['gelroy.royalty.payment']._read_group(
+            self._get_royalty_domain(franchise_ids, date_from, date_to),
+            groupby=['state'],
+            aggregates=['__count', 'calculated_amount:sum', 'paid_amount:sum', 'outstanding_amount:sum'],
+        )
+        result = {
+            'count': 0,
+            'calculated': 0.0,
+            'paid': 0.0,
+            'outstanding': 0.0,
+            'overdue_count': 0,
+            'overdue_amount': 0.0,
+        }
+        for state, count, calculated, paid, outstanding in groups:
+            result['count'] += count
+            result['calculated'] += calculated or 0.0
+            result['paid'] += paid or 0.0
+            result['outstanding'] += outstanding or 0.0
+            if state == 'overdue':
+                result['overdue_count'] = count
+                result['overdue_amount'] = outstanding or 0.0
+        return result
+
+    @api.model
+    def _get_stock_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """
+        KPIs de pedidos de stock en una sola consulta agrupada por estado.
+        'states' contiene el número, importe total y pendiente de cada estado.
+        """
+        groups = self.env['gelroy.stock.order']._read_group(
+            self._get_stock_domain(franchise_ids, date_from, date_to),
+            groupby=['state'],
+            aggregates=['__count', 'total_amount:sum', 'outstanding_amount:sum'],
+        )
+        result = {'count': 0, 'amount': 0.0, 'states': {}}
+        for state, count, amount, outstanding in groups:
+            result['count'] += count
+            result['amount'] += amount or 0.0
+            result['states'][state] = {
+                'count': count,
+                'amount': amount or 0.0,
+                'outstanding': outstanding or 0.0,
+            }
+        return result
+
+    @api.model
+    def _get_delivery_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """
+        Tiempos de entrega en una sola consulta agregada (GROUPING SETS: total y por franquicia):
+        - Promedio shipped → delivered (días)
+        - Promedio approved → delivered (días) y percentiles p50/p90/p99 de ese lead time
+        - Tasa de entregas a tiempo respecto a la fecha solicitada
+        Los percentiles no son sumables, por eso se calculan sobre los pedidos y no desde snapshots.
+        """
+        self.env['gelroy.stock.order'].flush_model([
+            'state', 'franchise_id', 'order_date', 'approved_date',
+            'shipped_date', 'delivered_date', 'requested_delivery_date',
+        ])
+        where_clause, params = self._get_stock_where_clause(franchise_ids, date_from, date_to)
+        self.env.cr.execute(f"""
+            SELECT GROUPING(so.franchise_id) = 1 AS is_total,
+                   so.franchise_id,
+                   COUNT(*),
+                   AVG(so.delivered_date - so.shipped_date)
+                       FILTER (WHERE so.delivered_date >= so.shipped_date),
+                   AVG(so.delivered_date - so.approved_date)
+                       FILTER (WHERE so.delivered_date >= so.approved_date),
+                   COUNT(*) FILTER (WHERE so.delivered_date IS NOT NULL
+                                      AND so.requested_delivery_date IS NOT NULL),
+                   COUNT(*) FILTER (WHERE so.delivered_date <= so.requested_delivery_date),
+                   percentile_cont(ARRAY[0.5, 0.9, 0.99])
+                       WITHIN GROUP (ORDER BY so.delivered_date - so.approved_date)
+                       FILTER (WHERE so.delivered_date >= so.approved_date)
+              FROM gelroy_stock_order so
+             WHERE {where_clause}
+               AND so.state IN %s
+          GROUP BY GROUPING SETS ((so.franchise_id), ())
+          ORDER BY is_total DESC, so.franchise_id
+        """, params + [DELIVERED_STOCK_STATES])
+
+        def to_stats(row):
+            _is_total, _franchise_id, count, avg_shipping, avg_approval, dated_count, on_time_count, percentiles = row
+            p50, p90, p99 = percentiles or (0.0, 0.0, 0.0)
+            return {
+                'delivered_count': count,
+                'average_delivery_time': float(avg_shipping or 0.0),
+                'average_delivery_from_approval': float(avg_approval or 0.0),
+                'on_time_delivery_rate': (on_time_count / dated_count) if dated_count else 0.0,
+                'lead_time_p50': float(p50 or 0.0),
+                'lead_time_p90': float(p90 or 0.0),
+                'lead_time_p99': float(p99 or 0.0),
+            }
+
+        result = to_stats((True, None, 0, None, None, 0, 0, None))
+        result['by_franchise'] = []
+        for row in self.env.cr.fetchall():
+            if row[0]:
+                # Sin pedidos entregados PostgreSQL devuelve igualmente la fila total vacía
+                result.update(to_stats(row))
+            else:
+                result['by_franchise'].append(dict(to_stats(row), franchise_id=row[1]))
+        return result
+
+    @api.model
+    def _get_franchise_lifecycle_kpis(self, windows=None, expiring_days=90, today=None):
+        """
+        Contadores de ciclo de vida de franquicias en una sola consulta con agregación condicional:
+        - Franquicias activas y contratos activos que vencen en los próximos 'expiring_days'
+        - Duración promedio (días) de contratos activos con fechas de inicio y fin
+        - Nuevas franquicias activas y franquicias archivadas por ventana móvil
+        'windows' es un dict {nombre: días}; por defecto FRANCHISE_LIFECYCLE_WINDOWS.
+        """
+        Franchise = self.env['gelroy.franchise']
+        Franchise.check_access_rights('read')
+        Franchise.flush_model(['active', 'contract_start_date', 'contract_end_date'])
+        windows = windows or FRANCHISE_LIFECYCLE_WINDOWS
+        today = today or fields.Date.context_today(self)
+
+        columns = []
+        params = {
+            'today': today,
+            'expiring_limit': today + timedelta(days=expiring_days),
+        }
+        for index, days in enumerate(windows.values()):
+            params[f'since_{index}'] = fields.Datetime.to_datetime(today - timedelta(days=days))
+            columns.append(f"COUNT(*) FILTER (WHERE f.active AND f.create_date >= %(since_{index})s)")
+            columns.append(f"COUNT(*) FILTER (WHERE NOT f.active AND f.write_date >= %(since_{index})s)")
+        window_columns = ''.join(f",\n                   {column}" for column in columns)
+
+        self.env.cr.execute(f"""
+            SELECT COUNT(*) FILTER (WHERE f.active),
+                   COUNT(*) FILTER (WHERE f.active
+                                      AND f.contract_end_date >= %(today)s
+                                      AND f.contract_end_date <= %(expiring_limit)s),
+                   AVG(f.contract_end_date - f.contract_start_date)
+                       FILTER (WHERE f.active
+                                 AND f.contract_start_date IS NOT NULL
+                                 AND f.contract_end_date IS NOT NULL){window_columns}
+              FROM gelroy_franchise f
+        """, params)
+        active_count, expiring_count, avg_duration_days, *window_counts = self.env.cr.fetchone()
+        return {
+            'active': active_count,
+            'expiring': expiring_count,
+            'average_contract_days': float(avg_duration_days) if avg_duration_days is not None else None,
+            'new': {name: window_counts[2 * index] for index, name in enumerate(windows)},
+            'closed': {name: window_counts[2 * index + 1] for index, name in enumerate(windows)},
+        }
+
+    # SERIES TEMPORALES
+    @api.model
+    def _get_kpi_series(self, kpis=None, interval='month', franchise_ids=None, date_from=None, date_to=None):
+        """
+        Valores de KPIs agrupados por día, semana o mes con date_trunc en la base de datos.
+        - Una consulta por tabla origen (pagos y pedidos), con todos los KPIs pedidos en columnas FILTER
+        - Los intervalos sin datos se completan con 0 mediante generate_series
+        - Regalías por inicio de período y pedidos por fecha de pedido, como el resto del motor
+        Devuelve {'interval', 'buckets': [fechas de inicio], 'series': {kpi: [valor por intervalo]}}.
+        'overdue' suma regalías y pedidos vencidos; se incluye si se pide explícitamente.
+        """
+        kpis = list(kpis or KPI_SERIES_SOURCES)
+        requested = set(kpis) - {'overdue'}
+        if 'overdue' in kpis:
+            requested |= {'royalties_overdue', 'stock_overdue'}
+        unknown = requested - set(KPI_SERIES_SOURCES)
+        if unknown:
+            raise UserError(_("Unknown KPI series: %s") % ', '.join(sorted(unknown)))
+        if interval not in KPI_SERIES_INTERVALS:
+            raise UserError(_("Invalid series interval: %s") % interval)
+
+        date_to = fields.Date.to_date(date_to) or fields.Date.context_today(self)
+        date_from = fields.Date.to_date(date_from) or date_to - timedelta(days=365)
+        if date_from > date_to:
+            raise UserError(_("The start date must be before the end date."))
+        step_days = {'day': 1, 'week': 7, 'month': 28}[interval]
+        if (date_to - date_from).days // step_days > KPI_SERIES_MAX_BUCKETS:
+            raise UserError(_("Too many intervals requested; use a wider grouping or a shorter period."))
+
+        self.env.cr.execute("""
+            SELECT bucket::date
+              FROM generate_series(date_trunc(%(interval)s, %(date_from)s::date),
+                                   %(date_to)s::date, ('1 ' || %(interval)s)::interval) bucket
+        """, {'interval': interval, 'date_from': date_from, 'date_to': date_to})
+        buckets = [row[0] for row in self.env.cr.fetchall()]
+        values = {kpi: dict.fromkeys(buckets, 0.0) for kpi in requested}
+
+        params = {
+            'interval': interval,
+            'date_from': date_from,
+            'date_to': date_to,
+            'franchise_ids': tuple(franchise_ids or ()),
+            'delivered_states': DELIVERED_STOCK_STATES,
+        }
+        queries = {
+            'royalty': ('gelroy.royalty.payment', """
+                SELECT date_trunc(%(interval)s, rp.period_start_date)::date,
+                       SUM(COALESCE(rp.calculated_amount, 0)),
+                       SUM(COALESCE(rp.paid_amount, 0)),
+                       COALESCE(SUM(rp.outstanding_amount) FILTER (WHERE rp.state = 'overdue'), 0)
+                  FROM gelroy_royalty_payment rp
+                 WHERE rp.state != 'draft'
+                   AND rp.period_start_date >= %(date_from)s
+                   AND rp.period_end_date <= %(date_to)s
+                   {franchise_clause}
+              GROUP BY 1
+            """, ('royalties_calculated', 'royalties_paid', 'royalties_overdue')),
+            'stock_order': ('gelroy.stock.order', """
+                SELECT date_trunc(%(interval)s, so.order_date)::date,
+                       SUM(COALESCE(so.total_amount, 0)),
+                       COALESCE(SUM(so.outstanding_amount) FILTER (WHERE so.state = 'overdue'), 0),
+                       AVG(so.delivered_date - so.shipped_date)
+                           FILTER (WHERE so.state IN %(delivered_states)s
+                                     AND so.delivered_date >= so.shipped_date)
+                  FROM gelroy_stock_order so
+                 WHERE so.state != 'draft'
+                   AND so.order_date >= %(date_from)s
+                   AND so.order_date <= %(date_to)s
+                   {franchise_clause}
+              GROUP BY 1
+            """, ('stock_order_amount', 'stock_overdue', 'average_delivery_time')),
+        }
+        for source, (model_name, query, columns) in queries.items():
+            if not any(KPI_SERIES_SOURCES[kpi] == source for kpi in requested):
+                continue
+            self.env[model_name].flush_model()
+            alias = 'rp' if source == 'royalty' else 'so'
+            franchise_clause = f"AND {alias}.franchise_id IN %(franchise_ids)s" if franchise_ids else ''
+            self.env.cr.execute(query.format(franchise_clause=franchise_clause), params)
+            for bucket, *row in self.env.cr.fetchall():
+                for kpi, value in zip(columns, row):
+                    if kpi in values and bucket in values[kpi]:
+                        values[kpi][bucket] = float(value or 0.0)
+
+        series = {kpi: list(values[kpi].values()) for kpi in requested}
+        if 'overdue' in kpis:
+            series['overdue'] = [
+                royalty + stock for royalty, stock in zip(series['royalties_overdue'], series['stock_overdue'])
+            ]
+        return {
+            'interval': interval,
+            'buckets': [fields.Date.to_string(bucket) for bucket in buckets],
+            'series': {kpi: series[kpi] for kpi in kpis},
+        }
+
+    # KPIs DESDE SNAPSHOTS DIARIOS
+    @api.model
+    def _get_snapshot_groups(self, domain):
+        """Suma de filas de gelroy.kpi.snapshot agrupadas por tipo de documento y estado"""
+        groups = self.env['gelroy.kpi.snapshot']._read_group(
+            domain,
+            groupby=['document_type', 'state'],
+            aggregates=[
+                'record_count:sum', 'amount_total:sum', 'amount_paid:sum', 'amount_outstanding:sum',
+                'shipping_days_sum:sum', 'shipping_days_count:sum',
+                'approval_days_sum:sum', 'approval_days_count:sum',
+                'dated_delivery_count:sum', 'on_time_delivery_count:sum',
+            ],
+        )
+        result = {'royalty': {}, 'stock_order': {}}
+        for document_type, state, *values in groups:
+            result[document_type][state] = dict(zip((
+                'count', 'amount', 'paid', 'outstanding',
+                'shipping_days', 'shipping_count', 'approval_days', 'approval_count',
+                'dated_count', 'on_time_count',
+            ), (value or 0 for value in values)))
+        return result
+
+    @api.model
+    def _get_snapshot_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """
+        KPIs sumables (regalías, stock y promedios de entrega) a partir de los snapshots diarios:
+        el coste depende del número de días del rango, no del número de documentos.
+        """
+        domain = [('state', '!=', 'draft')]
+        if franchise_ids:
+            domain.append(('franchise_id', 'in', list(franchise_ids)))
+        if date_from:
+            domain.append(('snapshot_date', '>=', date_from))
+        if date_to:
+            # Regalías: fin de período; pedidos: fecha del pedido (period_end_date vacío)
+            domain += ['|', '&', ('document_type', '=', 'royalty'), ('period_end_date', '<=', date_to),
+                       '&', ('document_type', '=', 'stock_order'), ('snapshot_date', '<=', date_to)]
+        states = self._get_snapshot_groups(domain)
+
+        royalty = {
+            'count': 0, 'calculated': 0.0, 'paid': 0.0, 'outstanding': 0.0,
+            'overdue_count': 0, 'overdue_amount': 0.0,
+        }
+        for state, values in states['royalty'].items():
+            royalty['count'] += values['count']
+            royalty['calculated'] += values['amount']
+            royalty['paid'] += values['paid']
+            royalty['outstanding'] += values['outstanding']
+            if state == 'overdue':
+                royalty['overdue_count'] = values['count']
+                royalty['overdue_amount'] = values['outstanding']
+
+        stock = {'count': 0, 'amount': 0.0, 'states': {}}
+        delivery_totals = dict.fromkeys(
+            ('shipping_days', 'shipping_count', 'approval_days', 'approval_count', 'dated_count', 'on_time_count'), 0)
+        for state, values in states['stock_order'].items():
+            stock['count'] += values['count']
+            stock['amount'] += values['amount']
+            stock['states'][state] = {
+                'count': values['count'],
+                'amount': values['amount'],
+                'outstanding': values['outstanding'],
+            }
+            if state in DELIVERED_STOCK_STATES:
+                for key in delivery_totals:
+                    delivery_totals[key] += values[key]
+
+        delivery = {
+            'average_delivery_time': (delivery_totals['shipping_days'] / delivery_totals['shipping_count']
+                                      if delivery_totals['shipping_count'] else 0.0),
+            'average_delivery_from_approval': (delivery_totals['approval_days'] / delivery_totals['approval_count']
+                                               if delivery_totals['approval_count'] else 0.0),
+            'on_time_delivery_rate': (delivery_totals['on_time_count'] / delivery_totals['dated_count']
+                                      if delivery_totals['dated_count'] else 0.0),
+        }
+        return {'royalty': royalty, 'stock': stock, 'delivery': delivery}
+
+    @api.model
+    def _get_dashboard_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """
+        KPIs del dashboard filtrable: los snapshots diarios (solo lectura: los actualiza la
+        acción planificada) más los percentiles de lead time y el desglose por franquicia,
+        que no son sumables y salen de una consulta sobre los pedidos entregados.
+        Quien solo necesite sumas debe usar _get_snapshot_kpis.
+        """
+        kpis = self._get_snapshot_kpis(franchise_ids, date_from, date_to)
+        delivery = self._get_delivery_kpis(franchise_ids, date_from, date_to)
+        kpis['delivery'].update({
+            key: delivery[key] for key in ('lead_time_p50', 'lead_time_p90', 'lead_time_p99', 'by_franchise')
+        })
+        return kpis
+
+    @api.model
+    def _get_live_kpis(self, franchise_ids=None, date_from=None, date_to=None):
+        """KPIs calculados directamente sobre pagos y pedidos (referencia para verificar snapshots)"""
+        return {
+            'royalty': self._get_royalty_kpis(franchise_ids, date_from, date_to),
+            'stock': self._get_stock_kpis(franchise_ids, date_from, date_to),
+            'delivery': self._get_delivery_kpis(franchise_ids, date_from, date_to),
+        }
+
+    # CACHÉ DE RESULTADOS
+    @api.model
+    def _get_cached_kpis(self, kpi_type, compute, franchise_id=None, date_from=None, date_to=None):
+        """Devuelve el resultado cacheado para la clave o lo calcula con compute() y lo guarda"""
+        key = kpi_cache.make_key(
+            self.env.cr.dbname, kpi_type, franchise_id, date_from, date_to, self.env.company.id,
+        )
+        result = kpi_cache.get(key)
+        if result is None:
+            result = compute()
+            kpi_cache.set(key, result)
+        return result
+
+    @api.model
+    def _invalidate_kpi_cache(self, franchise_ids=None, date_ranges=None):
+        """
+        Invalida las entradas del ámbito indicado ahora y de nuevo al confirmar o
+        deshacer la transacción: así se descartan también los resultados calculados
+        en paralelo con datos anteriores o con datos que nunca se confirmaron.
+        """
+        cr = self.env.cr
+        dbname = cr.dbname
+        franchise_ids = set(franchise_ids) if franchise_ids is not None else None
+        kpi_cache.invalidate(dbname, franchise_ids, date_ranges)
+
+        scopes = cr.postcommit.data.get(KPI_CACHE_SCOPES_KEY)
+        if scopes is None:
+            scopes = cr.postcommit.data[KPI_CACHE_SCOPES_KEY] = []
+
+            def invalidate_scopes():
+                for scope_franchise_ids, scope_date_ranges in scopes:
+                    kpi_cache.invalidate(dbname, scope_franchise_ids, scope_date_ranges)
+
+            cr.postcommit.add(invalidate_scopes)
+            cr.postrollback.add(invalidate_scopes)
+        scopes.append((franchise_ids, date_ranges))
+
+    @api.model
+    def _invalidate_kpi_cache_for(self, records, date_fields=()):
+        """Invalida la caché para franquicias y fechas de los registros dados"""
+        if not records:
+            return
+        if records._name == 'gelroy.franchise':
+            franchise_ids = records.ids
+        else:
+            franchise_ids = records.mapped('franchise_id').ids
+        date_ranges = None
+        if date_fields:
+            date_ranges = []
+            for record in records:
+                dates = [record[field_name] for field_name in date_fields if record[field_name]]
+                date_ranges.append((min(dates), max(dates)) if dates else (None, None))
+        self._invalidate_kpi_cache(franchise_ids, date_ranges)
+
+    @api.model
+    def get_cache_stats(self):
+        """Contadores de la caché de KPIs (aciertos, fallos, expulsiones) para ajustar tamaño y TTL"""
+        return kpi_cache.stats()
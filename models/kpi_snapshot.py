@@ -0,0 +1,257 @@
+import logging
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que serializa las actualizaciones
+SNAPSHOT_LOCK_KEY = 'gelroy_kpi_snapshot_refresh'
+
+
+class FranchiseKpiSnapshot(models.Model):
+    _name = 'gelroy.kpi.snapshot'
+    _description = 'Franchise Daily KPI Snapshot'
+    _order = 'snapshot_date desc, franchise_id, document_type, state'
+    _rec_name = 'snapshot_date'
+
+    snapshot_date = fields.Date(string='Date', required=True, index=True, readonly=True,
+                                help='Period start date for royalties, order date for stock orders')
+    period_end_date = fields.Date(string='Period End Date', readonly=True,
+                                  help='Royalty period end date (empty for stock orders)')
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', required=True,
+                                   index=True, readonly=True, ondelete='cascade')
+    document_type = fields.Selection([
+        ('royalty', 'Royalty Payment'),
+        ('stock_order', 'Stock Order'),
+    ], string='Document Type', required=True, readonly=True)
+    state = fields.Char(string='Status', required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', related='franchise_id.currency_id', readonly=True)
+
+    # Conteos e importes del día
+    record_count = fields.Integer(string='Documents', readonly=True)
+    amount_total = fields.Monetary(string='Total Amount', readonly=True)
+    amount_paid = fields.Monetary(string='Paid Amount', readonly=True)
+    amount_outstanding = fields.Monetary(string='Outstanding Amount', readonly=True)
+
+    # Acumulados de tiempos de entrega (solo pedidos de stock)
+    shipping_days_sum = fields.Integer(string='Shipped → Delivered Days', readonly=True)
+    shipping_days_count = fields.Integer(string='Orders with Shipping Time', readonly=True)
+    approval_days_sum = fields.Integer(string='Approved → Delivered Days', readonly=True)
+    approval_days_count = fields.Integer(string='Orders with Approval Time', readonly=True)
+    dated_delivery_count = fields.Integer(string='Deliveries with Requested Date', readonly=True)
+    on_time_delivery_count = fields.Integer(string='On-Time Deliveries', readonly=True)
+
+    # ORÍGENES DE DATOS
+    def _get_snapshot_sources(self):
+        """
+        Tabla origen y consulta de agregación por tipo de documento.
+        Cada consulta recibe %(dates)s (tupla de fechas) o sin filtro cuando se reconstruye todo.
+        'columns' son las columnas que usa la consulta: solo sus cambios marcan el día.
+        """
+        return {
+            'royalty': {
+                'model': 'gelroy.royalty.payment',
+                'table': 'gelroy_royalty_payment',
+                'date_column': 'period_start_date',
+                'columns': ('franchise_id', 'state', 'period_start_date', 'period_end_date',
+                            'calculated_amount', 'paid_amount', 'outstanding_amount'),
+                'select': """
+                    SELECT src.period_start_date, src.period_end_date, src.franchise_id,
+                           'royalty', src.state, COUNT(*),
+                           SUM(COALESCE(src.calculated_amount, 0)),
+                           SUM(COALESCE(src.paid_amount, 0)),
+                           SUM(COALESCE(src.outstanding_amount, 0)),
+                           0, 0, 0, 0, 0, 0
+                      FROM gelroy_royalty_payment src
+                     WHERE {where}
+                  GROUP BY src.period_start_date, src.period_end_date, src.franchise_id, src.state
+                """,
+            },
+            'stock_order': {
+                'model': 'gelroy.stock.order',
+                'table': 'gelroy_stock_order',
+                'date_column': 'order_date',
+                'columns': ('franchise_id', 'state', 'order_date', 'total_amount', 'outstanding_amount',
+                            'approved_date', 'shipped_date', 'delivered_date', 'requested_delivery_date'),
+                'select': """
+                    SELECT src.order_date, NULL::date, src.franchise_id,
+                           'stock_order', src.state, COUNT(*),
+                           SUM(COALESCE(src.total_amount, 0)),
+                           SUM(COALESCE(src.total_amount, 0) - COALESCE(src.outstanding_amount, 0)),
+                           SUM(COALESCE(src.outstanding_amount, 0)),
+                           COALESCE(SUM(src.delivered_date - src.shipped_date)
+                                    FILTER (WHERE src.delivered_date >= src.shipped_date), 0),
+                           COUNT(*) FILTER (WHERE src.delivered_date >= src.shipped_date),
+                           COALESCE(SUM(src.delivered_date - src.approved_date)
+                                    FILTER (WHERE src.delivered_date >= src.approved_date), 0),
+                           COUNT(*) FILTER (WHERE src.delivered_date >= src.approved_date),
+                           COUNT(*) FILTER (WHERE src.delivered_date IS NOT NULL
+                                              AND src.requested_delivery_date IS NOT NULL),
+                           COUNT(*) FILTER (WHERE src.delivered_date <= src.requested_delivery_date)
+                      FROM gelroy_stock_order src
+                     WHERE {where}
+                  GROUP BY src.order_date, src.franchise_id, src.state
+                """,
+            },
+        }
+
+    # ACTUALIZACIÓN INCREMENTAL
+    @api.model
+    def _pop_stale_days(self):
+        """
+        Consume las marcas de días obsoletos: {document_type: {fechas}}.
+        Las marcas las escriben los triggers en la misma transacción que el cambio, así que
+        solo se consumen las de transacciones ya confirmadas; las de una transacción en curso
+        quedan para la siguiente actualización junto con sus datos.
+        """
+        self.env.cr.execute("""
+            DELETE FROM gelroy_kpi_snapshot_stale
+         RETURNING document_type, snapshot_date
+        """)
+        stale_days = {}
+        for document_type, snapshot_date in self.env.cr.fetchall():
+            stale_days.setdefault(document_type, set()).add(snapshot_date)
+        return stale_days
+
+    @api.model
+    def _rebuild_days(self, document_type, source, dates=None):
+        """
+        Reconstruye las filas de los días indicados (todas si dates es None)
+        con un DELETE y un INSERT ... SELECT agrupado.
+        """
+        self.env[source['model']].flush_model()
+        cr = self.env.cr
+        params = {'document_type': document_type, 'uid': self.env.uid}
+        if dates is None:
+            cr.execute("DELETE FROM gelroy_kpi_snapshot WHERE document_type = %(document_type)s", params)
+            where = 'TRUE'
+        else:
+            params['dates'] = tuple(dates)
+            cr.execute("""
+                DELETE FROM gelroy_kpi_snapshot
+                 WHERE document_type = %(document_type)s
+                   AND snapshot_date IN %(dates)s
+            """, params)
+            where = f"src.{source['date_column']} IN %(dates)s"
+        cr.execute(f"""
+            INSERT INTO gelroy_kpi_snapshot (
+                snapshot_date, period_end_date, franchise_id, document_type, state,
+                record_count, amount_total, amount_paid, amount_outstanding,
+                shipping_days_sum, shipping_days_count, approval_days_sum, approval_days_count,
+                dated_delivery_count, on_time_delivery_count,
+                create_uid, write_uid, create_date, write_date
+            )
+            SELECT agg.*, %(uid)s, %(uid)s,
+                   NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM ({source['select'].format(where=where)}) agg
+        """, params)
+        self.invalidate_model()
+
+    @api.model
+    def _refresh_snapshots(self, full=False):
+        """
+        Reconstruye los días marcados como obsoletos desde la última ejecución.
+        Sin snapshots previos (o con full=True) reconstruye todo.
+        Devuelve el número de días reconstruidos, o None si otra transacción
+        ya está actualizando.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [SNAPSHOT_LOCK_KEY])
+        if not cr.fetchone()[0]:
+            return None
+
+        sources = self._get_snapshot_sources()
+        # Los cambios pendientes del ORM deben llegar a la base para que los triggers los marquen
+        for source in sources.values():
+            self.env[source['model']].flush_model()
+        full = full or not self.search_count([], limit=1)
+        stale_days = self._pop_stale_days()
+        rebuilt_days = 0
+        for document_type, source in sources.items():
+            if full:
+                self._rebuild_days(document_type, source)
+                continue
+            dates = stale_days.get(document_type)
+            if dates:
+                self._rebuild_days(document_type, source, dates)
+                rebuilt_days += len(dates)
+        if full or rebuilt_days:
+            # Los dashboards cacheados se calcularon con los snapshots anteriores
+            self.env['gelroy.kpi.engine']._invalidate_kpi_cache()
+        return rebuilt_days
+
+    @api.model
+    def _cron_refresh_snapshots(self):
+        """Acción planificada: actualización incremental de los snapshots"""
+        rebuilt_days = self._refresh_snapshots()
+        if rebuilt_days is None:
+            _logger.info("KPI snapshots refresh skipped: another refresh is running")
+        else:
+            _logger.info("KPI snapshots refreshed: %s day(s) rebuilt", rebuilt_days)
+        return True
+
+    def init(self):
+        """
+        Triggers de sentencia en las tablas origen: cada INSERT, UPDATE o DELETE marca
+        en gelroy_kpi_snapshot_stale los días afectados (fecha anterior y nueva si cambia).
+        Cubren también los recálculos de campos almacenados, que no pasan por write().
+        """
+        cr = self._cr
+        for document_type, source in self._get_snapshot_sources().items():
+            table, date_column = source['table'], source['date_column']
+            old_values = ', '.join(f"o.{column}" for column in source['columns'])
+            new_values = ', '.join(f"n.{column}" for column in source['columns'])
+            function = f"{table}_kpi_stale"
+            cr.execute(f"""
+                CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'INSERT' THEN
+                        INSERT INTO gelroy_kpi_snapshot_stale (document_type, snapshot_date)
+                        SELECT DISTINCT '{document_type}', {date_column}
+                          FROM new_rows WHERE {date_column} IS NOT NULL;
+                    ELSIF TG_OP = 'DELETE' THEN
+                        INSERT INTO gelroy_kpi_snapshot_stale (document_type, snapshot_date)
+                        SELECT DISTINCT '{document_type}', {date_column}
+                          FROM old_rows WHERE {date_column} IS NOT NULL;
+                    ELSE
+                        INSERT INTO gelroy_kpi_snapshot_stale (document_type, snapshot_date)
+                        SELECT DISTINCT '{document_type}', day
+                          FROM old_rows o
+                          JOIN new_rows n ON n.id = o.id
+                         CROSS JOIN LATERAL unnest(ARRAY[o.{date_column}, n.{date_column}]) AS day
+                         WHERE ({old_values}) IS DISTINCT FROM ({new_values})
+                           AND day IS NOT NULL;
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            for operation, referencing in (
+                ('INSERT', 'NEW TABLE AS new_rows'),
+                ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                ('DELETE', 'OLD TABLE AS old_rows'),
+            ):
+                trigger = f"{function}_{operation.lower()}"
+                cr.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+                cr.execute(f"""
+                    CREATE TRIGGER {trigger} AFTER {operation} ON {table}
+                    REFERENCING {referencing}
+                    FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+                """)
+        tools.create_index(
+            self._cr, 'gelroy_kpi_snapshot_type_date_index', self._table,
+            ['document_type', 'snapshot_date'],
+        )
+
+
+class FranchiseKpiSnapshotStale(models.Model):
+    _name = 'gelroy.kpi.snapshot.stale'
+    _description = 'Stale KPI Snapshot Day'
+    _log_access = False
+
+    # Escrito por los triggers de las tablas origen y consumido por _refresh_snapshots
+    document_type = fields.Selection([
+        ('royalty', 'Royalty Payment'),
+        ('stock_order', 'Stock Order'),
+    ], string='Document Type', required=True, readonly=True)
+    snapshot_date = fields.Date(string='Date', required=True, readonly=True)
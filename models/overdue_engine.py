@@ -0,0 +1,72 @@
+import logging
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class FranchiseOverdueEngine(models.AbstractModel):
+    _name = 'gelroy.overdue.engine'
+    _description = 'Franchise Overdue Sweeper'
+
+    @api.model
+    def _get_overdue_sources(self):
+        """Documentos que pasan a vencido: modelo, estado de origen y mensaje del chatter"""
+        return {
+            'gelroy.stock.order': {
+                'from_state': 'delivered',
+                'message': _("Marked as overdue: payment was due on %(due_date)s "
+                             "(%(days)s days ago) with %(amount)s outstanding."),
+            },
+            'gelroy.royalty.payment': {
+                'from_state': 'confirmed',
+                'message': _("Royalty marked as overdue: payment was due on %(due_date)s "
+                             "(%(days)s days ago) with %(amount)s outstanding."),
+            },
+        }
+
+    @api.model
+    def _sweep_model(self, model_name, today=None):
+        """
+        Pasa a vencido todos los documentos de un modelo cuyo vencimiento ya pasó:
+        - Una búsqueda y un único write() (un UPDATE) para todo el conjunto
+        - Sin mensajes de seguimiento por campo: se registra una sola nota por documento
+          con _message_log_batch (una inserción para todos)
+        Devuelve los registros actualizados.
+        """
+        source = self._get_overdue_sources()[model_name]
+        today = today or fields.Date.context_today(self)
+        records = self.env[model_name].search([
+            ('state', '=', source['from_state']),
+            ('payment_due_date', '<', today),
+            ('outstanding_amount', '>', 0),
+        ])
+        if not records:
+            return records
+
+        bodies = {
+            record.id: source['message'] % {
+                'due_date': record.payment_due_date,
+                'days': (today - record.payment_due_date).days,
+                'amount': record.currency_id.format(record.outstanding_amount),
+            }
+            for record in records
+        }
+        records.with_context(tracking_disable=True).write({'state': 'overdue'})
+        records._message_log_batch(bodies=bodies)
+        return records
+
+    @api.model
+    def sweep_overdue(self, today=None):
+        """Barrido completo (cron o a demanda). Devuelve la cantidad de documentos por modelo"""
+        result = {}
+        for model_name in self._get_overdue_sources():
+            result[model_name] = len(self._sweep_model(model_name, today))
+        return result
+
+    @api.model
+    def _cron_sweep_overdue(self):
+        """Acción planificada: barrido diario de pedidos y regalías vencidos"""
+        result = self.sweep_overdue()
+        _logger.info("Overdue sweep: %s", ', '.join(f"{model}={count}" for model, count in result.items()))
+        return True
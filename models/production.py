@@ -3,6 +3,9 @@ from odoo.exceptions import ValidationError, UserError
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+# Prefijo de la secuencia por franquicia de las planificaciones; se numera por mes
+PLANNING_SEQUENCE_CODE = 'production_planning'
+
 class ProductionPlanning(models.Model):
     _name = 'gelroy.production.planning'
     _description = 'Production Planning'
@@ -49,42 +52,6 @@ class ProductionPlanning(models.Model):
     currency_id = fields.Many2one('res.currency', related='franchise_id.currency_id', readonly=True)
     notes = fields.Text(string='Notes')
 
-    def _get_default_name(self):
-        """Generar nombre por defecto: plan-mes-secuencia"""
-        today = fields.Date.context_today(self)
-        month_number = today.month
-        year = today.year
-        
-        # Contar planes existentes en el mes actual
-        existing_plans = self.env['gelroy.production.planning'].search_count([
-            ('planning_date', '>=', today.replace(day=1)),
-            ('planning_date', '<=', today.replace(day=1) + relativedelta(months=1, days=-1))
-        ])
-        
-        sequence = existing_plans + 1
-        return f"plan-{month_number}-{sequence}"
-
-    @api.model
-    def create(self, vals):
-        # Generar nombre basado en mes y secuencia
-        if not vals.get('name') or vals.get('name', '').strip() == '':
-            planning_date = vals.get('planning_date', fields.Date.context_today(self))
-            if isinstance(planning_date, str):
-                planning_date = fields.Date.from_string(planning_date)
-            
-            month_number = planning_date.month
-            
-            # Contar planes existentes en el mes
-            existing_plans = self.search_count([
-                ('planning_date', '>=', planning_date.replace(day=1)),
-                ('planning_date', '<=', planning_date.replace(day=1) + relativedelta(months=1, days=-1))
-            ])
-            
-            sequence = existing_plans + 1
-            vals['name'] = f"plan-{month_number}-{sequence}"
-        
-        return super().create(vals)
-
     @api.depends('planning_line_ids.estimated_quantity', 'planning_line_ids.recipe_cost')
     def _compute_totals(self):
         """Calcular totales de recetas, producciones y costos."""
@@ -197,53 +164,54 @@ class ProductionPlanning(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
-        """Sobrescribir create para generar nombres automáticamente"""
+        """Sobrescribir create para generar nombres automáticamente, en bloque por franquicia y mes"""
+        pending_by_period = {}
         for vals in vals_list:
-            if vals.get('name', 'New Production Planning') == 'New Production Planning':
-                vals['name'] = self._generate_planning_name(
-                    vals.get('franchise_id'), 
-                    vals.get('planning_date')
-                )
+            if vals.get('franchise_id') and vals.get('name', 'New Production Planning') == 'New Production Planning':
+                planning_date = fields.Date.to_date(vals.get('planning_date')) or fields.Date.context_today(self)
+                key = (vals['franchise_id'], planning_date.replace(day=1))
+                pending_by_period.setdefault(key, []).append(vals)
+        for (franchise_id, month_start), pending_vals in pending_by_period.items():
+            names = self._allocate_planning_names(franchise_id, month_start, len(pending_vals))
+            for vals, name in zip(pending_vals, names):
+                vals['name'] = name
         return super().create(vals_list)
 
     def write(self, vals):
-        # Regenerar nombre si cambia la franquicia o fecha
-        if 'franchise_id' in vals or 'planning_date' in vals:
+        # Renumerar solo si la planificación cambia de franquicia o de mes
+        renamed_plannings = {}
+        if ('franchise_id' in vals or 'planning_date' in vals) and 'name' not in vals:
             for planning in self:
-                franchise_id = vals.get('franchise_id', planning.franchise_id.id)
-                planning_date = vals.get('planning_date', planning.planning_date)
-                new_name = self._generate_planning_name(franchise_id, planning_date, exclude_id=planning.id)
-                vals['name'] = new_name
-        return super().write(vals)
+                franchise_id = vals.get('franchise_id') or planning.franchise_id.id
+                planning_date = fields.Date.to_date(vals.get('planning_date')) or planning.planning_date
+                month_start = planning_date.replace(day=1)
+                if (franchise_id, month_start) != (planning.franchise_id.id, planning.planning_date.replace(day=1)):
+                    renamed_plannings.setdefault((franchise_id, month_start), []).append(planning)
+        res = super().write(vals)
+        for (franchise_id, month_start), plannings in renamed_plannings.items():
+            names = self._allocate_planning_names(franchise_id, month_start, len(plannings))
+            for planning, name in zip(plannings, names):
+                super(ProductionPlanning, planning).write({'name': name})
+        return res
 
-    def _generate_planning_name(self, franchise_id, planning_date, exclude_id=None):
-        """Generar nombre de planificación basado en franquicia y fecha"""
-        if not franchise_id or not planning_date:
-            return "New Production Planning"
-        
+    def _allocate_planning_names(self, franchise_id, month_start, count=1):
+        """
+        Reserva 'count' nombres Plan-CODIGO-MES-NNN para la franquicia en el mes de month_start.
+        Usa la misma secuencia por franquicia que los pedidos (gelroy.franchise.sequence),
+        con un código por año y mes para que cada mes empiece de nuevo en 001.
+        """
         franchise = self.env['gelroy.franchise'].browse(franchise_id)
         franchise_code = franchise.franchise_code or 'F'
-        
-        # Obtener mes y año de la fecha de planificación
-        if isinstance(planning_date, str):
-            from datetime import datetime
-            planning_date = datetime.strptime(planning_date, '%Y-%m-%d').date()
-        
-        month_number = planning_date.month
-        
-        # Buscar planificaciones existentes para esa franquicia en el mismo mes
-        domain = [
-            ('franchise_id', '=', franchise_id),
-            ('planning_date', '>=', planning_date.replace(day=1)),
-            ('planning_date', '<=', planning_date.replace(day=1) + relativedelta(months=1, days=-1))
-        ]
-        if exclude_id:
-            domain.append(('id', '!=', exclude_id))
-        
-        existing_plannings = self.search(domain)
-        sequence = len(existing_plannings) + 1
-        
-        return f"Plan-{franchise_code}-{month_number}-{sequence:03d}"
+        month_end = month_start + relativedelta(months=1, days=-1)
+        sequence = self.env['gelroy.franchise.sequence'].sudo()
+        numbers = sequence._allocate(
+            franchise_id, f"{PLANNING_SEQUENCE_CODE}:{month_start:%Y-%m}", count,
+            seed=lambda: sequence._get_last_number(
+                self._table, franchise_id,
+                'planning_date BETWEEN %s AND %s', (month_start, month_end),
+            ),
+        )
+        return [f"Plan-{franchise_code}-{month_start.month}-{number:03d}" for number in numbers]
 
     def _check_completion(self):
         """Verificar si todas las órdenes de stock están entregadas para marcar como completed"""
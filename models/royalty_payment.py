@@ -1,7 +1,11 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+
+from .franchise import PENDING_ROYALTY_STATES, ROYALTY_KPI_SCOPE_FIELDS as KPI_SCOPE_FIELDS
+
+# Campos cuyo cambio altera el aporte del pago al resumen financiero de la franquicia
+FINANCIAL_SUMMARY_TRIGGER_FIELDS = {'state', 'franchise_id', 'period_revenue', 'calculated_amount', 'paid_amount'}
 
 class RoyaltyPayment(models.Model):
     _name = 'gelroy.royalty.payment'
@@ -23,6 +27,8 @@ class RoyaltyPayment(models.Model):
                                    required=True, tracking=True)
     period_start_date = fields.Date(string='Period Start Date', required=True, tracking=True)
     period_end_date = fields.Date(string='Period End Date', required=True, tracking=True)
+    period_key = fields.Char(string='Period', compute='_compute_period_key', store=True, precompute=True,
+                             help='Year and month of the period end (YYYY-MM): one royalty per franchise and month')
     payment_due_date = fields.Date(string='Due Date', compute='_compute_payment_due_date', 
                                    store=True, tracking=True)
     payment_date = fields.Date(string='Payment Date', tracking=True)
@@ -53,6 +59,17 @@ class RoyaltyPayment(models.Model):
     
     # Información adicional
     notes = fields.Text(string='Additional Notes')
+    royalty_run_id = fields.Many2one('gelroy.royalty.run', string='Royalty Run', readonly=True,
+                                     index=True, ondelete='set null', copy=False)
+
+    # Una regalía por franquicia y mes (sin contar las canceladas), garantizada por la base de datos
+    _sql_constraints = [
+        ('unique_monthly_payment',
+         "EXCLUDE (franchise_id WITH =, period_key WITH =) WHERE (state != 'cancelled')",
+         'A royalty calculation already exists for this franchise in this month. '
+         'Only one calculation per month is allowed.'),
+    ]
+
     invoice_count = fields.Integer(string='Invoice Count', compute='_compute_invoice_count')
 
     @api.depends('franchise_id', 'period_end_date')
@@ -66,6 +83,12 @@ class RoyaltyPayment(models.Model):
             else:
                 payment.name = "New Royalty Payment"
 
+    @api.depends('period_end_date')
+    def _compute_period_key(self):
+        """Clave del mes del pago (YYYY-MM) sobre la que se garantiza la unicidad"""
+        for payment in self:
+            payment.period_key = payment.period_end_date.strftime('%Y-%m') if payment.period_end_date else False
+
     @api.depends('period_end_date', 'franchise_id.royalty_payment_terms')
     def _compute_payment_due_date(self):
         """Genera automáticamente la fecha de vencimiento del pago"""
@@ -97,8 +120,6 @@ class RoyaltyPayment(models.Model):
         for payment in self:
             if payment.payment_due_date and payment.payment_due_date < today:
                 payment.days_overdue = (today - payment.payment_due_date).days
-                if payment.state == 'confirmed':
-                    payment.state = 'overdue'
             else:
                 payment.days_overdue = 0
 
@@ -246,28 +267,6 @@ class RoyaltyPayment(models.Model):
             if payment.period_revenue < 0:
                 raise ValidationError("The period revenue cannot be negative.")
 
-    @api.constrains('franchise_id', 'period_end_date')
-    def _check_unique_monthly_payment(self):
-        """Verifica que no haya pagos de regalías duplicados para el mismo mes y franquicia"""
-        for payment in self:
-            if payment.franchise_id and payment.period_end_date:
-                month_start = payment.period_end_date.replace(day=1)
-                month_end = month_start + relativedelta(months=1)
-                
-                existing = self.search([
-                    ('id', '!=', payment.id),
-                    ('franchise_id', '=', payment.franchise_id.id),
-                    ('period_end_date', '>=', month_start),
-                    ('period_end_date', '<', month_end)
-                ])
-                
-                if existing:
-                    period_str = payment.period_end_date.strftime('%Y-%m')
-                    raise ValidationError(
-                        f"A royalty calculation already exists for this franchise in {period_str}. "
-                        "Only one calculation per month is allowed."
-                    )
-
     def unlink(self):
         """Sobrescribe el método unlink para validar facturas asociadas antes de eliminar pagos de regalías"""
         for payment in self:
@@ -295,40 +294,81 @@ class RoyaltyPayment(models.Model):
                     if draft_invoices:
                         draft_invoices.unlink()
     
-        return super().unlink()
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        contributions = self._get_financial_contributions()
+        self.env['gelroy.debt.ledger']._sync_documents(self, removed=True)
+        res = super().unlink()
+        self.env['gelroy.franchise']._apply_financial_summary_deltas(contributions, [])
+        return res
 
-    @api.model
-    def check_overdue_payments(self):
-        """Verifica y actualiza el estado de los pagos de regalías que están atrasados."""
-        today = fields.Date.today()
-        
-        overdue_candidates = self.search([
-            ('state', '=', 'confirmed'),
-            ('payment_due_date', '<', today),
-            ('outstanding_amount', '>', 0)
-        ])
-        
-        for payment in overdue_candidates:
-            payment.write({'state': 'overdue'})
-        
-        return len(overdue_candidates)
-
-    def read(self, fields_list=None, load='_classic_read'):
-        """Marcar como overdue los pagos al leer registros."""
-        result = super().read(fields_list, load)
-        
-        # Solo verificar overdue si no estamos en proceso de instalación
-        if not self.env.context.get('install_mode'):
-            from datetime import date
-            today = date.today()
-            for payment in self:
-                if (payment.state == 'confirmed' and 
-                    payment.payment_due_date and 
-                    payment.payment_due_date < today):
-                    payment.with_context(skip_overdue_check=True).write({'state': 'overdue'})
-        
-        return result
+    @api.model_create_multi
+    def create(self, vals_list):
+        payments = super().create(vals_list)
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(payments, KPI_SCOPE_FIELDS)
+        self.env['gelroy.franchise']._apply_financial_summary_deltas([], payments._get_financial_contributions())
+        self.env['gelroy.debt.ledger']._sync_documents(payments)
+        return payments
 
+    def write(self, vals):
+        """
+        Invalida la caché de KPIs del ámbito anterior y del nuevo.
+        """
+        engine = self.env['gelroy.kpi.engine']
+        engine._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        # Aporte al resumen financiero de la franquicia antes del cambio (se aplica solo el delta)
+        summary_changed = bool(FINANCIAL_SUMMARY_TRIGGER_FIELDS.intersection(vals))
+        contributions_before = self._get_financial_contributions() if summary_changed else []
+        res = super().write(vals)
+        if summary_changed:
+            self.env['gelroy.franchise']._apply_financial_summary_deltas(
+                contributions_before, self._get_financial_contributions(),
+            )
+            self.env['gelroy.debt.ledger']._sync_documents(self)
+        if any(field_name in vals for field_name in ('franchise_id',) + KPI_SCOPE_FIELDS):
+            engine._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        return res
 
+    def _get_financial_contributions(self):
+        """Aporte de cada pago al resumen financiero de su franquicia: [(franchise_id, {campo: valor})]"""
+        contributions = []
+        for payment in self.filtered('franchise_id'):
+            pending = payment.state in PENDING_ROYALTY_STATES
+            outstanding = payment.outstanding_amount if payment.state != 'paid' else 0.0
+            contributions.append((payment.franchise_id.id, {
+                'total_royalties_due': payment.calculated_amount if pending else 0.0,
+                'total_royalties_paid': payment.paid_amount,
+                'outstanding_royalties': outstanding,
+                'total_outstanding_debt': outstanding,
+                'pending_royalty_payments': 1 if pending else 0,
+            }))
+        return contributions
 
+    def _get_debt_ledger_values(self, history=False):
+        """
+        Deuda de cada pago para el libro de deuda (gelroy.debt.ledger): {id: valores}.
+        Adeuda el saldo pendiente de los pagos calculados, confirmados o vencidos; con
+        history=True solo se devuelven los que generaron deuda alguna vez.
+        """
+        values = {}
+        for payment in self.filtered('franchise_id'):
+            pending = payment.state in PENDING_ROYALTY_STATES
+            settled = payment.state == 'paid'
+            if history and not (pending or settled):
+                continue
+            values[payment.id] = {
+                'franchise_id': payment.franchise_id.id,
+                'name': payment.name,
+                'amount': payment.outstanding_amount if pending else 0.0,
+                'due_date': payment.payment_due_date,
+                'debit_event': 'royalty_calculated',
+                'settled': settled,
+                'debit_amount': payment.calculated_amount if settled else payment.outstanding_amount,
+                'debit_date': payment.calculation_date,
+                'credit_date': payment.payment_date,
+            }
+        return values
 
+    @api.model
+    def check_overdue_payments(self):
+        """Verifica y actualiza el estado de los pagos de regalías que están atrasados."""
+        return len(self.env['gelroy.overdue.engine']._sweep_model(self._name))
@@ -0,0 +1,259 @@
+import ast
+import logging
+import time
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+
+_logger = logging.getLogger(__name__)
+
+# Parámetro con el tamaño de bloque por defecto (franquicias calculadas por commit)
+ROYALTY_RUN_CHUNK_PARAM = 'gelroy.royalty_run_chunk_size'
+ROYALTY_RUN_DEFAULT_CHUNK = 500
+
+
+class RoyaltyRun(models.Model):
+    _name = 'gelroy.royalty.run'
+    _description = 'Royalty Run'
+    _order = 'period_start_date desc, id desc'
+    _inherit = ['mail.thread']
+
+    name = fields.Char(string='Run Reference', compute='_compute_name', store=True)
+    period_start_date = fields.Date(string='Period Start Date', required=True, tracking=True)
+    period_end_date = fields.Date(string='Period End Date', required=True, tracking=True)
+    franchise_domain = fields.Char(string='Franchises', required=True, default="[('active', '=', True)]",
+                                   help='Domain of the franchises included in the run.')
+    chunk_size = fields.Integer(string='Chunk Size', required=True,
+                                default=lambda self: self._default_chunk_size(),
+                                help='Franchises calculated and committed per step; a failure only '
+                                     'rolls back the current chunk.')
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='draft', required=True, readonly=True, tracking=True)
+
+    # Punto de control: las franquicias se procesan por id creciente
+    last_franchise_id = fields.Integer(string='Checkpoint', readonly=True, copy=False,
+                                       help='Last franchise id processed; a resumed run continues after it.')
+    line_ids = fields.One2many('gelroy.royalty.run.line', 'run_id', string='Results', readonly=True)
+    payment_ids = fields.One2many('gelroy.royalty.payment', 'royalty_run_id', string='Royalty Payments', readonly=True)
+
+    # Tiempos
+    date_started = fields.Datetime(string='Started', readonly=True, copy=False)
+    date_finished = fields.Datetime(string='Finished', readonly=True, copy=False)
+    duration = fields.Float(string='Duration (s)', digits=(12, 3), readonly=True, copy=False,
+                            help='Processing time accumulated over all the chunks')
+    last_error = fields.Text(string='Last Error', readonly=True, copy=False)
+
+    created_count = fields.Integer(string='Payments Created', compute='_compute_result_counts')
+    skipped_count = fields.Integer(string='Skipped', compute='_compute_result_counts')
+    error_count = fields.Integer(string='Errors', compute='_compute_result_counts')
+
+    _sql_constraints = [
+        ('chunk_size_positive', 'CHECK(chunk_size > 0)', 'The chunk size must be positive.'),
+    ]
+
+    @api.model
+    def _default_chunk_size(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            ROYALTY_RUN_CHUNK_PARAM, ROYALTY_RUN_DEFAULT_CHUNK,
+        ))
+
+    @api.depends('period_end_date')
+    def _compute_name(self):
+        for run in self:
+            run.name = _("Royalty Run %s") % (run.period_end_date.strftime('%Y-%m') if run.period_end_date else '/')
+
+    @api.depends('line_ids.result')
+    def _compute_result_counts(self):
+        counts = {(run.id, result): count for run, result, count in self.env['gelroy.royalty.run.line']._read_group(
+            [('run_id', 'in', self.ids)], ['run_id', 'result'], ['__count'],
+        )}
+        for run in self:
+            run.created_count = counts.get((run.id, 'created'), 0)
+            run.skipped_count = sum(counts.get((run.id, result), 0)
+                                    for result in ('duplicate', 'no_rate', 'no_revenue'))
+            run.error_count = counts.get((run.id, 'error'), 0)
+
+    @api.constrains('period_start_date', 'period_end_date')
+    def _check_period_dates(self):
+        for run in self:
+            if run.period_start_date >= run.period_end_date:
+                raise ValidationError(_("The period end date must be after the start date."))
+
+    @api.constrains('franchise_domain')
+    def _check_franchise_domain(self):
+        for run in self:
+            try:
+                self.env['gelroy.franchise'].search_count(run._get_franchise_domain())
+            except (ValueError, SyntaxError):
+                raise ValidationError(_("Invalid franchise domain: %s") % run.franchise_domain)
+
+    def _get_franchise_domain(self):
+        self.ensure_one()
+        return ast.literal_eval(self.franchise_domain or '[]')
+
+    def action_start(self):
+        """Encolar la corrida: la procesa la acción planificada en bloques"""
+        if any(run.state not in ('draft', 'failed') for run in self):
+            raise UserError(_("Only draft or failed royalty runs can be started."))
+        self.filtered(lambda run: not run.date_started).write({'date_started': fields.Datetime.now()})
+        self.write({'state': 'running', 'last_error': False})
+        self.env.ref('gelroy.ir_cron_process_royalty_runs')._trigger()
+        return True
+
+    def action_resume(self):
+        """Reanudar una corrida fallida después del último bloque confirmado"""
+        return self.action_start()
+
+    def action_view_payments(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Royalty Payments'),
+            'view_mode': 'tree,form',
+            'res_model': 'gelroy.royalty.payment',
+            'domain': [('royalty_run_id', '=', self.id)],
+            'target': 'current',
+        }
+
+    def _process(self, auto_commit=False):
+        """
+        Calcula las regalías del período en bloques de chunk_size franquicias (por id creciente).
+        Cada bloque se confirma y avanza el punto de control (last_franchise_id); un error
+        solo deshace el bloque en curso y al reanudar se continúa desde el punto de control.
+        """
+        self.ensure_one()
+        Franchise = self.env['gelroy.franchise']
+        domain = self._get_franchise_domain()
+        while True:
+            franchises = Franchise.search(domain + [('id', '>', self.last_franchise_id)],
+                                          order='id', limit=self.chunk_size)
+            if not franchises:
+                break
+            started = time.monotonic()
+            try:
+                lines = self._run_chunk(franchises)
+            except Exception as error:
+                if not auto_commit:
+                    raise
+                self.env.cr.rollback()
+                _logger.exception("Royalty run %s failed", self.name)
+                self.write({'state': 'failed', 'last_error': str(error)})
+                self.env.cr.commit()
+                return False
+            self.write({
+                'last_franchise_id': franchises[-1].id,
+                'duration': self.duration + time.monotonic() - started,
+            })
+            _logger.info("Royalty run %s: %s franchises processed", self.name, len(lines))
+            if auto_commit:
+                self.env.cr.commit()
+        self.write({'state': 'done', 'date_finished': fields.Datetime.now()})
+        self.message_post(body=_("Royalty run completed: %s payments created, %s skipped, %s errors.") % (
+            self.created_count, self.skipped_count, self.error_count))
+        if auto_commit:
+            self.env.cr.commit()
+        return True
+
+    def _run_chunk(self, franchises):
+        """
+        Calcula un bloque de franquicias en una pasada:
+        - Una consulta detecta las franquicias que ya tienen pago en el mes (period_key);
+          la restricción de la base de datos cubre igualmente las creaciones concurrentes
+        - Todos los pagos se crean con un solo create() y los resultados con otro
+        """
+        self.ensure_one()
+        Payment = self.env['gelroy.royalty.payment']
+        existing = {franchise.id for [franchise] in Payment._read_group(
+            [
+                ('franchise_id', 'in', franchises.ids),
+                ('period_key', '=', self.period_end_date.strftime('%Y-%m')),
+                ('state', '!=', 'cancelled'),
+            ],
+            ['franchise_id'],
+        )}
+
+        line_vals_list = []
+        payment_vals_list = []
+        for franchise in franchises:
+            line_vals = {
+                'run_id': self.id,
+                'franchise_id': franchise.id,
+                'sales_basis': franchise.monthly_revenue,
+                'royalty_rate': franchise.royalty_fee_percentage,
+            }
+            if franchise.id in existing:
+                line_vals['result'] = 'duplicate'
+            elif franchise.royalty_fee_percentage <= 0:
+                line_vals['result'] = 'no_rate'
+            elif franchise.monthly_revenue <= 0:
+                line_vals['result'] = 'no_revenue'
+            elif not franchise.currency_id:
+                line_vals.update(result='error', message=_("The franchise has no currency."))
+            else:
+                line_vals['result'] = 'created'
+                payment_vals_list.append(dict(
+                    franchise._prepare_royalty_payment_vals(
+                        self.period_start_date, self.period_end_date, franchise.monthly_revenue,
+                    ),
+                    royalty_run_id=self.id,
+                ))
+            line_vals_list.append(line_vals)
+
+        payments = iter(Payment.create(payment_vals_list))
+        now = fields.Datetime.now()
+        for line_vals in line_vals_list:
+            line_vals['processed_at'] = now
+            if line_vals['result'] == 'created':
+                payment = next(payments)
+                line_vals.update(payment_id=payment.id, royalty_amount=payment.calculated_amount)
+        return self.env['gelroy.royalty.run.line'].create(line_vals_list)
+
+    @api.model
+    def _cron_process_runs(self):
+        """Acción planificada: procesar las corridas en curso, confirmando cada bloque"""
+        for run in self.search([('state', '=', 'running')]):
+            run._process(auto_commit=True)
+        return True
+
+    @api.model
+    def _cron_monthly_run(self):
+        """Acción planificada: corrida del mes anterior para todas las franquicias activas"""
+        period_end = fields.Date.context_today(self).replace(day=1) - relativedelta(days=1)
+        if self.search_count([('period_end_date', '=', period_end)]):
+            return True
+        run = self.create({
+            'period_start_date': period_end.replace(day=1),
+            'period_end_date': period_end,
+        })
+        run.action_start()
+        return True
+
+
+class RoyaltyRunLine(models.Model):
+    _name = 'gelroy.royalty.run.line'
+    _description = 'Royalty Run Result'
+    _order = 'run_id, franchise_id'
+
+    run_id = fields.Many2one('gelroy.royalty.run', string='Royalty Run', required=True,
+                             index=True, ondelete='cascade')
+    franchise_id = fields.Many2one('gelroy.franchise', string='Franchise', required=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', related='franchise_id.currency_id', readonly=True)
+    result = fields.Selection([
+        ('created', 'Payment Created'),
+        ('duplicate', 'Already Calculated'),
+        ('no_rate', 'No Royalty Rate'),
+        ('no_revenue', 'No Revenue'),
+        ('error', 'Error'),
+    ], string='Result', required=True)
+    sales_basis = fields.Monetary(string='Sales Basis')
+    royalty_rate = fields.Float(string='Royalty Rate (%)')
+    royalty_amount = fields.Monetary(string='Royalty Amount')
+    payment_id = fields.Many2one('gelroy.royalty.payment', string='Royalty Payment', ondelete='set null')
+    message = fields.Char(string='Message')
+    processed_at = fields.Datetime(string='Processed At')
@@ -1,7 +1,22 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError, ValidationError
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+from .debt_ledger import DEBT_STOCK_STATES
+
+# Código de la secuencia por franquicia de los pedidos (ver gelroy.franchise.sequence)
+ORDER_SEQUENCE_CODE = 'stock_order'
+
+# Orden de atención de la aprobación masiva: menor rango primero, luego fecha del pedido
+APPROVAL_PRIORITY_RANK = {'emergency': 0, 'urgent': 1, 'normal': 2}
+
+# Campos cuyo cambio altera el aporte del pedido al resumen financiero de la franquicia
+FINANCIAL_SUMMARY_TRIGGER_FIELDS = {'state', 'franchise_id', 'order_line_ids'}
+
+# Campos de fecha que delimitan el ámbito de la caché de KPIs
+KPI_SCOPE_FIELDS = ('order_date',)
+
 class StockOrder(models.Model):
     _name = 'gelroy.stock.order'
     _description = 'Franchise Stock Order'
@@ -73,6 +88,17 @@ class StockOrder(models.Model):
                                    help="Date when payment is due")
     days_overdue = fields.Integer(string='Days Overdue', compute='_compute_days_overdue', store=True)
     outstanding_amount = fields.Monetary(string='Outstanding Amount', compute='_compute_outstanding_amount', store=True)
+    # Facturas vinculadas directamente (recalculan el pendiente al cobrarse, también parcialmente)
+    invoice_ids = fields.One2many('account.move', 'stock_order_id', string='Linked Invoices', readonly=True)
+    # Facturas que cubren el pedido, incluidas las consolidadas por período
+    covering_invoice_ids = fields.Many2many('account.move', 'gelroy_stock_order_invoice_rel', 'order_id', 'move_id',
+                                            string='Covering Invoices', readonly=True, copy=False)
+    # Stock reservado al aprobar, hasta el envío o la cancelación
+    reservation_ids = fields.One2many('gelroy.stock.reservation', 'order_id', string='Stock Reservations',
+                                      readonly=True)
+    # Albaranes de salida generados al enviar el pedido
+    picking_ids = fields.One2many('stock.picking', 'stock_order_id', string='Transfers', readonly=True)
+    picking_count = fields.Integer(string='Transfers', compute='_compute_picking_count')
 
     @api.depends('order_line_ids.price_subtotal', 'order_line_ids.price_tax', 'order_line_ids.price_total')
     def _compute_totals(self):
@@ -157,14 +183,17 @@ class StockOrder(models.Model):
             order.message_post(body=_("Order submitted for approval."))
 
     def action_approve(self):
-        """Approves the order"""
+        """Approves the orders and reserves their stock"""
+        # Disponible = stock a mano en la ubicación de salida menos lo ya reservado allí por otros pedidos
+        Reservation = self.env['gelroy.stock.reservation'].sudo()
+        location = self._get_transit_source_location()
+        available_by_product = Reservation._get_unreserved_quantities(self.order_line_ids.product_id, location)
         for order in self:
             # Verificar stock antes de aprobar
             insufficient_stock = []
             
             for line in order.order_line_ids:
-                # Obtener la cantidad disponible del producto
-                available_qty = line.product_id.qty_available
+                available_qty = available_by_product[line.product_id.id]
                 
                 if available_qty < line.quantity:
                     insufficient_stock.append({
@@ -173,6 +202,8 @@ class StockOrder(models.Model):
                         'available': available_qty,
                         'missing': line.quantity - available_qty
                     })
+                else:
+                    available_by_product[line.product_id.id] -= line.quantity
             
             # Si hay productos sin stock suficiente, mostrar error
             if insufficient_stock:
@@ -186,30 +217,101 @@ class StockOrder(models.Model):
                     )
                 raise UserError(error_msg)
             
-            # Si todo está bien, aprobar el pedido
-            order.write({
+        # Si todo está bien, aprobar los pedidos y reservar su stock
+        self.write({
+            'state': 'approved',
+            'approved_by': self.env.user.id,
+            'approved_date': fields.Date.today(),
+        })
+        Reservation._reserve(self, location)
+        for order in self:
+            order.message_post(body=_("Order approved by %s.") % self.env.user.name)
+
+    def _bulk_approve(self):
+        """
+        Aprueba en bloque los pedidos enviados de self que entran en el stock disponible.
+        - La demanda de todas las líneas se suma por producto y el stock libre (a mano menos
+          reservado) se lee una sola vez; los aprobados reservan su demanda
+        - Los pedidos se atienden por prioridad (emergency > urgent > normal), luego por
+          fecha del pedido: cada uno consume stock solo si todas sus líneas entran
+        - Los aprobados se escriben en un único write()
+        Devuelve una lista por pedido: {'order': registro, 'approved': bool, 'reason': texto}.
+        """
+        candidates = self.filtered(lambda order: order.state == 'submitted').sorted(
+            lambda order: (APPROVAL_PRIORITY_RANK.get(order.priority, len(APPROVAL_PRIORITY_RANK)),
+                           order.order_date, order.id)
+        )
+        report = [{
+            'order': order,
+            'approved': False,
+            'reason': _("Order is in state '%s', only submitted orders can be approved.") % order.state,
+        } for order in self - candidates]
+
+        # Demanda por pedido y producto, y stock disponible de todos los productos en una lectura
+        demand_by_order = defaultdict(lambda: defaultdict(float))
+        for order, product, quantity in self.env['gelroy.stock.order.line']._read_group(
+            [('order_id', 'in', candidates.ids)], ['order_id', 'product_id'], ['quantity:sum'],
+        ):
+            demand_by_order[order.id][product] += quantity
+        products = self.env['product.product'].browse(
+            {product.id for demand in demand_by_order.values() for product in demand}
+        )
+        Reservation = self.env['gelroy.stock.reservation'].sudo()
+        location = self._get_transit_source_location()
+        available_by_product = Reservation._get_unreserved_quantities(products, location)
+
+        approved_orders = self.browse()
+        for order in candidates:
+            demand = demand_by_order[order.id]
+            shortages = [
+                _("%s: Requested %s, Available %s (Missing %s)") % (
+                    product.display_name, quantity, available_by_product[product.id],
+                    quantity - available_by_product[product.id],
+                )
+                for product, quantity in demand.items()
+                if available_by_product[product.id] < quantity
+            ]
+            if shortages:
+                report.append({
+                    'order': order,
+                    'approved': False,
+                    'reason': _("Insufficient stock:\n%s") % '\n'.join(shortages),
+                })
+                continue
+            for product, quantity in demand.items():
+                available_by_product[product.id] -= quantity
+            approved_orders |= order
+            report.append({'order': order, 'approved': True, 'reason': False})
+
+        if approved_orders:
+            approved_orders.write({
                 'state': 'approved',
                 'approved_by': self.env.user.id,
                 'approved_date': fields.Date.today(),
             })
-            order.message_post(body=_("Order approved by %s.") % self.env.user.name)
+            Reservation._reserve(approved_orders, location)
+            for order in approved_orders:
+                order.message_post(body=_("Order approved by %s (bulk approval).") % self.env.user.name)
+        return report
 
     def action_start_transit(self):
-        """Marks the order as in transit and deducts stock directly"""
+        """Marks the orders as in transit and ships them with one validated picking per order"""
+        if any(order.state != 'approved' for order in self):
+            raise UserError(_("Only approved orders can be put in transit."))
+
+        stock_lines = self.order_line_ids.filtered(lambda line: line.product_id.detailed_type == 'product')
+
+        # VERIFICAR STOCK ANTES DE ENVIAR (acumulado entre los pedidos del lote).
+        # Lo reservado por estos mismos pedidos al aprobarlos sí está disponible para ellos
+        Reservation = self.env['gelroy.stock.reservation'].sudo()
+        available_by_product = Reservation._get_unreserved_quantities(
+            stock_lines.product_id, self._get_transit_source_location(), exclude_orders=self,
+        )
         for order in self:
-            if order.state != 'approved':
-                raise UserError(_("Only approved orders can be put in transit."))
-            
-            # VERIFICAR STOCK ANTES DE DESCONTAR
             insufficient_stock = []
-            
-            for line in order.order_line_ids:
-                # Solo verificar productos almacenables
-                if line.product_id.detailed_type != 'product':
-                    continue  # Saltar servicios y consumibles
-                
-                available_qty = line.product_id.qty_available
-                
+            order_lines = stock_lines.filtered(lambda line: line.order_id == order)
+            for line in order_lines:
+                available_qty = available_by_product[line.product_id.id]
                 if available_qty < line.quantity:
                     insufficient_stock.append({
                         'product_name': line.product_id.name,
@@ -218,7 +320,7 @@ class StockOrder(models.Model):
                         'available': available_qty,
                         'missing': line.quantity - available_qty
                     })
-            
+
             # Si hay productos sin stock suficiente, mostrar error
             if insufficient_stock:
                 error_msg = _("Cannot put in transit. Insufficient stock for the following products:\n")
@@ -231,95 +333,109 @@ class StockOrder(models.Model):
                         item['missing']
                     )
                 raise UserError(error_msg)
-            
-            products_shipped = []
-            
-            for line in order.order_line_ids:
-                # Solo procesar productos almacenables
-                if line.product_id.detailed_type != 'product':
-                    continue
-                
-                product = line.product_id
-                
-                try:
-                    # BUSCAR UBICACIÓN DE STOCK INTERNO 
-                    stock_location = self.env['stock.location'].search([
-                        ('usage', '=', 'internal'),
-                        ('company_id', '=', self.env.company.id)
-                    ], limit=1)
-                    
-                    if not stock_location:
-                        # Intentar con la ubicación por defecto
-                        stock_location = self.env.ref('stock.stock_location_stock', raise_if_not_found=False)
-                    
-                    if not stock_location:
-                        raise UserError(_("No internal stock location found for company %s") % self.env.company.name)
-                    
-                    # BUSCAR QUANT
-                    quant = self.env['stock.quant'].search([
-                        ('product_id', '=', product.id),
-                        ('location_id', '=', stock_location.id),
-                        ('company_id', '=', self.env.company.id)
-                    ], limit=1)
-                    
-                    if quant:
-                        # ACTUALIZAR CANTIDAD EXISTENTE
-                        old_qty = quant.quantity
-                        new_qty = old_qty - line.quantity
-                        
-                        quant.sudo().write({'quantity': new_qty})
-                        
-                        products_shipped.append({
-                            'name': product.name,
-                            'code': product.default_code or '',
-                            'shipped': line.quantity,
-                            'old_stock': old_qty,
-                            'new_stock': new_qty
-                        })
-                        
-                    else:
-                        self.env['stock.quant'].sudo().create({
-                            'product_id': product.id,
-                            'location_id': stock_location.id,
-                            'quantity': -line.quantity,
-                            'company_id': self.env.company.id,
-                        })
-                        
-                        products_shipped.append({
-                            'name': product.name,
-                            'code': product.default_code or '',
-                            'shipped': line.quantity,
-                            'old_stock': 0,
-                            'new_stock': -line.quantity
-                        })
-                
-                except Exception as e:
-                    raise UserError(_(
-                        "Error updating stock for product %s: %s"
-                    ) % (product.name, str(e)))
-            
-            # ACTUALIZAR ESTADO
-            order.write({
-                'state': 'in_transit',
-                'shipped_date': fields.Date.today(),
-            })
-            
-            # CREAR MENSAJE 
-            if products_shipped:
-                message_lines = [_("Order in transit. Stock deducted from stock.quant:")]
-                for item in products_shipped:
-                    code_part = f" ({item['code']})" if item['code'] else ""
+
+            for line in order_lines:
+                available_by_product[line.product_id.id] -= line.quantity
+
+        # ENVIAR: albaranes de salida con sus movimientos, confirmados y validados en lote
+        self._create_shipment_pickings(stock_lines)
+        Reservation._consume(self)
+
+        # ACTUALIZAR ESTADO
+        self.write({
+            'state': 'in_transit',
+            'shipped_date': fields.Date.today(),
+        })
+
+        # CREAR MENSAJE 
+        for order in self:
+            picking = order.picking_ids[-1:]
+            if picking:
+                message_lines = [_("Order in transit. Shipped with transfer %s:") % picking.name]
+                for move in picking.move_ids:
+                    code_part = f" ({move.product_id.default_code})" if move.product_id.default_code else ""
                     message_lines.append(
-                        f"• {item['name']}{code_part}: {item['old_stock']} → {item['new_stock']} "
-                        f"(shipped: {item['shipped']})"
+                        f"• {move.product_id.name}{code_part}: {move.quantity} {move.product_uom.name}"
                     )
                 
                 message = '\n'.join(message_lines)
             else:
-                message = _("Order in transit. No physical products to deduct from stock.")
+                message = _("Order in transit. No physical products to ship.")
             
             order.message_post(body=message)
 
+    def _get_shipment_picking_type(self):
+        """Tipo de operación de salida de la compañía usado para enviar los pedidos"""
+        picking_type = self.env['stock.picking.type'].search([
+            ('code', '=', 'outgoing'),
+            ('company_id', '=', self.env.company.id),
+        ], limit=1)
+        if not picking_type:
+            raise UserError(_("No outgoing operation type found for company %s") % self.env.company.name)
+        return picking_type
+
+    def _get_transit_source_location(self):
+        """Ubicación interna de la compañía desde la que salen los pedidos (una búsqueda por lote)"""
+        stock_location = self._get_shipment_picking_type().default_location_src_id
+        
+        if not stock_location:
+            stock_location = self.env['stock.location'].search([
+                ('usage', '=', 'internal'),
+                ('company_id', '=', self.env.company.id)
+            ], limit=1)
+        
+        if not stock_location:
+            # Intentar con la ubicación por defecto
+            stock_location = self.env.ref('stock.stock_location_stock', raise_if_not_found=False)
+        
+        if not stock_location:
+            raise UserError(_("No internal stock location found for company %s") % self.env.company.name)
+        return stock_location
+
+    def _create_shipment_pickings(self, stock_lines):
+        """
+        Crea un albarán de salida por pedido con sus stock.move y los valida todos juntos:
+        - Un solo create() para todos los albaranes y movimientos del lote
+        - action_confirm / action_assign / _action_done sobre el conjunto, de modo que el
+          stock se descuenta con el motor de inventario (quants bloqueados, valoración,
+          trazabilidad) y no con escrituras directas en stock.quant
+        Si algún movimiento no puede reservarse completo, no se envía nada.
+        """
+        if not stock_lines:
+            return self.env['stock.picking']
+        picking_type = self._get_shipment_picking_type()
+        source_location = self._get_transit_source_location()
+        destination_location = (picking_type.default_location_dest_id
+                                or self.env.ref('stock.stock_location_customers'))
+
+        pickings = self.env['stock.picking'].sudo().create([{
+            'picking_type_id': picking_type.id,
+            'partner_id': order.franchisee_id.id,
+            'origin': order.name,
+            'stock_order_id': order.id,
+            'location_id': source_location.id,
+            'location_dest_id': destination_location.id,
+            'move_ids': [Command.create({
+                'name': line.product_id.display_name,
+                'product_id': line.product_id.id,
+                'product_uom_qty': line.quantity,
+                'product_uom': line.product_uom_id.id,
+                'location_id': source_location.id,
+                'location_dest_id': destination_location.id,
+            }) for line in stock_lines if line.order_id == order],
+        } for order in stock_lines.order_id])
+
+        pickings.action_confirm()
+        pickings.action_assign()
+        unavailable_moves = pickings.move_ids.filtered(lambda move: move.state != 'assigned')
+        if unavailable_moves:
+            raise UserError(_("Cannot put in transit. Stock could not be reserved for:\n%s") % '\n'.join(
+                f"• {move.product_id.display_name} ({move.picking_id.origin})" for move in unavailable_moves
+            ))
+        pickings.move_ids.picked = True
+        pickings._action_done()
+        return pickings
+
     def action_deliver(self):
         """Marks the order as delivered"""
         for order in self:
@@ -357,12 +473,14 @@ class StockOrder(models.Model):
                 raise UserError(_("Cannot cancel an order that has been delivered or paid."))
             order.state = 'cancelled'
             order.message_post(body=_("Order cancelled."))
+        self.env['gelroy.stock.reservation'].sudo()._release(self)
 
     def action_reset_to_draft(self):
         """Resets the order to draft"""
         for order in self:
             order.state = 'draft'
             order.message_post(body=_("Order reset to draft."))
+        self.env['gelroy.stock.reservation'].sudo()._release(self)
 
     @api.constrains('requested_delivery_date', 'order_date')
     def _check_delivery_date(self):
@@ -373,13 +491,20 @@ class StockOrder(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
+        # Numerar en bloque: una reserva en la secuencia por franquicia, no por pedido
+        pending_by_franchise = defaultdict(list)
         for vals in vals_list:
-            if vals.get('name', 'New Stock Order') == 'New Stock Order':
-                vals['name'] = self._generate_order_name(
-                    vals.get('franchise_id'), 
-                    vals.get('order_date')
-                )
-        return super().create(vals_list)
+            if vals.get('franchise_id') and vals.get('name', 'New Stock Order') == 'New Stock Order':
+                pending_by_franchise[vals['franchise_id']].append(vals)
+        for franchise_id, pending_vals in pending_by_franchise.items():
+            names = self._allocate_order_names(franchise_id, len(pending_vals))
+            for vals, name in zip(pending_vals, names):
+                vals['name'] = name
+        orders = super().create(vals_list)
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(orders, KPI_SCOPE_FIELDS)
+        self.env['gelroy.franchise']._apply_financial_summary_deltas([], orders._get_financial_contributions())
+        self.env['gelroy.debt.ledger']._sync_documents(orders)
+        return orders
 
     def write(self, vals):
         """Override write to prevent modifications in certain states"""
@@ -422,105 +547,282 @@ class StockOrder(models.Model):
                         "Cannot modify order lines. Order '%s' is in state '%s' and is locked for modifications."
                     ) % (order.name, order.state))
         
-        # Regenerar nombre si cambia la franquicia o fecha (solo en draft/submitted)
-        if ('franchise_id' in vals or 'order_date' in vals) and not any(
-            order.state in ['approved', 'in_transit', 'delivered', 'overdue', 'paid'] 
-            for order in self
-        ):
-            for order in self:
-                franchise_id = vals.get('franchise_id', order.franchise_id.id)
-                order_date = vals.get('order_date', order.order_date)
-                new_name = self._generate_order_name(franchise_id, order_date, exclude_id=order.id)
-                vals['name'] = new_name
+        # Renumerar solo si cambia la franquicia (el nombre no depende de la fecha).
+        # El número anterior no se libera: la secuencia nunca reutiliza números
+        renamed_orders = self.browse()
+        if vals.get('franchise_id') and 'name' not in vals:
+            renamed_orders = self.filtered(lambda order: order.franchise_id.id != vals['franchise_id'])
         
-        return super().write(vals)
+        # Invalidar la caché de KPIs del ámbito anterior y, si cambia, del nuevo
+        engine = self.env['gelroy.kpi.engine']
+        engine._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        # Aporte al resumen financiero de la franquicia antes del cambio (se aplica solo el delta)
+        summary_changed = bool(FINANCIAL_SUMMARY_TRIGGER_FIELDS.intersection(vals))
+        contributions_before = self._get_financial_contributions() if summary_changed else []
+        res = super().write(vals)
+        if summary_changed:
+            self.env['gelroy.franchise']._apply_financial_summary_deltas(
+                contributions_before, self._get_financial_contributions(),
+            )
+            self.env['gelroy.debt.ledger']._sync_documents(self)
+        if renamed_orders:
+            names = self._allocate_order_names(vals['franchise_id'], len(renamed_orders))
+            for order, name in zip(renamed_orders, names):
+                super(StockOrder, order).write({'name': name})
+        if 'franchise_id' in vals or 'order_date' in vals:
+            engine._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        return res
 
-    def _generate_order_name(self, franchise_id, order_date, exclude_id=None):
-        if not franchise_id or not order_date:
-            return "New Stock Order"
-        
+    def _get_financial_contributions(self):
+        """
+        Aporte de cada pedido al resumen financiero de su franquicia: [(franchise_id, {campo: valor})].
+        Solo los pedidos entregados y no pagados suman deuda.
+        """
+        return [(order.franchise_id.id, {
+            'outstanding_stock_orders': order.total_amount,
+            'total_outstanding_debt': order.total_amount,
+            'pending_stock_orders_count': 1,
+        }) for order in self if order.state == 'delivered' and order.franchise_id]
+
+    def _get_debt_ledger_values(self, history=False):
+        """
+        Deuda de cada pedido para el libro de deuda (gelroy.debt.ledger): {id: valores}.
+        Adeuda el saldo pendiente de los pedidos entregados o vencidos; con history=True
+        solo se devuelven los que generaron deuda alguna vez (con deuda abierta o ya pagados).
+        """
+        values = {}
+        for order in self.filtered('franchise_id'):
+            open_debt = order.state in DEBT_STOCK_STATES
+            settled = order.state == 'paid'
+            if history and not (open_debt or settled):
+                continue
+            values[order.id] = {
+                'franchise_id': order.franchise_id.id,
+                'name': order.name,
+                'amount': order.outstanding_amount if open_debt else 0.0,
+                'due_date': order.payment_due_date,
+                'debit_event': 'order_delivered',
+                'settled': settled,
+                'debit_amount': order.total_amount if settled else order.outstanding_amount,
+                'debit_date': order.delivered_date or order.order_date,
+                'credit_date': order.payment_date,
+            }
+        return values
+
+    def _allocate_order_names(self, franchise_id, count=1):
+        """
+        Reserva 'count' nombres consecutivos Order-CODIGO-NNN para la franquicia.
+        La numeración sale de gelroy.franchise.sequence: O(1), segura ante creaciones
+        concurrentes y sin reutilizar números de pedidos borrados o renumerados.
+        """
         franchise = self.env['gelroy.franchise'].browse(franchise_id)
         franchise_code = franchise.franchise_code or 'F'
-        
-        # Buscar pedidos existentes para esa franquicia
-        domain = [
-            ('franchise_id', '=', franchise_id)
-        ]
-        if exclude_id:
-            domain.append(('id', '!=', exclude_id))
-        
-        existing_orders = self.search(domain)
-        sequence = len(existing_orders) + 1
-        
-        return f"Order-{franchise_code}-{sequence:03d}"
+        sequence = self.env['gelroy.franchise.sequence'].sudo()
+        numbers = sequence._allocate(
+            franchise_id, ORDER_SEQUENCE_CODE, count,
+            seed=lambda: sequence._get_last_number(self._table, franchise_id),
+        )
+        return [f"Order-{franchise_code}-{number:03d}" for number in numbers]
 
     def action_create_invoice(self):
-        """Creates an invoice for the stock order"""
-        for order in self:
-            if order.state not in ['delivered', 'in_transit', 'overdue']:
-                raise UserError(_("Only delivered, in-transit or overdue orders can be invoiced."))
-
-            # Verificar si ya existe una factura
-            existing_invoice = self.env['account.move'].search([
-                ('invoice_origin', '=', order.name),
-                ('move_type', '=', 'out_invoice'),
-                ('state', '!=', 'cancel')
-            ], limit=1)
-            
-            if existing_invoice:
-                raise UserError(_("Invoice already exists for this order: %s") % existing_invoice.name)
-            
-            # Crear factura
-            invoice_vals = {
-                'move_type': 'out_invoice',
-                'partner_id': order.franchise_id.franchisee_id.id,
-                'invoice_date': fields.Date.context_today(self),
-                'invoice_origin': order.name,
-                'currency_id': order.currency_id.id,
-                'invoice_line_ids': [],
-            }
-            
-            # Agregar líneas de factura
-            for line in order.order_line_ids:
-                invoice_line_vals = {
-                    'product_id': line.product_id.id,
-                    'name': line.product_id.name,
-                    'quantity': line.quantity,
-                    'price_unit': line.unit_price,  # Usar unit_price (sin impuestos)
-                    'product_uom_id': line.product_id.uom_id.id,
-                    # Los impuestos del producto se aplicarán automáticamente
-                }
-                invoice_vals['invoice_line_ids'].append((0, 0, invoice_line_vals))
-            
-            # Crear la factura
-            invoice = self.env['account.move'].create(invoice_vals)
-            
-            invoice._compute_tax_totals()
-            
-            # Refrescar el contador de facturas
-            order._compute_invoice_count()
-            
-            # Mensaje en el pedido
-            order.message_post(body=_("Invoice created: %s (Total: %s)") % (invoice.name, invoice.amount_total))
-            
+        """Creates the invoices of the selected stock orders"""
+        self._check_invoicing_period_closed()
+        invoices = self._create_invoices()
+        if len(invoices) == 1:
             # Abrir la factura
             return {
                 'type': 'ir.actions.act_window',
                 'name': _('Invoice'),
                 'view_mode': 'form',
                 'res_model': 'account.move',
-                'res_id': invoice.id,
+                'res_id': invoices.id,
                 'target': 'current',
             }
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Invoices'),
+            'view_mode': 'tree,form',
+            'res_model': 'account.move',
+            'domain': [('id', 'in', invoices.ids)],
+            'target': 'current',
+        }
+
+    def action_create_invoice_batch(self):
+        """Crea un lote de facturación con los pedidos seleccionados y lo abre"""
+        batch = self.env['gelroy.invoice.batch'].create({
+            'order_ids': [Command.set(self.ids)],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Invoice Batch'),
+            'view_mode': 'form',
+            'res_model': 'gelroy.invoice.batch',
+            'res_id': batch.id,
+            'target': 'current',
+        }
+
+    def _get_invoice_domain(self):
+        """
+        Facturas de cliente de los pedidos: por el vínculo directo, por los pedidos
+        cubiertos (facturas consolidadas) o por el origen (facturas antiguas)
+        """
+        return [
+            ('move_type', '=', 'out_invoice'),
+            '|', '|',
+            ('stock_order_id', 'in', self.ids),
+            ('stock_order_ids', 'in', self.ids),
+            ('invoice_origin', 'in', self.mapped('name')),
+        ]
+
+    def _get_invoices_by_order(self, extra_domain=None):
+        """Facturas de cliente de cada pedido en una sola búsqueda para todo el lote: {order_id: facturas}"""
+        invoices_by_order = {order.id: self.env['account.move'] for order in self}
+        if not self:
+            return invoices_by_order
+        invoices = self.env['account.move'].search(self._get_invoice_domain() + (extra_domain or []))
+        order_by_name = {order.name: order.id for order in self}
+        for invoice in invoices:
+            covered = (invoice.stock_order_ids | invoice.stock_order_id) & self
+            order_ids = covered.ids or [order_by_name.get(invoice.invoice_origin)]
+            for order_id in order_ids:
+                if order_id:
+                    invoices_by_order[order_id] |= invoice
+        return invoices_by_order
+
+    def _get_existing_invoices(self):
+        """Facturas de cliente no canceladas de los pedidos: {order_id: factura}"""
+        return {
+            order_id: invoices[:1]
+            for order_id, invoices in self._get_invoices_by_order([('state', '!=', 'cancel')]).items()
+            if invoices
+        }
+
+    def _filter_open_invoicing_period(self, today=None):
+        """Pedidos de facturación semanal o mensual cuyo período de facturación todavía no cerró"""
+        today = today or fields.Date.context_today(self)
+        return self.filtered(lambda order: order.franchise_id.invoicing_policy != 'per_order'
+                             and order.franchise_id._get_invoicing_period(order.order_date)[1] >= today)
+
+    def _check_invoicing_period_closed(self):
+        """Los pedidos de facturación periódica se facturan juntos cuando cierra su período"""
+        open_orders = self._filter_open_invoicing_period()
+        if open_orders:
+            raise UserError(_(
+                "These orders will be invoiced in a consolidated invoice when their invoicing period "
+                "closes: %s"
+            ) % ', '.join(open_orders.mapped('name')))
+
+    def _get_invoicing_groups(self):
+        """
+        Pedidos agrupados como se facturan: [(período, pedidos)] en el orden de self.
+        Facturación por pedido: un grupo por pedido (período None); semanal o mensual:
+        un grupo por franquicia, moneda y período.
+        """
+        groups = {}
+        for order in self:
+            if order.franchise_id.invoicing_policy == 'per_order':
+                key = (order.id, None)
+            else:
+                key = (order.franchise_id.id, order.currency_id.id,
+                       order.franchise_id._get_invoicing_period(order.order_date))
+            groups.setdefault(key, [key[-1], self.browse()])[1] |= order
+        return [tuple(group) for group in groups.values()]
+
+    def _prepare_invoice_line_vals(self, label_suffix=''):
+        """Líneas de factura del pedido (sin consultas adicionales: todo sale del prefetch)"""
+        self.ensure_one()
+        return [Command.create({
+            'product_id': line.product_id.id,
+            'name': line.product_id.name + label_suffix,
+            'quantity': line.quantity,
+            'price_unit': line.unit_price,  # Usar unit_price (sin impuestos)
+            'product_uom_id': line.product_id.uom_id.id,
+            # Los impuestos del producto se aplicarán automáticamente
+        }) for line in self.order_line_ids]
+
+    def _prepare_invoice_vals(self):
+        """Valores de la factura de un pedido"""
+        self.ensure_one()
+        return {
+            'move_type': 'out_invoice',
+            'partner_id': self.franchise_id.franchisee_id.id,
+            'invoice_date': fields.Date.context_today(self),
+            'invoice_origin': self.name,
+            'stock_order_id': self.id,
+            'stock_order_ids': [Command.set(self.ids)],
+            'currency_id': self.currency_id.id,
+            'invoice_line_ids': self._prepare_invoice_line_vals(),
+        }
+
+    def _prepare_consolidated_invoice_vals(self, period_start, period_end):
+        """
+        Factura consolidada de los pedidos de una franquicia en un período:
+        una sección por pedido (nombre y fecha) seguida de sus líneas
+        """
+        franchise = self.franchise_id
+        franchise.ensure_one()
+        invoice_lines = []
+        for order in self.sorted(lambda order: (order.order_date, order.id)):
+            invoice_lines.append(Command.create({
+                'display_type': 'line_section',
+                'name': _("%s (%s)") % (order.name, order.order_date),
+            }))
+            invoice_lines += order._prepare_invoice_line_vals(label_suffix=f" - {order.name}")
+        return {
+            'move_type': 'out_invoice',
+            'partner_id': franchise.franchisee_id.id,
+            'franchise_id': franchise.id,
+            'invoice_date': fields.Date.context_today(self),
+            'invoice_origin': ', '.join(self.sorted(lambda order: (order.order_date, order.id)).mapped('name')),
+            'ref': _("Stock orders %s - %s") % (period_start, period_end),
+            'stock_order_ids': [Command.set(self.ids)],
+            'currency_id': self[0].currency_id.id,
+            'invoice_line_ids': invoice_lines,
+        }
+
+    def _create_invoices(self, skip_invoiced=False, extra_vals=None):
+        """
+        Factura todos los pedidos de self con un solo create():
+        - Estados y duplicados se verifican para el lote entero (una búsqueda)
+        - Con skip_invoiced los pedidos ya facturados se omiten en lugar de dar error
+          (reanudar un lote interrumpido no duplica facturas)
+        - Los pedidos de franquicias con facturación semanal o mensual se agrupan en una
+          factura consolidada por franquicia y período
+        - Una nota por pedido con _message_log_batch
+        Devuelve las facturas creadas.
+        """
+        if any(order.state not in ['delivered', 'in_transit', 'overdue'] for order in self):
+            raise UserError(_("Only delivered, in-transit or overdue orders can be invoiced."))
+
+        # Verificar si ya existe una factura
+        existing = self._get_existing_invoices()
+        if existing and not skip_invoiced:
+            raise UserError(_("Invoice already exists for this order: %s") % ', '.join(
+                invoice.name for invoice in existing.values()
+            ))
+        orders = self.filtered(lambda order: order.id not in existing)
+        if not orders:
+            return self.env['account.move']
+
+        # Franquicias con facturación periódica: una factura por franquicia y período
+        vals_list = [
+            group_orders._prepare_consolidated_invoice_vals(*period) if period else group_orders._prepare_invoice_vals()
+            for period, group_orders in orders._get_invoicing_groups()
+        ]
+
+        invoices = self.env['account.move'].create([dict(vals, **(extra_vals or {})) for vals in vals_list])
+        orders._message_log_batch(bodies={
+            order.id: _("Invoice created: %s (Total: %s)") % (invoice.name, invoice.amount_total)
+            for invoice in invoices
+            for order in invoice.stock_order_ids
+        })
+        return invoices
 
     def action_view_invoices(self):
         """View invoices related to this stock order"""
         self.ensure_one()
-        invoices = self.env['account.move'].search([
-            ('invoice_origin', '=', self.name),
-            ('move_type', '=', 'out_invoice')
-        ])
-        
+        invoices = self._get_invoices_by_order()[self.id]
+
         if len(invoices) == 1:
             return {
                 'type': 'ir.actions.act_window',
@@ -542,62 +844,93 @@ class StockOrder(models.Model):
 
     invoice_count = fields.Integer(string='Invoice Count', compute='_compute_invoice_count')
 
-    @api.depends('name')
+    @api.depends('name', 'invoice_ids', 'covering_invoice_ids')
     def _compute_invoice_count(self):
+        invoices_by_order = self.filtered('id')._get_invoices_by_order()
+        for order in self:
+            order.invoice_count = len(invoices_by_order.get(order.id, []))
+
+    @api.depends('picking_ids')
+    def _compute_picking_count(self):
         for order in self:
-            order.invoice_count = self.env['account.move'].search_count([
-                ('invoice_origin', '=', order.name),
-                ('move_type', '=', 'out_invoice')
-            ])
+            order.picking_count = len(order.picking_ids)
+
+    def action_view_pickings(self):
+        """View the transfers that shipped this stock order"""
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('stock.action_picking_tree_all')
+        if len(self.picking_ids) == 1:
+            action['views'] = [(self.env.ref('stock.view_picking_form').id, 'form')]
+            action['res_id'] = self.picking_ids.id
+        else:
+            action['domain'] = [('id', 'in', self.picking_ids.ids)]
+        action['context'] = {'create': False}
+        return action
 
     def unlink(self):
-        """Override unlink para borrar facturas en cascada de forma segura"""
+        """
+        Override unlink para borrar facturas en cascada de forma segura.
+        Las facturas del lote (directas, consolidadas o antiguas por origen) se buscan
+        una sola vez y se valida todo el lote antes de borrar ninguna.
+        """
+        invoices_by_order = self._get_invoices_by_order()
         for order in self:
-            if order.name and order.name not in ['New Stock Order', '/', False]:
-                # Buscar facturas asociadas a esta orden de stock
-                associated_invoices = self.env['account.move'].search([
-                    ('invoice_origin', '=', order.name),
-                    ('move_type', '=', 'out_invoice')
-                ])
-                
-                if associated_invoices:
-                    # Separar por estado
-                    draft_invoices = associated_invoices.filtered(lambda inv: inv.state == 'draft')
-                    cancel_invoices = associated_invoices.filtered(lambda inv: inv.state == 'cancel')
-                    confirmed_invoices = associated_invoices.filtered(lambda inv: inv.state in ['posted', 'payment'])
-                    
-                    # Eliminar borradores y canceladas
-                    deletable_invoices = draft_invoices + cancel_invoices
-                    if deletable_invoices:
-                        try:
-                            invoice_names = deletable_invoices.mapped('name')
-                            deletable_invoices.unlink()
-                            order.message_post(body=_("Invoices deleted in cascade: %s") % ', '.join(invoice_names))
-                        except Exception as e:
-                            raise ValidationError(_(
-                                "Error deleting draft invoices: %s"
-                            ) % str(e))
-                    
-                    # Validar facturas confirmadas/pagadas
-                    if confirmed_invoices:
-                        # Verificar conciliación
-                        reconciled_invoices = confirmed_invoices.filtered(lambda inv: any(
-                            line.matched_debit_ids or line.matched_credit_ids 
-                            for line in inv.line_ids.filtered(lambda l: l.account_id.account_type == 'asset_receivable')
-                        ))
-                        
-                        if reconciled_invoices:
-                            raise ValidationError(_(
-                                "Cannot delete stock order '%s' because it has RECONCILED (paid) invoices: %s. "
-                                "You must unreconcile the payments and cancel these invoices manually."
-                            ) % (order.name, ', '.join(reconciled_invoices.mapped('name'))))
-                        # Facturas confirmadas pero no conciliadas - informar
-                        if confirmed_invoices:
-                            raise ValidationError(_(
-                                "Cannot delete stock order '%s' because it has confirmed invoices: %s. "
-                                "You must cancel these invoices manually."
-                            ) % (order.name, ', '.join(confirmed_invoices.mapped('name'))))
-        return super().unlink()
+            associated_invoices = invoices_by_order[order.id]
+            confirmed_invoices = associated_invoices.filtered(lambda inv: inv.state in ['posted', 'payment'])
+
+            # Validar facturas confirmadas/pagadas
+            if confirmed_invoices:
+                # Verificar conciliación
+                reconciled_invoices = confirmed_invoices.filtered(lambda inv: any(
+                    line.matched_debit_ids or line.matched_credit_ids
+                    for line in inv.line_ids.filtered(lambda l: l.account_id.account_type == 'asset_receivable')
+                ))
+
+                if reconciled_invoices:
+                    raise ValidationError(_(
+                        "Cannot delete stock order '%s' because it has RECONCILED (paid) invoices: %s. "
+                        "You must unreconcile the payments and cancel these invoices manually."
+                    ) % (order.name, ', '.join(reconciled_invoices.mapped('name'))))
+                # Facturas confirmadas pero no conciliadas - informar
+                raise ValidationError(_(
+                    "Cannot delete stock order '%s' because it has confirmed invoices: %s. "
+                    "You must cancel these invoices manually."
+                ) % (order.name, ', '.join(confirmed_invoices.mapped('name'))))
+
+            # Una factura consolidada en borrador que cubre otros pedidos no se borra con este
+            shared_invoices = associated_invoices.filtered(
+                lambda inv: inv.state == 'draft' and (inv.stock_order_ids | inv.stock_order_id) - self
+            )
+            if shared_invoices:
+                raise ValidationError(_(
+                    "Cannot delete stock order '%s' because its draft invoices also cover other stock orders: %s. "
+                    "Delete those stock orders together or delete these invoices manually."
+                ) % (order.name, ', '.join(shared_invoices.mapped('name'))))
+
+        # Eliminar borradores y canceladas
+        deletable_by_order = {
+            order_id: invoices.filtered(lambda inv: inv.state in ['draft', 'cancel'])
+            for order_id, invoices in invoices_by_order.items()
+        }
+        deletable_invoices = self.env['account.move'].union(*deletable_by_order.values())
+        if deletable_invoices:
+            orders_with_invoices = self.filtered(lambda order: deletable_by_order[order.id])
+            orders_with_invoices._message_log_batch(bodies={
+                order.id: _("Invoices deleted in cascade: %s") % ', '.join(deletable_by_order[order.id].mapped('name'))
+                for order in orders_with_invoices
+            })
+            try:
+                deletable_invoices.unlink()
+            except Exception as e:
+                raise ValidationError(_(
+                    "Error deleting draft invoices: %s"
+                ) % str(e))
+        self.env['gelroy.kpi.engine']._invalidate_kpi_cache_for(self, KPI_SCOPE_FIELDS)
+        contributions = self._get_financial_contributions()
+        self.env['gelroy.debt.ledger']._sync_documents(self, removed=True)
+        res = super().unlink()
+        self.env['gelroy.franchise']._apply_financial_summary_deltas(contributions, [])
+        return res
 
     @api.depends('payment_due_date', 'outstanding_amount', 'state')
     def _compute_days_overdue(self):
@@ -613,45 +946,89 @@ class StockOrder(models.Model):
             else:
                 order.days_overdue = 0
 
-    @api.depends('total_amount', 'state')
+    @api.depends('total_amount', 'state', 'invoice_ids.state', 'invoice_ids.amount_residual',
+                 'covering_invoice_ids.state', 'covering_invoice_ids.amount_residual')
     def _compute_outstanding_amount(self):
-        """Calcular monto pendiente de pago"""
+        """
+        Calcular monto pendiente de pago para todo el conjunto con una sola consulta agrupada.
+        Se descuenta lo cobrado (total - residual) de las facturas publicadas del pedido,
+        vinculadas por stock_order_id o por invoice_origin, así cubre también pagos parciales.
+        """
+        paid_by_order = self._get_invoiced_paid_amounts()
         for order in self:
             if order.state == 'paid':
                 order.outstanding_amount = 0.0
             else:
-                # Buscar facturas pagadas para esta orden
-                paid_invoices = self.env['account.move'].search([
-                    ('invoice_origin', '=', order.name),
-                    ('move_type', '=', 'out_invoice'),
-                    ('payment_state', '=', 'paid'),
-                    ('state', '=', 'posted')
-                ])
-                
-                paid_amount = sum(paid_invoices.mapped('amount_total'))
-                order.outstanding_amount = order.total_amount - paid_amount
+                order.outstanding_amount = order.total_amount - paid_by_order.get(order.id, 0.0)
 
-    def read(self, fields=None, load='_classic_read'):
-        """Override read para verificar overdue al acceder a los datos"""
-        result = super().read(fields, load)
-        
-        # Solo ejecutar si se está leyendo fields relacionados con estado
-        if not fields or any(field in fields for field in ['state', 'days_overdue', 'payment_due_date']):
-            self._auto_mark_overdue()
-        
-        return result
+    def _get_invoiced_paid_amounts(self):
+        """
+        Importe cobrado por pedido (id → monto) según sus facturas de cliente publicadas:
+        una consulta agrupada para las facturas por pedido y una búsqueda para las consolidadas
+        """
+        orders = self.filtered(lambda o: o.id and o.state != 'paid')
+        if not orders:
+            return {}
+        order_ids_by_name = {}
+        for order in orders:
+            order_ids_by_name.setdefault(order.name, []).append(order.id)
 
-    def _auto_mark_overdue(self):
-        """Cambiar automáticamente delivered a overdue cuando vencen"""
-        today = fields.Date.context_today(self)
-        
-        overdue_candidates = self.filtered(lambda o: 
-            o.state == 'delivered' and 
-            o.payment_due_date and 
-            o.payment_due_date < today and
-            o.outstanding_amount > 0
+        AccountMove = self.env['account.move'].sudo()
+        groups = AccountMove._read_group(
+            [
+                ('move_type', '=', 'out_invoice'),
+                ('state', '=', 'posted'),
+                '|',
+                ('stock_order_id', 'in', orders.ids),
+                '&', ('stock_order_ids', '=', False), ('invoice_origin', 'in', list(order_ids_by_name)),
+            ],
+            groupby=['stock_order_id', 'invoice_origin'],
+            aggregates=['amount_total:sum', 'amount_residual:sum'],
         )
-        
-        # Cambiar a overdue automáticamente
-        for order in overdue_candidates:
-            order.write({'state': 'overdue'})
\ No newline at end of file
+        paid_by_order = {}
+        for stock_order, origin, amount_total, amount_residual in groups:
+            # El vínculo directo tiene prioridad; el origen solo se usa si el nombre es único
+            if stock_order:
+                order_ids = [stock_order.id]
+            else:
+                order_ids = order_ids_by_name.get(origin, [])
+                if len(order_ids) != 1:
+                    continue
+            paid_by_order[order_ids[0]] = paid_by_order.get(order_ids[0], 0.0) + amount_total - amount_residual
+
+        # Facturas consolidadas: lo cobrado se reparte en proporción al total de cada pedido cubierto
+        consolidated_invoices = AccountMove.search([
+            ('move_type', '=', 'out_invoice'),
+            ('state', '=', 'posted'),
+            ('stock_order_id', '=', False),
+            ('stock_order_ids', 'in', orders.ids),
+        ])
+        for invoice in consolidated_invoices:
+            covered_total = sum(invoice.stock_order_ids.mapped('total_amount'))
+            if not covered_total:
+                continue
+            invoice_paid = invoice.amount_total - invoice.amount_residual
+            for order in invoice.stock_order_ids & orders:
+                paid_by_order[order.id] = (paid_by_order.get(order.id, 0.0)
+                                           + invoice_paid * order.total_amount / covered_total)
+        return paid_by_order
+
+    @api.model
+    def _cron_invoice_closed_periods(self):
+        """
+        Acción planificada: factura los pedidos de franquicias con facturación semanal o mensual
+        cuyo período ya cerró (una factura consolidada por franquicia y período)
+        """
+        today = fields.Date.context_today(self)
+        orders = self.search([
+            ('state', 'in', ['delivered', 'in_transit', 'overdue']),
+            ('franchise_id.invoicing_policy', 'in', ['weekly', 'monthly']),
+        ])
+        closed = orders - orders._filter_open_invoicing_period(today)
+        closed._create_invoices(skip_invoiced=True)
+        return True
+
+    @api.model
+    def check_overdue_orders(self):
+        """Pasa a vencido los pedidos entregados cuyo pago venció. Devuelve la cantidad."""
+        return len(self.env['gelroy.overdue.engine']._sweep_model(self._name))
@@ -1,6 +1,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 
+# Tipos de impuesto cuyo cálculo depende solo de precio y cantidad (no de producto ni cliente)
+CONTEXT_FREE_TAX_TYPES = ('percent', 'fixed', 'division')
+
 class StockOrderLine(models.Model):
     _name = 'gelroy.stock.order.line'
     _description = 'Stock Order Line'
@@ -44,26 +47,55 @@ class StockOrderLine(models.Model):
 
     @api.depends('quantity', 'unit_price', 'product_id.taxes_id')
     def _compute_amount(self):
-        """Calcular subtotal, impuestos y total de la línea"""
+        """
+        Calcular subtotal, impuestos y total de las líneas en lote.
+        compute_all() se evalúa una sola vez por combinación distinta de la clave de
+        _get_tax_computation_key; como la clave incluye precio y cantidad, el resultado
+        (y su redondeo) es exactamente el de evaluar cada línea por separado.
+        """
+        tax_results = {}
         for line in self:
             price = line.unit_price * line.quantity
             
             # Usar los impuestos configurados en el producto
             if line.product_id and line.product_id.taxes_id:
-                taxes = line.product_id.taxes_id.compute_all(
-                    price_unit=line.unit_price,
-                    quantity=line.quantity,
-                    product=line.product_id,
-                    partner=line.order_id.franchisee_id if line.order_id else None
-                )
-                line.price_subtotal = taxes['total_excluded']
-                line.price_tax = taxes['total_included'] - taxes['total_excluded']
-                line.price_total = taxes['total_included']
+                taxes = line.product_id.taxes_id
+                partner = line.order_id.franchisee_id if line.order_id else None
+                key = line._get_tax_computation_key(taxes, partner)
+                if key not in tax_results:
+                    tax_results[key] = taxes.compute_all(
+                        price_unit=line.unit_price,
+                        quantity=line.quantity,
+                        product=line.product_id,
+                        partner=partner
+                    )
+                taxes_res = tax_results[key]
+                line.price_subtotal = taxes_res['total_excluded']
+                line.price_tax = taxes_res['total_included'] - taxes_res['total_excluded']
+                line.price_total = taxes_res['total_included']
             else:
                 line.price_subtotal = price
                 line.price_tax = 0.0
                 line.price_total = price
 
+    def _get_tax_computation_key(self, taxes, partner):
+        """
+        Clave de memorización de compute_all(): impuestos, precio y cantidad.
+        Producto y cliente solo entran en la clave si algún impuesto depende de ellos
+        (por ejemplo impuestos con código Python); los porcentuales, fijos y de división no.
+        """
+        self.ensure_one()
+        contextual = any(
+            tax.amount_type not in CONTEXT_FREE_TAX_TYPES for tax in taxes.flatten_taxes_hierarchy()
+        )
+        return (
+            tuple(taxes.ids),
+            self.unit_price,
+            self.quantity,
+            self.product_id.id if contextual else None,
+            partner.id if contextual and partner else None,
+        )
+
     @api.onchange('product_id')
     def _onchange_product_id(self):
         """Al cambiar producto: establecer valores por defecto y verificar disponibilidad"""
@@ -0,0 +1,14 @@
+from odoo import models, fields
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    stock_order_id = fields.Many2one(
+        'gelroy.stock.order',
+        string='Related Stock Order',
+        index='btree_not_null',
+        readonly=True,
+        copy=False,
+        help="Franchise stock order shipped by this transfer"
+    )
@@ -0,0 +1,94 @@
+/** @odoo-module **/
+
+import { Component, useState, onWillStart } from "@odoo/owl";
+import { registry } from "@web/core/registry";
+import { useService } from "@web/core/utils/hooks";
+import { formatFloat, formatMonetary, formatPercentage } from "@web/views/fields/formatters";
+
+// Secciones que se piden al servidor de forma independiente
+const SECTIONS = ["royalties", "stock", "franchises"];
+
+export class ExecutiveDashboard extends Component {
+    static template = "gelroy.ExecutiveDashboard";
+    static props = ["*"];
+
+    setup() {
+        this.orm = useService("orm");
+        this.state = useState({
+            sections: Object.fromEntries(
+                SECTIONS.map((section) => [
+                    section,
+                    { loading: true, error: false, errorMessage: "", values: {}, serverTimeMs: null },
+                ])
+            ),
+        });
+        // No se espera a los datos: la estructura se pinta y cada sección se rellena al llegar.
+        // loadSection nunca rechaza (el error queda en el estado de la sección)
+        onWillStart(() => {
+            this.loadSections();
+        });
+    }
+
+    /**
+     * Pide todas las secciones en paralelo; la promesa se resuelve cuando terminaron todas,
+     * con o sin error.
+     */
+    loadSections() {
+        return Promise.allSettled(SECTIONS.map((section) => this.loadSection(section)));
+    }
+
+    async loadSection(section) {
+        const sectionState = this.state.sections[section];
+        sectionState.loading = true;
+        sectionState.error = false;
+        sectionState.errorMessage = "";
+        try {
+            const result = await this.orm.call("gelroy.executive.dashboard", "get_section_data", [section]);
+            sectionState.values = result.values;
+            sectionState.currencyId = result.currency_id;
+            sectionState.serverTimeMs = result.server_time_ms;
+        } catch (error) {
+            // El error se muestra en la sección (con su botón de reintento) sin cortar las demás
+            sectionState.error = true;
+            sectionState.errorMessage = error.data?.message || error.message || "";
+        } finally {
+            sectionState.loading = false;
+        }
+    }
+
+    value(section, field) {
+        return this.state.sections[section].values[field];
+    }
+
+    monetary(section, field) {
+        const sectionState = this.state.sections[section];
+        return formatMonetary(sectionState.values[field] || 0, { currencyId: sectionState.currencyId });
+    }
+
+    percentage(section, field) {
+        return formatPercentage(this.value(section, field) || 0);
+    }
+
+    decimal(section, field) {
+        return formatFloat(this.value(section, field) || 0, { digits: [12, 1] });
+    }
+
+    // Totales vencidos: necesitan las secciones de regalías y de stock
+    get overdueReady() {
+        const { royalties, stock } = this.state.sections;
+        return !royalties.loading && !stock.loading && !royalties.error && !stock.error;
+    }
+
+    get totalOverdueCount() {
+        return (this.value("royalties", "overdue_payments_count") || 0) +
+            (this.value("stock", "stock_overdue_orders_count") || 0);
+    }
+
+    get totalOverdueAmount() {
+        const amount = (this.value("royalties", "overdue_payments_amount") || 0) +
+            (this.value("stock", "stock_overdue_orders_amount") || 0);
+        return formatMonetary(amount, { currencyId: this.state.sections.royalties.currencyId });
+    }
+}
+
+registry.category("actions").add("gelroy_executive_dashboard", ExecutiveDashboard);
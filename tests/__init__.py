@@ -3,4 +3,8 @@ from . import test_royalty_payment
 from . import test_stock_order
 from . import test_recipe
 from . import test_production
-from . import test_dashboard
\ No newline at end of file
+from . import test_dashboard
+from . import test_kpi_snapshot
+from . import test_kpi_cache
+from . import test_benchmark
+from . import test_performance
\ No newline at end of file
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command, fields
+
+# Tamaños base (escala 1x); cada escala multiplica franquicias y productos
+BASE_SIZES = {
+    'franchises': 5,
+    'products': 10,
+    'recipes': 3,
+    'ingredients_per_recipe': 3,
+    'orders_per_franchise_month': 2,
+    'lines_per_order': 3,
+}
+# Distribución de estados de los pedidos históricos
+STOCK_ORDER_STATE_WEIGHTS = {
+    'submitted': 1, 'approved': 1, 'in_transit': 1, 'delivered': 3,
+    'overdue': 2, 'paid': 10, 'cancelled': 1,
+}
+# Distribución de estados de los pagos de regalías
+ROYALTY_STATE_WEIGHTS = {'calculated': 1, 'confirmed': 2, 'overdue': 2, 'paid': 8}
+# Estados de pedido que implican aprobación, envío y entrega
+SHIPPED_STATES = ('in_transit', 'delivered', 'overdue', 'paid')
+DELIVERED_STATES = ('delivered', 'overdue', 'paid')
+# Tamaño de los lotes de create()
+BATCH_SIZE = 500
+
+
+
+def create_stock_orders_in_state(env, products, franchise, order_date, state='draft', quantity=1, count=1, **values):
+    """
+    Crea count pedidos de stock con una línea por producto y los deja en el estado indicado.
+    Las líneas solo se pueden agregar en borrador: se crean en un create() y el estado
+    (con las fechas del flujo que se pasen en values) se asigna después con un write().
+    """
+    orders = env['gelroy.stock.order'].create([{
+        'franchise_id': franchise.id,
+        'order_date': order_date,
+        'requested_delivery_date': values.pop('requested_delivery_date', order_date + relativedelta(days=10)),
+        'order_line_ids': [Command.create({'product_id': product.id, 'quantity': quantity}) for product in products],
+    } for _index in range(count)])
+    if state != 'draft' or values:
+        orders.write(dict(values, state=state))
+    return orders
+
+class FranchiseDataGenerator:
+    """
+    Generador de datos sintéticos reproducibles para benchmarks.
+    - Con la misma semilla y escala genera siempre los mismos datos
+    - Crea franquicias, productos con stock, recetas, años de pedidos con líneas,
+      pagos de regalías mensuales y facturas borrador, todo con create() por lotes
+    - Los pedidos se crean en borrador (las líneas no se pueden agregar después) y se
+      pasan a su estado final con un write() por estado
+    """
+
+    def __init__(self, env, seed=42, scale=1, months=24, date_to=None):
+        self.env = env(context=dict(env.context, tracking_disable=True, mail_create_nolog=True,
+                                    mail_notrack=True))
+        self.random = random.Random(seed)
+        self.scale = scale
+        self.months = months
+        self.date_to = date_to or date.today().replace(day=1) - relativedelta(days=1)
+        self.date_from = (self.date_to + relativedelta(days=1)) - relativedelta(months=months)
+        self.tag = f"BM{seed}X{scale}"
+
+    def _size(self, key):
+        if key in ('franchises', 'products', 'recipes'):
+            return BASE_SIZES[key] * self.scale
+        return BASE_SIZES[key]
+
+    def _choice(self, weights):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def _create_batched(self, model_name, vals_list):
+        records = self.env[model_name]
+        for start in range(0, len(vals_list), BATCH_SIZE):
+            records |= self.env[model_name].create(vals_list[start:start + BATCH_SIZE])
+        return records
+
+    # DATOS MAESTROS
+    def create_franchises(self):
+        count = self._size('franchises')
+        partners = self._create_batched('res.partner', [
+            {'name': f"{self.tag} Franchisee {index}"} for index in range(count)
+        ])
+        types = [key for key, _label in self.env['gelroy.franchise']._fields['franchise_type'].selection]
+        return self._create_batched('gelroy.franchise', [{
+            'name': f"{self.tag} Franchise {index}",
+            'franchise_code': f"{self.tag}-{index:05d}",
+            'franchisee_id': partner.id,
+            'franchise_type': self.random.choice(types),
+            'royalty_fee_percentage': self.random.choice([5.0, 7.5, 10.0]),
+            'contract_start_date': self.date_from - relativedelta(months=self.random.randint(0, 36)),
+            'contract_end_date': self.date_to + relativedelta(months=self.random.randint(1, 60)),
+        } for index, partner in enumerate(partners)])
+
+    def create_products(self):
+        """Productos almacenables sin impuestos y con stock suficiente para aprobar y enviar pedidos"""
+        products = self._create_batched('product.product', [{
+            'name': f"{self.tag} Product {index}",
+            'default_code': f"{self.tag}-P{index:05d}",
+            'detailed_type': 'product',
+            'list_price': round(self.random.uniform(1.0, 50.0), 2),
+            'taxes_id': [Command.clear()],
+        } for index in range(self._size('products'))])
+        location = self.env['stock.warehouse'].search(
+            [('company_id', '=', self.env.company.id)], limit=1,
+        ).lot_stock_id
+        Quant = self.env['stock.quant'].sudo()
+        for product in products:
+            Quant._update_available_quantity(product, location, 1_000_000)
+        return products
+
+    def create_recipes(self, products):
+        categories = [key for key, _label in self.env['gelroy.recipe']._fields['category'].selection]
+        return self._create_batched('gelroy.recipe', [{
+            'name': f"{self.tag} Recipe {index}",
+            'code': f"{self.tag}-R{index:05d}",
+            'category': self.random.choice(categories),
+            'production_size': self.random.choice([1.0, 5.0, 10.0]),
+            'ingredient_ids': [Command.create({
+                'product_id': product_id,
+                'quantity': self.random.randint(1, 5),
+            }) for product_id in self.random.sample(products.ids, self._size('ingredients_per_recipe'))],
+        } for index in range(self._size('recipes'))])
+
+    # DATOS TRANSACCIONALES
+    def _order_vals(self, franchise, products, order_date, sequence, state):
+        vals = {
+            'name': f"Order-{franchise.franchise_code}-{sequence:05d}",
+            'franchise_id': franchise.id,
+            'order_date': order_date,
+            'requested_delivery_date': order_date + relativedelta(days=self.random.randint(5, 15)),
+            'order_line_ids': [Command.create({
+                'product_id': product_id,
+                'quantity': self.random.randint(1, 20),
+            }) for product_id in self.random.sample(products.ids, self._size('lines_per_order'))],
+        }
+        if state in ('approved',) + SHIPPED_STATES:
+            vals['approved_date'] = order_date + relativedelta(days=self.random.randint(0, 2))
+        if state in SHIPPED_STATES:
+            vals['shipped_date'] = vals['approved_date'] + relativedelta(days=self.random.randint(0, 3))
+        if state in DELIVERED_STATES:
+            vals['delivered_date'] = vals['shipped_date'] + relativedelta(days=self.random.randint(1, 10))
+            vals['payment_due_date'] = vals['delivered_date'] + relativedelta(days=30)
+        return vals
+
+    def create_stock_orders(self, franchises, products):
+        """Pedidos históricos mes a mes; devuelve los pedidos creados"""
+        vals_list, states = [], []
+        for franchise in franchises:
+            sequence = 0
+            for month in range(self.months):
+                month_start = self.date_from + relativedelta(months=month)
+                for _index in range(self._size('orders_per_franchise_month')):
+                    sequence += 1
+                    state = self._choice(STOCK_ORDER_STATE_WEIGHTS)
+                    order_date = month_start + relativedelta(days=self.random.randint(0, 27))
+                    vals_list.append(self._order_vals(franchise, products, order_date, sequence, state))
+                    states.append(state)
+        orders = self._create_batched('gelroy.stock.order', vals_list)
+        by_state = {}
+        for order, state in zip(orders, states):
+            by_state.setdefault(state, []).append(order.id)
+        for state, order_ids in by_state.items():
+            self.env['gelroy.stock.order'].browse(order_ids).write({'state': state})
+        return orders
+
+    def create_draft_orders(self, franchises, products, count):
+        """Pedidos borrador con fecha de hoy para medir las transiciones de estado"""
+        today = fields.Date.context_today(self.env['gelroy.stock.order'])
+        vals_list = []
+        for index in range(count):
+            vals = self._order_vals(franchises[index % len(franchises)], products, today, 90000 + index, 'draft')
+            vals['requested_delivery_date'] = today + relativedelta(days=30)
+            vals_list.append(vals)
+        return self._create_batched('gelroy.stock.order', vals_list)
+
+    def create_royalty_payments(self, franchises):
+        vals_list = []
+        for franchise in franchises:
+            for month in range(self.months):
+                period_start = self.date_from + relativedelta(months=month)
+                period_end = period_start + relativedelta(months=1, days=-1)
+                revenue = round(self.random.uniform(5000, 50000), 2)
+                state = self._choice(ROYALTY_STATE_WEIGHTS)
+                vals_list.append({
+                    'franchise_id': franchise.id,
+                    'period_start_date': period_start,
+                    'period_end_date': period_end,
+                    'calculation_date': period_end + relativedelta(days=1),
+                    'period_revenue': revenue,
+                    'state': state,
+                    'paid_amount': revenue * franchise.royalty_fee_percentage / 100 if state == 'paid' else 0.0,
+                    'payment_date': period_end + relativedelta(days=15) if state == 'paid' else False,
+                })
+        return self._create_batched('gelroy.royalty.payment', vals_list)
+
+    def create_invoices(self, orders, ratio=0.5):
+        """Facturas borrador para una fracción de los pedidos entregados"""
+        delivered = orders.filtered(lambda order: order.state in DELIVERED_STATES)
+        selected = [order for order in delivered if self.random.random() < ratio]
+        return self._create_batched('account.move', [{
+            'move_type': 'out_invoice',
+            'partner_id': order.franchise_id.franchisee_id.id,
+            'invoice_date': order.delivered_date,
+            'invoice_origin': order.name,
+            'invoice_line_ids': [Command.create({
+                'product_id': line.product_id.id,
+                'name': line.product_id.name,
+                'quantity': line.quantity,
+                'price_unit': line.unit_price,
+                'tax_ids': [Command.clear()],
+            }) for line in order.order_line_ids],
+        } for order in selected])
+
+    def generate(self):
+        """Genera el conjunto completo y devuelve los registros creados por tipo"""
+        franchises = self.create_franchises()
+        products = self.create_products()
+        recipes = self.create_recipes(products)
+        orders = self.create_stock_orders(franchises, products)
+        royalties = self.create_royalty_payments(franchises)
+        invoices = self.create_invoices(orders)
+        self.env.flush_all()
+        return {
+            'franchises': franchises,
+            'products': products,
+            'recipes': recipes,
+            'stock_orders': orders,
+            'stock_order_lines': orders.order_line_ids,
+            'royalty_payments': royalties,
+            'invoices': invoices,
+        }
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import tempfile
+import time
+
+from odoo import release
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.gelroy.models.kpi_cache import kpi_cache
+from .data_generator import FranchiseDataGenerator
+
+_logger = logging.getLogger(__name__)
+
+# Escalas medidas: 1x, 10x y 100x sobre los tamaños base del generador
+BENCHMARK_SCALES = (1, 10, 100)
+BENCHMARK_SEED = 42
+# Ruta del informe JSON (se puede cambiar con GELROY_BENCHMARK_REPORT)
+BENCHMARK_REPORT_PATH = os.environ.get(
+    'GELROY_BENCHMARK_REPORT', os.path.join(tempfile.gettempdir(), 'gelroy_benchmark.json'),
+)
+# Transiciones medidas en orden, sobre un lote de pedidos borrador
+STATE_TRANSITIONS = ('action_submit', 'action_approve', 'action_start_transit', 'action_deliver', 'action_mark_paid')
+
+
+@tagged('-standard', 'gelroy_benchmark')
+class TestDashboardBenchmark(TransactionCase):
+    """
+    Benchmark de dashboards y operaciones a 1x, 10x y 100x datos.
+    No corre con la suite estándar: usar --test-tags gelroy_benchmark.
+    Cada escala es un test independiente (los datos se descartan al terminar)
+    y el informe acumulado se escribe en BENCHMARK_REPORT_PATH.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = {
+            'odoo_version': release.version,
+            'seed': BENCHMARK_SEED,
+            'scales': {},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.report['generated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(BENCHMARK_REPORT_PATH, 'w', encoding='utf-8') as report_file:
+            json.dump(cls.report, report_file, indent=2, sort_keys=True)
+        _logger.info("Gelroy benchmark report written to %s", BENCHMARK_REPORT_PATH)
+        super().tearDownClass()
+
+    def _measure(self, timings, name, operation):
+        """Mide tiempo y cantidad de consultas de operation() con la caché de KPIs vacía"""
+        kpi_cache.clear()
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        operation()
+        self.env.flush_all()
+        timings[name] = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'queries': self.env.cr.sql_log_count - queries_before,
+        }
+
+    def _compute_methods(self, model_name):
+        """Métodos compute distintos de los campos no almacenados del modelo"""
+        fields_by_method = {}
+        for field in self.env[model_name]._fields.values():
+            if isinstance(field.compute, str) and not field.store:
+                fields_by_method.setdefault(field.compute, []).append(field.name)
+        return fields_by_method
+
+    def _run_scale(self, scale):
+        generator = FranchiseDataGenerator(self.env, seed=BENCHMARK_SEED, scale=scale)
+        start = time.perf_counter()
+        data = generator.generate()
+        generation_seconds = round(time.perf_counter() - start, 4)
+        timings = {}
+
+        # Actualización de los snapshots que leen los dashboards (la hace la acción planificada)
+        self._measure(timings, 'gelroy.kpi.snapshot._refresh_snapshots',
+                      self.env['gelroy.kpi.snapshot']._refresh_snapshots)
+
+        # Dashboards: cada método compute por separado, con el rango completo de datos
+        date_range = {'date_from': generator.date_from, 'date_to': generator.date_to}
+        dashboards = {
+            'gelroy.franchise.dashboard': self.env['gelroy.franchise.dashboard'].create(date_range),
+            'gelroy.executive.dashboard': self.env['gelroy.executive.dashboard'].create({}),
+        }
+        for model_name, dashboard in dashboards.items():
+            for method in self._compute_methods(model_name):
+                self._measure(timings, f"{model_name}.{method}", getattr(dashboard, method))
+
+        # Resumen financiero de todas las franquicias generadas
+        franchises = data['franchises']
+        self._measure(timings, 'gelroy.franchise._reconcile_financial_summary', franchises._reconcile_financial_summary)
+
+        # Transiciones de estado sobre un lote proporcional a la escala
+        orders = generator.create_draft_orders(franchises, data['products'], 10 * scale)
+        for action in STATE_TRANSITIONS:
+            self._measure(timings, f"gelroy.stock.order.{action}", getattr(orders, action))
+
+        self.report['scales'][f"{scale}x"] = {
+            'dataset': {key: len(records) for key, records in data.items()},
+            'generation_seconds': generation_seconds,
+            'timings': timings,
+        }
+        self.assertEqual(set(orders.mapped('state')), {'paid'}, "El lote debe recorrer todo el flujo.")
+
+    def test_01_scale_1x(self):
+        """Benchmark con los tamaños base."""
+        self._run_scale(BENCHMARK_SCALES[0])
+
+    def test_02_scale_10x(self):
+        """Benchmark con 10 veces los tamaños base."""
+        self._run_scale(BENCHMARK_SCALES[1])
+
+    def test_03_scale_100x(self):
+        """Benchmark con 100 veces los tamaños base."""
+        self._run_scale(BENCHMARK_SCALES[2])
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
+from unittest.mock import patch
+
 from odoo.tests.common import TransactionCase
-from datetime import date
+from odoo.exceptions import UserError
+from odoo.addons.gelroy.models.kpi_cache import kpi_cache
+from datetime import date, datetime, time
 from dateutil.relativedelta import relativedelta
 
+from .data_generator import create_stock_orders_in_state
+
+
 class TestFranchiseDashboard(TransactionCase):
 
     def setUp(self):
@@ -91,6 +98,11 @@ class TestFranchiseDashboard(TransactionCase):
             'state': 'paid',
             'paid_amount': 200
         })
+        self._refresh_kpi_snapshots()
+
+    def _refresh_kpi_snapshots(self):
+        """Los dashboards leen los snapshots: se actualizan como lo haría la acción planificada."""
+        self.env['gelroy.kpi.snapshot']._refresh_snapshots()
 
     def test_01_royalty_kpis_no_filters(self):
         """Prueba los KPIs de regalías en el dashboard sin filtros (debe agregar todo)."""
@@ -212,6 +224,7 @@ class TestFranchiseDashboard(TransactionCase):
             'state': 'paid',
             'paid_amount': 50
         })
+        self._refresh_kpi_snapshots()
 
         # Dashboard solo para Marzo
         dashboard_march = self.FranchiseDashboard.create({
@@ -261,4 +274,233 @@ class TestFranchiseDashboard(TransactionCase):
         self.assertEqual(dashboard_a.overdue_royalty_payments_count, 1,
                         "Solo Franquicia A debe tener pagos vencidos.")
         self.assertEqual(dashboard_b.overdue_royalty_payments_count, 0,
-                        "Franquicia B no debe tener pagos vencidos.")
\ No newline at end of file
+                        "Franquicia B no debe tener pagos vencidos.")
+
+    def _create_stock_orders_january(self):
+        """Pedidos de Enero 2023 en distintos estados del flujo."""
+        create_stock_orders_in_state(self.env, self.product_a, self.franchise_a, date(2023, 1, 3), 'draft', 5)
+        create_stock_orders_in_state(self.env, self.product_a, self.franchise_a, date(2023, 1, 5), 'submitted', 1)
+        create_stock_orders_in_state(self.env, self.product_a, self.franchise_a, date(2023, 1, 6), 'approved', 2)
+        # Entregado a tiempo: 2 días desde envío, 3 desde aprobación
+        create_stock_orders_in_state(
+            self.env, self.product_a, self.franchise_b, date(2023, 1, 10), 'delivered', 3,
+            approved_date=date(2023, 1, 11), shipped_date=date(2023, 1, 12),
+            delivered_date=date(2023, 1, 14), requested_delivery_date=date(2023, 1, 20))
+        # Entregado tarde: 4 días desde envío, 5 desde aprobación
+        create_stock_orders_in_state(
+            self.env, self.product_a, self.franchise_b, date(2023, 1, 15), 'overdue', 4,
+            approved_date=date(2023, 1, 15), shipped_date=date(2023, 1, 16),
+            delivered_date=date(2023, 1, 20), requested_delivery_date=date(2023, 1, 18))
+
+    def test_09_stock_kpis_aggregated(self):
+        """Prueba los KPIs de stock agregados en base de datos."""
+        self._create_stock_orders_january()
+        self._refresh_kpi_snapshots()
+        dashboard = self.FranchiseDashboard.create({
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31)
+        })
+
+        self.assertEqual(dashboard.total_stock_orders_count, 4,
+                         "Los pedidos en borrador no deben contarse.")
+        self.assertAlmostEqual(dashboard.total_stock_orders_value, 100, places=2,
+                               msg="El valor total debe ser 10 + 20 + 30 + 40.")
+        self.assertAlmostEqual(dashboard.average_order_value, 25, places=2,
+                               msg="El valor promedio debe ser 100 / 4.")
+        self.assertAlmostEqual(dashboard.stock_debt_total, 30, places=2,
+                               msg="La deuda de stock debe ser solo el pedido entregado.")
+        self.assertEqual(dashboard.stock_debt_orders_count, 1,
+                         "Debe haber 1 pedido entregado sin pagar.")
+        self.assertEqual(dashboard.stock_overdue_orders_count, 1,
+                         "Debe haber 1 pedido vencido.")
+        self.assertAlmostEqual(dashboard.stock_overdue_orders_amount, 40, places=2,
+                               msg="El monto vencido debe ser el pendiente del pedido vencido.")
+        self.assertEqual(dashboard.total_overdue_count, 1,
+                         "En Enero no hay regalías vencidas, solo el pedido.")
+
+    def test_10_stock_operations_kpis_aggregated(self):
+        """Prueba los KPIs operacionales y los tiempos de entrega calculados en SQL."""
+        self._create_stock_orders_january()
+        self._refresh_kpi_snapshots()
+        dashboard = self.FranchiseDashboard.create({
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31)
+        })
+
+        self.assertEqual(dashboard.pending_approval_orders, 1, "Debe haber 1 pedido pendiente de aprobación.")
+        self.assertEqual(dashboard.pending_delivery_orders, 1, "Debe haber 1 pedido pendiente de envío.")
+        self.assertEqual(dashboard.in_transit_orders, 0, "No debe haber pedidos en tránsito.")
+        self.assertEqual(dashboard.delivered_orders, 2, "Entregados incluye delivered, paid y overdue.")
+        self.assertAlmostEqual(dashboard.average_delivery_time, 3.0, places=2,
+                               msg="El promedio desde envío debe ser (2 + 4) / 2.")
+        self.assertAlmostEqual(dashboard.average_delivery_from_approval, 4.0, places=2,
+                               msg="El promedio desde aprobación debe ser (3 + 5) / 2.")
+        self.assertAlmostEqual(dashboard.on_time_delivery_rate, 0.5, places=2,
+                               msg="Solo 1 de 2 entregas fue a tiempo.")
+
+        # Filtro por franquicia: A no tiene entregas
+        dashboard_a = self.FranchiseDashboard.create({
+            'franchise_id': self.franchise_a.id,
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31)
+        })
+        self.assertEqual(dashboard_a.total_stock_orders_count, 2, "Franquicia A tiene 2 pedidos no borrador.")
+        self.assertEqual(dashboard_a.delivered_orders, 0, "Franquicia A no tiene entregas.")
+        self.assertEqual(dashboard_a.on_time_delivery_rate, 0.0,
+                         "Sin entregas la tasa de puntualidad debe ser 0.")
+
+    def test_11_executive_sections_loaded_independently(self):
+        """Prueba que cada sección del dashboard ejecutivo se obtiene por separado con su tiempo de servidor."""
+        self._create_stock_orders_january()
+        self._refresh_kpi_snapshots()
+
+        royalties = self.ExecutiveDashboard.get_section_data('royalties')
+        self.assertEqual(royalties['section'], 'royalties')
+        self.assertAlmostEqual(royalties['values']['total_royalties_calculated'], 350, places=2,
+                               msg="La sección de regalías debe incluir todos los pagos no borrador.")
+        self.assertGreaterEqual(royalties['server_time_ms'], 0, "Cada sección debe informar su tiempo de servidor.")
+        self.assertNotIn('active_franchises', royalties['values'],
+                         "La sección de regalías no debe calcular KPIs de otras secciones.")
+
+        stock = self.ExecutiveDashboard.get_section_data('stock')
+        self.assertEqual(stock['values']['pending_approval_orders'], 1)
+        self.assertEqual(stock['values']['stock_overdue_orders_count'], 1)
+
+        franchises = self.ExecutiveDashboard.get_section_data('franchises')
+        self.assertGreaterEqual(franchises['values']['active_franchises'], 2)
+
+        with self.assertRaises(UserError):
+            self.ExecutiveDashboard.get_section_data('unknown')
+
+    def test_12_lead_time_percentiles_by_franchise(self):
+        """Prueba los percentiles de lead time (aprobación → entrega) y el desglose por franquicia."""
+        self._create_stock_orders_january()
+        # Entrega lenta de Franquicia A: 10 días desde aprobación
+        create_stock_orders_in_state(
+            self.env, self.product_a, self.franchise_a, date(2023, 1, 18), 'paid', 1,
+            approved_date=date(2023, 1, 20), shipped_date=date(2023, 1, 25),
+            delivered_date=date(2023, 1, 30), requested_delivery_date=date(2023, 1, 28))
+        self._refresh_kpi_snapshots()
+
+        dashboard = self.FranchiseDashboard.create({
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31)
+        })
+
+        # Lead times: 3, 5 y 10 días
+        self.assertAlmostEqual(dashboard.lead_time_p50, 5.0, places=2, msg="La mediana debe ser 5 días.")
+        self.assertAlmostEqual(dashboard.lead_time_p90, 9.0, places=2, msg="El p90 interpolado debe ser 9 días.")
+        self.assertAlmostEqual(dashboard.lead_time_p99, 9.9, places=2, msg="El p99 interpolado debe ser 9.9 días.")
+        self.assertAlmostEqual(dashboard.average_delivery_from_approval, 6.0, places=2)
+
+        lines = {line.franchise_id: line for line in dashboard.lead_time_line_ids}
+        self.assertEqual(set(lines), {self.franchise_a, self.franchise_b},
+                         "Debe haber una línea por franquicia con entregas.")
+        self.assertEqual(lines[self.franchise_b].delivered_count, 2)
+        self.assertAlmostEqual(lines[self.franchise_b].lead_time_p50, 4.0, places=2)
+        self.assertAlmostEqual(lines[self.franchise_b].on_time_delivery_rate, 0.5, places=2)
+        self.assertAlmostEqual(lines[self.franchise_a].lead_time_p99, 10.0, places=2)
+        self.assertEqual(lines[self.franchise_a].on_time_delivery_rate, 0.0,
+                         "La entrega de Franquicia A fue posterior a la fecha solicitada.")
+
+    def test_13_franchise_lifecycle_counters_single_query(self):
+        """Prueba que los contadores de ciclo de vida coinciden con los conteos del ORM."""
+        Franchise = self.env['gelroy.franchise']
+        today = date.today()
+        Franchise.create({
+            'name': 'Franquicia Por Vencer',
+            'franchise_code': 'EXP01',
+            'franchise_type': 'restaurant',
+            'contract_start_date': today - relativedelta(years=2),
+            'contract_end_date': today + relativedelta(days=30),
+        })
+        closed = Franchise.create({
+            'name': 'Franquicia Cerrada',
+            'franchise_code': 'CLS01',
+            'franchise_type': 'restaurant',
+        })
+        closed.write({'active': False})
+
+        engine = self.env['gelroy.kpi.engine']
+        lifecycle = engine._get_franchise_lifecycle_kpis(today=today)
+
+        self.assertEqual(lifecycle['active'], Franchise.search_count([]))
+        self.assertEqual(lifecycle['expiring'], Franchise.search_count([
+            ('contract_end_date', '>=', today),
+            ('contract_end_date', '<=', today + relativedelta(days=90)),
+        ]), "Los contratos por vencer deben coincidir con la búsqueda del ORM.")
+        for name, days in (('month', 30), ('quarter', 90), ('year', 365)):
+            since = datetime.combine(today - relativedelta(days=days), time.min)
+            self.assertEqual(lifecycle['new'][name], Franchise.search_count([('create_date', '>=', since)]))
+            self.assertEqual(lifecycle['closed'][name], Franchise.search_count([
+                ('active', '=', False), ('write_date', '>=', since),
+            ]), f"Las franquicias cerradas ({name}) deben coincidir con el ORM.")
+        self.assertGreaterEqual(lifecycle['closed']['month'], 1, "La franquicia archivada debe contarse como cerrada.")
+
+        # Ventanas configurables
+        custom = engine._get_franchise_lifecycle_kpis(windows={'week': 7}, today=today)
+        self.assertEqual(set(custom['new']), {'week'})
+
+    def test_14_franchise_leaderboard_ranking(self):
+        """Prueba el ranking comparativo: métricas por franquicia, posiciones, orden y paginación."""
+        Leaderboard = self.env['gelroy.franchise.leaderboard']
+        result = Leaderboard.get_leaderboard(date(2023, 1, 1), date(2023, 12, 31), order='collection_rank', limit=1000)
+        rows = {row['franchise_id']: row for row in result['records']}
+        row_a, row_b = rows[self.franchise_a.id], rows[self.franchise_b.id]
+
+        self.assertEqual(result['total'], len(result['records']), "Sin paginar deben venir todas las franquicias.")
+        self.assertAlmostEqual(row_a['collection_rate'], 100 / 150, places=4)
+        self.assertAlmostEqual(row_b['collection_rate'], 1.0, places=4)
+        self.assertAlmostEqual(row_a['outstanding_debt'], 50, places=2, msg="La deuda de A es la regalía vencida.")
+        self.assertLess(row_b['collection_rank'], row_a['collection_rank'],
+                        "Franquicia B cobra mejor y debe rankear por delante.")
+        self.assertLess(row_b['debt_rank'], row_a['debt_rank'], "Menos deuda implica mejor posición.")
+
+        # Paginación en el servidor
+        page = Leaderboard.get_leaderboard(date(2023, 1, 1), date(2023, 12, 31),
+                                           order='outstanding_debt desc', limit=1, offset=0)
+        self.assertEqual(len(page['records']), 1)
+        self.assertEqual(page['total'], result['total'], "El total no depende de la página pedida.")
+        self.assertGreaterEqual(page['records'][0]['outstanding_debt'], row_a['outstanding_debt'])
+
+        with self.assertRaises(UserError):
+            Leaderboard.get_leaderboard(order='id; DROP TABLE gelroy_franchise')
+
+        # Vista SQL histórica: mismas métricas para el rango completo
+        self.env.flush_all()
+        record_a = Leaderboard.search([('franchise_id', '=', self.franchise_a.id)])
+        self.assertAlmostEqual(record_a.outstanding_debt, 50, places=2)
+
+    def test_15_kpi_series_by_month(self):
+        """Prueba las series mensuales: intervalos vacíos completados y totales iguales al dashboard."""
+        series = self.FranchiseDashboard.get_kpi_series(
+            ['royalties_calculated', 'royalties_paid', 'overdue'], 'month',
+            franchise_id=self.franchise_a.id, date_from=date(2023, 1, 1), date_to=date(2023, 3, 31),
+        )
+        self.assertEqual(series['buckets'], ['2023-01-01', '2023-02-01', '2023-03-01'],
+                         "Debe haber un intervalo por mes, incluido Marzo sin datos.")
+        self.assertEqual(series['series']['royalties_calculated'], [100.0, 50.0, 0.0])
+        self.assertEqual(series['series']['royalties_paid'], [100.0, 0.0, 0.0])
+        self.assertEqual(series['series']['overdue'], [0.0, 50.0, 0.0],
+                         msg="El vencido de Febrero debe sumar regalías y pedidos vencidos.")
+
+        # Global: la suma de la serie coincide con el total del dashboard para el mismo rango
+        global_series = self.ExecutiveDashboard.get_kpi_series(
+            ['royalties_calculated'], 'week', date_from=date(2023, 1, 1), date_to=date(2023, 3, 31),
+        )
+        dashboard = self.FranchiseDashboard.create({'date_from': date(2023, 1, 1), 'date_to': date(2023, 3, 31)})
+        self.assertAlmostEqual(sum(global_series['series']['royalties_calculated']),
+                               dashboard.total_royalties_calculated, places=2)
+        self.assertEqual(global_series['buckets'][0], '2022-12-26', "Las semanas empiezan en lunes.")
+
+        with self.assertRaises(UserError):
+            self.FranchiseDashboard.get_kpi_series(['unknown_kpi'])
+
+    def test_16_executive_sections_read_only_snapshots(self):
+        """Prueba que las secciones del ejecutivo no recorren los pedidos para los percentiles de entrega."""
+        kpi_cache.clear()
+        Engine = type(self.env['gelroy.kpi.engine'])
+        with patch.object(Engine, '_get_delivery_kpis', side_effect=AssertionError("percentile scan")):
+            royalties = self.ExecutiveDashboard.get_section_data('royalties')
+            self.ExecutiveDashboard.get_section_data('stock')
+        self.assertAlmostEqual(royalties['values']['total_royalties_calculated'], 350, places=2)
@@ -126,7 +126,7 @@ class TestFranchiseModel(TransactionCase):
     def test_06_compute_financial_summary_no_transactions(self):
         """Prueba los campos de resumen financiero cuando no hay transacciones."""
         franchise = self.Franchise.create(self.franchise_data_valid)
-        franchise._compute_financial_summary() # Forzar cálculo si no se disparó por depends
+        self.assertFalse(franchise._reconcile_financial_summary(), "Sin transacciones no hay diferencias que corregir.")
 
         self.assertAlmostEqual(franchise.total_royalties_due, 0.0, places=2)
         self.assertAlmostEqual(franchise.total_royalties_paid, 0.0, places=2)
@@ -161,8 +161,7 @@ class TestFranchiseModel(TransactionCase):
             'order_date': date(2023, 1, 10),
             'order_line_ids': [(0, 0, {'product_id': product_b.id, 'quantity': 5, 'unit_price': 10})]
         })
-        # Cambiar estado usando SQL directo para evitar validaciones
-        self.env.cr.execute("UPDATE gelroy_stock_order SET state = 'delivered' WHERE id = %s", (so1.id,))
+        so1.write({'state': 'delivered'})
 
         # Crear pedido de stock pagado
         so2 = self.StockOrder.create({
@@ -170,16 +169,7 @@ class TestFranchiseModel(TransactionCase):
             'order_date': date(2023, 2, 10),
             'order_line_ids': [(0, 0, {'product_id': product_b.id, 'quantity': 3, 'unit_price': 10})]
         })
-        # Cambiar estado usando SQL directo para evitar validaciones
-        self.env.cr.execute("UPDATE gelroy_stock_order SET state = 'paid' WHERE id = %s", (so2.id,))
-
-        # Invalidar caché para refrescar los registros
-        so1.invalidate_recordset()
-        so2.invalidate_recordset()
-
-        # Forzar recálculo usando invalidate_recordset
-        franchise.invalidate_recordset(['total_royalties_due', 'total_royalties_paid', 'outstanding_royalties',
-                                       'outstanding_stock_orders', 'total_outstanding_debt'])
+        so2.write({'state': 'paid'})
 
         # Verificar los valores calculados
         self.assertAlmostEqual(franchise.total_royalties_paid, 100.00, places=2, msg="Total de regalías pagadas incorrecto") 
@@ -202,3 +192,153 @@ class TestFranchiseModel(TransactionCase):
         self.assertIsNotNone(action)
         self.assertEqual(action.get('res_model'), 'gelroy.stock.order')
         self.assertEqual(action.get('domain'), [('franchise_id', '=', franchise.id)])
+
+    def test_10_financial_summary_deltas_and_reconciliation(self):
+        """Prueba que el resumen se actualiza por deltas y que la conciliación corrige desvíos."""
+        franchise = self.Franchise.create(self.franchise_data_valid)
+        product = self.env['product.product'].create({
+            'name': 'Producto Resumen', 'detailed_type': 'consu', 'list_price': 10, 'taxes_id': [(5, 0, 0)],
+        })
+        orders = self.StockOrder.create([{
+            'franchise_id': franchise.id,
+            'order_date': date(2023, 1, 10),
+            'order_line_ids': [(0, 0, {'product_id': product.id, 'quantity': quantity})],
+        } for quantity in (2, 4)])
+
+        orders.write({'state': 'delivered'})
+        self.assertAlmostEqual(franchise.outstanding_stock_orders, 60.0, places=2)
+        self.assertEqual(franchise.pending_stock_orders_count, 2)
+
+        orders[0].write({'state': 'paid'})
+        self.assertAlmostEqual(franchise.outstanding_stock_orders, 40.0, places=2,
+                               msg="Pagar un pedido solo debe restar su aporte.")
+        self.assertEqual(franchise.pending_stock_orders_count, 1)
+        self.assertFalse(franchise._reconcile_financial_summary(), "Los deltas deben coincidir con el agregado.")
+
+        # Desvío forzado por fuera del ORM: la conciliación lo detecta y lo corrige
+        self.env.cr.execute("UPDATE gelroy_franchise SET outstanding_stock_orders = 999 WHERE id = %s", [franchise.id])
+        franchise.invalidate_recordset(['outstanding_stock_orders'])
+        self.Franchise._cron_reconcile_financial_summary()
+        self.assertAlmostEqual(franchise.outstanding_stock_orders, 40.0, places=2)
+        self.assertAlmostEqual(franchise.total_outstanding_debt, 40.0, places=2)
+
+    def test_11_debt_ledger_balances_and_aging(self):
+        """Prueba el libro de deuda: débitos, pagos, reversiones, saldos históricos y antigüedad."""
+        franchise = self.Franchise.create(self.franchise_data_valid)
+        Ledger = self.env['gelroy.debt.ledger']
+        today = date.today()
+        product = self.env['product.product'].create({
+            'name': 'Producto Libro', 'detailed_type': 'consu', 'list_price': 10, 'taxes_id': [(5, 0, 0)],
+        })
+        orders = self.StockOrder.create([{
+            'franchise_id': franchise.id,
+            'order_date': today,
+            'payment_due_date': today - relativedelta(days=days_overdue),
+            'order_line_ids': [(0, 0, {'product_id': product.id, 'quantity': quantity})],
+        } for quantity, days_overdue in ((2, 10), (4, 45))])
+        self.assertFalse(Ledger.search([('franchise_id', '=', franchise.id)]),
+                         "Los pedidos en borrador no generan deuda.")
+
+        orders.write({'state': 'delivered'})
+        entries = Ledger.search([('franchise_id', '=', franchise.id)], order='id')
+        self.assertEqual(entries.mapped('event_type'), ['order_delivered', 'order_delivered'])
+        self.assertAlmostEqual(entries[-1].balance, 60.0, places=2)
+
+        orders[0].write({'state': 'paid'})
+        orders[1].action_reset_to_draft()
+        entries = Ledger.search([('franchise_id', '=', franchise.id)], order='id')
+        self.assertEqual(entries[2:].mapped('event_type'), ['payment', 'reversal'])
+        self.assertAlmostEqual(entries[-1].balance, 0.0, places=2, msg="El saldo acumulado debe volver a cero.")
+
+        # Saldo actual e histórico y antigüedad con la deuda abierta
+        orders[1].write({'state': 'delivered'})
+        balances = Ledger._get_balances([franchise.id])
+        self.assertAlmostEqual(balances[franchise.id], 40.0, places=2)
+        self.assertAlmostEqual(Ledger._get_balances([franchise.id], today - relativedelta(days=1))[franchise.id], 0.0)
+        aging = Ledger._get_aging([franchise.id])[franchise.id]
+        self.assertAlmostEqual(aging['31_60'], 40.0, places=2)
+        self.assertAlmostEqual(sum(aging.values()), 40.0, places=2)
+
+        # El libro es de solo anexado
+        with self.assertRaises(UserError):
+            entries[0].write({'amount': 0.0})
+        with self.assertRaises(UserError):
+            entries.unlink()
+
+        action = franchise.action_view_all_debts()
+        self.assertEqual(action.get('res_model'), 'gelroy.debt.ledger')
+        self.assertEqual(action.get('domain'), [('franchise_id', 'in', franchise.ids)])
+
+    def test_12_reconcile_with_unpaid_calculated_royalty(self):
+        """Prueba la conciliación con una regalía calculada sin pagar (paid_amount vacío en la base)."""
+        franchise = self.Franchise.create(self.franchise_data_valid)
+        payment = self.RoyaltyPayment.create(franchise._prepare_royalty_payment_vals(
+            date(2023, 1, 1), date(2023, 1, 31), 1000.0,
+        ))
+        self.env.flush_all()
+        self.env.cr.execute("SELECT paid_amount FROM gelroy_royalty_payment WHERE id = %s", [payment.id])
+        self.assertIsNone(self.env.cr.fetchone()[0], "El pago calculado no debe tener monto pagado.")
+
+        self.assertFalse(franchise._reconcile_financial_summary(), "Los deltas deben coincidir con el agregado.")
+        self.assertAlmostEqual(franchise.total_royalties_due, 50.0, places=2)
+        self.assertAlmostEqual(franchise.total_royalties_paid, 0.0, places=2)
+        self.assertAlmostEqual(franchise.outstanding_royalties, 50.0, places=2)
+
+        # Cambiar el porcentaje concilia el resumen sin fallar
+        franchise.write({'royalty_fee_percentage': 10.0})
+        self.assertAlmostEqual(franchise.total_royalties_due, 100.0, places=2)
+        self.assertAlmostEqual(franchise.total_outstanding_debt, 100.0, places=2)
+
+    def test_13_debt_ledger_seeds_itself_when_empty(self):
+        """Prueba que con el libro vacío (base actualizada) el primer cambio carga antes el historial."""
+        franchise = self.Franchise.create(self.franchise_data_valid)
+        Ledger = self.env['gelroy.debt.ledger']
+        product = self.env['product.product'].create({
+            'name': 'Producto Historial', 'detailed_type': 'consu', 'list_price': 10, 'taxes_id': [(5, 0, 0)],
+        })
+        order_vals = {
+            'franchise_id': franchise.id,
+            'order_date': date(2023, 1, 10),
+            'order_line_ids': [(0, 0, {'product_id': product.id, 'quantity': 2})],
+        }
+        order = self.StockOrder.create(order_vals)
+        order.write({'state': 'delivered', 'delivered_date': date(2023, 1, 15)})
+        self.env.flush_all()
+        self.env.cr.execute("DELETE FROM gelroy_debt_ledger")
+        self.env.invalidate_all()
+
+        self.StockOrder.create(order_vals)
+        entries = Ledger.search([('franchise_id', '=', franchise.id)])
+        self.assertEqual(entries.mapped('res_id'), order.ids, "Solo el pedido entregado genera deuda.")
+        self.assertEqual(entries.date, date(2023, 1, 15),
+                         "El historial se asienta en su fecha de origen y no con la fecha de hoy.")
+        self.assertAlmostEqual(Ledger._get_balances([franchise.id])[franchise.id], 20.0, places=2)
+
+    def test_14_debt_ledger_books_partial_invoice_payments(self):
+        """Prueba que el libro sigue el saldo pendiente del pedido y asienta los cobros parciales como pago."""
+        franchise = self.Franchise.create(self.franchise_data_valid)
+        Ledger = self.env['gelroy.debt.ledger']
+        product = self.env['product.product'].create({
+            'name': 'Producto Cobro', 'detailed_type': 'consu', 'list_price': 50, 'taxes_id': [(5, 0, 0)],
+        })
+        order = self.StockOrder.create({
+            'franchise_id': franchise.id,
+            'order_date': date(2023, 1, 10),
+            'order_line_ids': [(0, 0, {'product_id': product.id, 'quantity': 2})],
+        })
+        order.write({'state': 'delivered', 'delivered_date': date(2023, 1, 15)})
+        self.assertAlmostEqual(Ledger._get_balances([franchise.id])[franchise.id], 100.0, places=2)
+
+        invoice = self.env['account.move'].browse(order.action_create_invoice()['res_id'])
+        invoice.action_post()
+        self.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=invoice.ids,
+        ).create({'amount': 40.0})._create_payments()
+        invoice.write({'payment_state': 'partial'})
+
+        payment_entry = Ledger.search([('res_id', '=', order.id), ('res_model', '=', order._name),
+                                       ('amount', '<', 0)])
+        self.assertEqual(payment_entry.event_type, 'payment', "Un cobro parcial no es una reversión.")
+        self.assertAlmostEqual(payment_entry.amount, -40.0, places=2)
+        self.assertAlmostEqual(Ledger._get_balances([franchise.id])[franchise.id], order.outstanding_amount,
+                               places=2, msg="El saldo del libro es lo pendiente del pedido.")
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date
+
+from odoo.addons.gelroy.models.kpi_cache import KpiCache, kpi_cache
+
+
+class TestKpiCache(TransactionCase):
+
+    def setUp(self):
+        super(TestKpiCache, self).setUp()
+        self.dbname = self.env.cr.dbname
+        self.Franchise = self.env['gelroy.franchise']
+        self.RoyaltyPayment = self.env['gelroy.royalty.payment']
+        self.FranchiseDashboard = self.env['gelroy.franchise.dashboard']
+
+        self.franchise_a = self.Franchise.create({
+            'name': 'Franquicia Cache A',
+            'franchise_code': 'CCA01',
+            'franchise_type': 'restaurant',
+            'royalty_fee_percentage': 10.0,
+        })
+        self.franchise_b = self.Franchise.create({
+            'name': 'Franquicia Cache B',
+            'franchise_code': 'CCB01',
+            'franchise_type': 'restaurant',
+            'royalty_fee_percentage': 10.0,
+        })
+        self.royalty_jan = self.RoyaltyPayment.create({
+            'franchise_id': self.franchise_a.id,
+            'period_start_date': date(2023, 1, 1),
+            'period_end_date': date(2023, 1, 31),
+            'period_revenue': 1000,
+            'state': 'paid',
+            'paid_amount': 100,
+        })
+        self.RoyaltyPayment.create({
+            'franchise_id': self.franchise_b.id,
+            'period_start_date': date(2023, 1, 1),
+            'period_end_date': date(2023, 1, 31),
+            'period_revenue': 2000,
+            'state': 'paid',
+            'paid_amount': 200,
+        })
+
+        self.Snapshot = self.env['gelroy.kpi.snapshot']
+        self.Snapshot._refresh_snapshots()
+        kpi_cache.clear()
+        kpi_cache.reset_stats()
+
+    def _key(self, kpi_type, franchise_id=None, date_from=None, date_to=None):
+        return KpiCache.make_key(self.dbname, kpi_type, franchise_id, date_from, date_to, 1)
+
+    def _open_dashboard(self, franchise=None):
+        """Abre el dashboard de Enero 2023 y devuelve el total calculado."""
+        dashboard = self.FranchiseDashboard.create({
+            'franchise_id': franchise.id if franchise else False,
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31),
+        })
+        return dashboard.total_royalties_calculated
+
+    def test_01_lru_eviction_and_counters(self):
+        """Prueba la expulsión LRU y los contadores de aciertos, fallos y expulsiones."""
+        cache = KpiCache(max_size=2, ttl=60)
+        cache.set(self._key('a'), {'value': 1})
+        cache.set(self._key('b'), {'value': 2})
+        self.assertEqual(cache.get(self._key('a')), {'value': 1}, "La entrada 'a' debe estar en caché.")
+        cache.set(self._key('c'), {'value': 3})
+
+        self.assertIsNone(cache.get(self._key('b')), "La entrada menos usada ('b') debe expulsarse.")
+        self.assertEqual(cache.get(self._key('c')), {'value': 3})
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+        self.assertEqual(stats['size'], 2)
+
+    def test_02_ttl_expiration(self):
+        """Prueba que las entradas expiradas cuentan como fallo y se eliminan."""
+        cache = KpiCache(max_size=10, ttl=0)
+        cache.set(self._key('a'), {'value': 1})
+        self.assertIsNone(cache.get(self._key('a')), "Con TTL 0 la entrada debe expirar inmediatamente.")
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_03_scoped_invalidation(self):
+        """Prueba que solo se invalidan las entradas de la franquicia y fechas afectadas."""
+        cache = KpiCache(max_size=10, ttl=60)
+        january_a = self._key('dashboard', 1, date(2023, 1, 1), date(2023, 1, 31))
+        march_a = self._key('dashboard', 1, date(2023, 3, 1), date(2023, 3, 31))
+        january_b = self._key('dashboard', 2, date(2023, 1, 1), date(2023, 1, 31))
+        global_key = self._key('executive_royalties')
+        for key in (january_a, march_a, january_b, global_key):
+            cache.set(key, {'value': 1})
+
+        removed = cache.invalidate(self.dbname, {1}, [(date(2023, 1, 1), date(2023, 1, 31))])
+
+        self.assertEqual(removed, 2, "Debe invalidarse Enero de la franquicia 1 y la entrada global.")
+        self.assertIsNone(cache.get(january_a))
+        self.assertIsNone(cache.get(global_key))
+        self.assertIsNotNone(cache.get(march_a), "Marzo no se solapa con el cambio.")
+        self.assertIsNotNone(cache.get(january_b), "La franquicia 2 no se ve afectada.")
+        self.assertEqual(cache.invalidate('otra_base', None, None), 0,
+                         "No deben invalidarse entradas de otra base de datos.")
+
+    def test_04_dashboard_uses_cache_and_write_invalidates(self):
+        """Prueba que el dashboard reutiliza resultados y que escribir un pago los invalida."""
+        self.assertAlmostEqual(self._open_dashboard(), 300, places=2)
+        self.assertAlmostEqual(self._open_dashboard(), 300, places=2)
+        stats = self.env['gelroy.kpi.engine'].get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1),
+                         "La segunda apertura con los mismos filtros debe salir de la caché.")
+
+        self.royalty_jan.write({'period_revenue': 1500})
+        self.Snapshot._refresh_snapshots()
+        self.assertAlmostEqual(self._open_dashboard(), 350, places=2,
+                               msg="Tras modificar un pago del período, el resultado debe recalcularse.")
+
+    def test_05_changes_outside_scope_keep_entries(self):
+        """Prueba que cambios en otra franquicia no invalidan el dashboard filtrado."""
+        self.assertAlmostEqual(self._open_dashboard(self.franchise_b), 200, places=2)
+        self.royalty_jan.write({'period_revenue': 1500})
+        self.assertAlmostEqual(self._open_dashboard(self.franchise_b), 200, places=2)
+        stats = self.env['gelroy.kpi.engine'].get_cache_stats()
+        self.assertEqual(stats['hits'], 1, "El dashboard de la franquicia B debe seguir en caché.")
+
+    def test_06_invoice_payment_sync_invalidates(self):
+        """Prueba que la sincronización del cobro parcial de una factura invalida la caché del pedido."""
+        self.franchise_a.franchisee_id = self.env['res.partner'].create({'name': 'Franquiciado Cache A'})
+        product = self.env['product.product'].create({
+            'name': 'Producto Cache',
+            'detailed_type': 'consu',
+            'list_price': 10.0,
+            'taxes_id': [(5, 0, 0)],
+        })
+        order = self.env['gelroy.stock.order'].create({
+            'franchise_id': self.franchise_a.id,
+            'order_date': date(2023, 1, 10),
+            'requested_delivery_date': date(2023, 1, 20),
+            'order_line_ids': [(0, 0, {'product_id': product.id, 'quantity': 10})],
+        })
+        order.write({'state': 'delivered'})
+        invoice = self.env['account.move'].browse(order.action_create_invoice()['res_id'])
+        invoice.action_post()
+        self.env.flush_all()
+
+        january_a = self._key('dashboard', self.franchise_a.id, date(2023, 1, 1), date(2023, 1, 31))
+        march_a = self._key('dashboard', self.franchise_a.id, date(2023, 3, 1), date(2023, 3, 31))
+        kpi_cache.set(january_a, {'value': 1})
+        kpi_cache.set(march_a, {'value': 1})
+
+        self.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=invoice.ids,
+        ).create({'amount': 40.0})._create_payments()
+        invoice.write({'payment_state': 'partial'})
+        self.assertAlmostEqual(order.outstanding_amount, 60.0, places=2)
+        self.assertIsNone(kpi_cache.get(january_a), "El cobro debe invalidar el período del pedido.")
+        self.assertIsNotNone(kpi_cache.get(march_a), "Los períodos sin cambios deben conservarse.")
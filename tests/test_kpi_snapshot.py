@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date
+
+from .data_generator import create_stock_orders_in_state
+
+
+class TestKpiSnapshot(TransactionCase):
+
+    def setUp(self):
+        super(TestKpiSnapshot, self).setUp()
+        self.Franchise = self.env['gelroy.franchise']
+        self.RoyaltyPayment = self.env['gelroy.royalty.payment']
+        self.StockOrder = self.env['gelroy.stock.order']
+        self.Snapshot = self.env['gelroy.kpi.snapshot']
+        self.Engine = self.env['gelroy.kpi.engine']
+        self.Stale = self.env['gelroy.kpi.snapshot.stale']
+
+        self.franchise_a = self.Franchise.create({
+            'name': 'Franquicia Snapshot A',
+            'franchise_code': 'SNA01',
+            'franchise_type': 'restaurant',
+            'royalty_fee_percentage': 10.0,
+        })
+        self.franchise_b = self.Franchise.create({
+            'name': 'Franquicia Snapshot B',
+            'franchise_code': 'SNB01',
+            'franchise_type': 'restaurant',
+            'royalty_fee_percentage': 10.0,
+        })
+        self.product = self.env['product.product'].create({
+            'name': 'Producto Snapshot',
+            'detailed_type': 'product',
+            'list_price': 10.0,
+            'taxes_id': [(5, 0, 0)],
+        })
+
+        self.royalty_jan = self.RoyaltyPayment.create({
+            'franchise_id': self.franchise_a.id,
+            'period_start_date': date(2023, 1, 1),
+            'period_end_date': date(2023, 1, 31),
+            'period_revenue': 1000,
+            'state': 'paid',
+            'paid_amount': 100,
+        })
+        self.royalty_feb = self.RoyaltyPayment.create({
+            'franchise_id': self.franchise_a.id,
+            'period_start_date': date(2023, 2, 1),
+            'period_end_date': date(2023, 2, 28),
+            'period_revenue': 500,
+            'state': 'overdue',
+        })
+        self.RoyaltyPayment.create({
+            'franchise_id': self.franchise_b.id,
+            'period_start_date': date(2023, 1, 1),
+            'period_end_date': date(2023, 1, 31),
+            'period_revenue': 2000,
+            'state': 'confirmed',
+        })
+
+        self.order_delivered = create_stock_orders_in_state(
+            self.env, self.product, self.franchise_b, date(2023, 1, 10), 'delivered', 3,
+            approved_date=date(2023, 1, 11), shipped_date=date(2023, 1, 12),
+            delivered_date=date(2023, 1, 14), requested_delivery_date=date(2023, 1, 20))
+        self.order_submitted = create_stock_orders_in_state(
+            self.env, self.product, self.franchise_a, date(2023, 1, 12), 'submitted', 2)
+
+    def _assert_matches_live(self, **filters):
+        """Los KPIs sumados desde snapshots deben coincidir con los calculados en vivo."""
+        snapshot = self.Engine._get_snapshot_kpis(**filters)
+        live = self.Engine._get_live_kpis(**filters)
+        for section in ('royalty', 'delivery'):
+            for key, value in snapshot[section].items():
+                self.assertAlmostEqual(value, live[section][key], places=2,
+                                       msg=f"KPI '{section}.{key}' debe coincidir con el cálculo en vivo ({filters}).")
+        self.assertEqual(snapshot['stock']['count'], live['stock']['count'])
+        self.assertAlmostEqual(snapshot['stock']['amount'], live['stock']['amount'], places=2)
+        self.assertEqual(snapshot['stock']['states'], live['stock']['states'],
+                         f"El detalle por estado debe coincidir con el cálculo en vivo ({filters}).")
+
+    def test_01_full_refresh_matches_live(self):
+        """Prueba que la reconstrucción completa reproduce los KPIs en vivo para distintos filtros."""
+        self.Snapshot._refresh_snapshots(full=True)
+
+        self._assert_matches_live()
+        self._assert_matches_live(date_from=date(2023, 1, 1), date_to=date(2023, 1, 31))
+        self._assert_matches_live(franchise_ids=self.franchise_a.ids, date_from=date(2023, 1, 1), date_to=date(2023, 12, 31))
+        self._assert_matches_live(franchise_ids=self.franchise_b.ids)
+
+        rows = self.Snapshot.search([('document_type', '=', 'royalty'), ('snapshot_date', '=', date(2023, 1, 1))])
+        self.assertEqual(len(rows), 2, "Debe haber una fila por franquicia y estado para el 1 de Enero.")
+        self.assertEqual(sum(rows.mapped('record_count')), 2, "El día debe contar 2 pagos de regalías.")
+
+    def test_02_incremental_refresh_only_touched_days(self):
+        """Prueba que la actualización incremental solo reconstruye los días modificados."""
+        self.Snapshot._refresh_snapshots(full=True)
+        self.assertFalse(self.Stale.search([]), "La reconstrucción completa debe consumir las marcas.")
+        untouched_rows = self.Snapshot.search([('snapshot_date', '!=', date(2023, 2, 1))])
+
+        self.assertEqual(self.Snapshot._refresh_snapshots(), 0,
+                         "Sin cambios no debe reconstruirse ningún día.")
+
+        self.royalty_feb.write({'paid_amount': 20})
+        self.assertEqual(self.Snapshot._refresh_snapshots(), 1,
+                         "Solo debe reconstruirse el día del pago modificado.")
+        self.assertEqual(untouched_rows.exists(), untouched_rows,
+                         "Las filas de los días no tocados deben conservarse.")
+        self._assert_matches_live()
+
+    def test_03_moved_and_deleted_documents(self):
+        """Prueba que mover o borrar documentos reconstruye también el día anterior."""
+        self.Snapshot._refresh_snapshots(full=True)
+
+        self.royalty_jan.write({
+            'period_start_date': date(2023, 3, 1),
+            'period_end_date': date(2023, 3, 31),
+        })
+        self.order_submitted.unlink()
+        self.Snapshot._refresh_snapshots()
+
+        self._assert_matches_live()
+        self.assertFalse(self.Stale.search([]),
+                         "No deben quedar días marcados como obsoletos tras actualizar.")
+        self.assertFalse(self.Snapshot.search([
+            ('document_type', '=', 'stock_order'),
+            ('snapshot_date', '=', date(2023, 1, 12)),
+        ]), "El día del pedido eliminado no debe tener filas.")
+
+    def test_04_dashboards_read_snapshots(self):
+        """Prueba que los dashboards suman los snapshots sin actualizarlos al leer."""
+        self.Snapshot._refresh_snapshots()
+        dashboard = self.env['gelroy.franchise.dashboard'].create({
+            'date_from': date(2023, 1, 1),
+            'date_to': date(2023, 1, 31),
+        })
+        self.assertAlmostEqual(dashboard.total_royalties_calculated, 300, places=2)
+        self.assertAlmostEqual(dashboard.total_stock_orders_value, 50, places=2)
+        self.assertAlmostEqual(dashboard.average_delivery_time, 2.0, places=2)
+
+        executive = self.env['gelroy.executive.dashboard'].create({})
+        self.assertAlmostEqual(executive.total_royalties_calculated, 350, places=2,
+                               msg="El dashboard ejecutivo debe sumar todos los snapshots.")
+        self.assertEqual(executive.pending_approval_orders, 1)
+        self.assertEqual(executive.delivered_unpaid_orders_count, 1)
+
+        # Un cambio posterior solo aparece en el dashboard tras la actualización
+        self.royalty_feb.write({'period_revenue': 1000})
+        executive = self.env['gelroy.executive.dashboard'].create({})
+        self.assertAlmostEqual(executive.total_royalties_calculated, 350, places=2,
+                               msg="Leer el dashboard no debe reconstruir los snapshots.")
+        self.env.flush_all()
+        self.assertTrue(self.Stale.search([('snapshot_date', '=', date(2023, 2, 1))]),
+                        "El día modificado debe quedar marcado para la acción planificada.")
+        self.Snapshot._cron_refresh_snapshots()
+        executive = self.env['gelroy.executive.dashboard'].create({})
+        self.assertAlmostEqual(executive.total_royalties_calculated, 400, places=2)
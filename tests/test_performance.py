@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command, fields
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.gelroy.models.franchise_dashboard import EXECUTIVE_SECTIONS
+from odoo.addons.gelroy.models.kpi_cache import kpi_cache
+
+from .data_generator import create_stock_orders_in_state
+
+# Tamaños comparados: el costo de 50 registros no puede crecer como 50 veces el de 1
+SMALL_BATCH = 1
+LARGE_BATCH = 50
+# Consultas fijas de tolerancia entre ambas mediciones (prefetch, lotes de flush)
+QUERY_SLACK = 5
+# Consultas por registro adicional permitidas en cada camino, además de las del chatter
+# (cada mensaje creado se cuenta y se cobra a lo que cuesta un message_post medido en el test)
+DASHBOARD_QUERY_BUDGET = 0      # los dashboards agregan en la base de datos
+WORKFLOW_QUERY_BUDGET = 0       # transiciones de estado: lecturas y escrituras en lote
+LINE_QUERY_BUDGET = 3           # líneas creadas en el mismo create()
+
+
+@tagged('gelroy_performance')
+class TestQueryBudgets(TransactionCase):
+    """
+    Presupuestos de consultas de los caminos críticos.
+    Cada operación se mide con 1 y con 50 registros: la diferencia por registro
+    adicional debe quedar dentro del presupuesto, así un search() por registro
+    (N+1) vuelve a aparecer como fallo del test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.Franchise = self.env['gelroy.franchise']
+        self.StockOrder = self.env['gelroy.stock.order']
+        self.AccountMove = self.env['account.move']
+        self.stock_location = self.env.ref('stock.stock_location_stock')
+
+        self.franchisee = self.env['res.partner'].create({'name': 'Franquiciado Rendimiento'})
+        self.franchise = self.Franchise.create({
+            'name': 'Franquicia Rendimiento',
+            'franchise_code': 'PERF01',
+            'franchisee_id': self.franchisee.id,
+            'franchise_type': 'restaurant',
+            'royalty_fee_percentage': 10.0,
+        })
+        self.products = self.env['product.product'].create([{
+            'name': f'Producto Rendimiento {index}',
+            'detailed_type': 'product',
+            'list_price': 10.0 + index,
+            'taxes_id': [Command.clear()],
+        } for index in range(LARGE_BATCH)])
+        for product in self.products:
+            self.env['stock.quant']._update_available_quantity(product, self.stock_location, 100000)
+        self.today = fields.Date.context_today(self.StockOrder)
+        self._message_cost = None
+
+    # UTILIDADES
+    def _count_messages(self):
+        self.env['mail.message'].flush_model()
+        self.env.cr.execute("SELECT COUNT(*) FROM mail_message")
+        return self.env.cr.fetchone()[0]
+
+    def _count_queries(self, operation):
+        """
+        Consultas de operation(), con cachés vacías y escrituras pendientes incluidas,
+        y cantidad de mensajes de chatter que creó: (consultas, mensajes)
+        """
+        kpi_cache.clear()
+        self.env.flush_all()
+        self.env.invalidate_all()
+        messages_before = self._count_messages()
+        queries_before = self.env.cr.sql_log_count
+        operation()
+        self.env.flush_all()
+        queries = self.env.cr.sql_log_count - queries_before
+        return queries, self._count_messages() - messages_before
+
+    def _measure_growth(self, build, operation):
+        """Consultas y mensajes adicionales de operation() con LARGE_BATCH registros respecto de SMALL_BATCH"""
+        small_inputs = build(SMALL_BATCH)
+        small_queries, small_messages = self._count_queries(lambda: operation(small_inputs))
+        large_inputs = build(LARGE_BATCH)
+        large_queries, large_messages = self._count_queries(lambda: operation(large_inputs))
+        return small_queries, large_queries, large_messages - small_messages
+
+    def _get_message_cost(self):
+        """Consultas que cuesta un mensaje de chatter: un message_post en cada pedido, medido una vez"""
+        if self._message_cost is None:
+            def post(orders):
+                for order in orders:
+                    order.message_post(body="Medición")
+
+            small, large, messages = self._measure_growth(self._create_orders, post)
+            self._message_cost = (large - small) / messages
+        return self._message_cost
+
+    def _assert_query_budget(self, build, operation, per_record_budget, baseline=None):
+        """
+        build(n) prepara los datos para n registros; operation(datos) es lo que se mide.
+        Verifica que el costo adicional por registro no supere per_record_budget más los
+        mensajes de chatter creados. baseline (build, operation) mide aparte un costo
+        ajeno al camino (p. ej. el motor de inventario), que también se permite.
+        """
+        small, large, messages = self._measure_growth(build, operation)
+        allowed = small + per_record_budget * (LARGE_BATCH - SMALL_BATCH) + QUERY_SLACK
+        if baseline:
+            baseline_small, baseline_large, baseline_messages = self._measure_growth(*baseline)
+            allowed += baseline_large - baseline_small
+            messages -= baseline_messages
+        allowed += messages * self._get_message_cost()
+        self.assertLessEqual(
+            large, allowed,
+            f"{LARGE_BATCH} registros usan {large} consultas y 1 registro {small}: "
+            f"el presupuesto es {per_record_budget} consultas por registro adicional "
+            f"más {messages} mensajes de chatter.",
+        )
+
+    def _create_orders(self, count, state='draft', lines=1, order_date=None):
+        order_date = order_date or self.today
+        flow_dates = {'approved_date': order_date, 'shipped_date': order_date} if state != 'draft' else {}
+        return create_stock_orders_in_state(
+            self.env, self.products[:lines], self.franchise, order_date, state, count=count, **flow_dates,
+        )
+
+    # DASHBOARDS
+    def test_01_franchise_dashboard_constant_queries(self):
+        """Abrir el dashboard filtrable no depende de la cantidad de pedidos."""
+        def build(count):
+            self._create_orders(count, 'delivered', order_date=date(2023, 1, 10))
+            self.env['gelroy.kpi.snapshot']._refresh_snapshots()
+            return None
+
+        def open_dashboard(_inputs):
+            dashboard = self.env['gelroy.franchise.dashboard'].create({
+                'date_from': date(2023, 1, 1), 'date_to': date(2023, 1, 31),
+            })
+            dashboard.read(list(dashboard._fields))
+
+        self._assert_query_budget(build, open_dashboard, DASHBOARD_QUERY_BUDGET)
+
+    def test_02_executive_dashboard_constant_queries(self):
+        """Las secciones del dashboard ejecutivo y el ranking no dependen de la cantidad de pedidos."""
+        def build(count):
+            self._create_orders(count, 'delivered', order_date=self.today)
+            self.env['gelroy.kpi.snapshot']._refresh_snapshots()
+            return None
+
+        def open_dashboard(_inputs):
+            Executive = self.env['gelroy.executive.dashboard']
+            for section in EXECUTIVE_SECTIONS:
+                Executive.get_section_data(section)
+            self.env['gelroy.franchise.leaderboard'].get_leaderboard(limit=20)
+
+        self._assert_query_budget(build, open_dashboard, DASHBOARD_QUERY_BUDGET)
+
+    # FLUJO DE PEDIDOS
+    def test_03_submit_orders(self):
+        """Enviar pedidos: solo el chatter puede costar consultas por pedido."""
+        self._assert_query_budget(
+            lambda count: self._create_orders(count, lines=3),
+            lambda orders: orders.action_submit(),
+            WORKFLOW_QUERY_BUDGET,
+        )
+
+    def test_04_approve_orders(self):
+        """Aprobar pedidos: el stock disponible se lee en lote."""
+        self._assert_query_budget(
+            lambda count: self._create_orders(count, 'submitted', lines=3),
+            lambda orders: orders.action_approve(),
+            WORKFLOW_QUERY_BUDGET,
+        )
+
+    def test_05_ship_orders(self):
+        """Enviar a tránsito: fuera del motor de inventario y del chatter, nada cuesta por pedido."""
+        def build(count):
+            return self._create_orders(count, 'approved', lines=3)
+
+        def ship_pickings(orders):
+            orders._create_shipment_pickings(orders.order_line_ids)
+
+        self._assert_query_budget(
+            build,
+            lambda orders: orders.action_start_transit(),
+            WORKFLOW_QUERY_BUDGET,
+            baseline=(build, ship_pickings),
+        )
+
+    # FACTURACIÓN
+    def test_06_create_invoice(self):
+        """Facturar un pedido: el costo por línea de factura es acotado."""
+        self._assert_query_budget(
+            lambda count: self._create_orders(1, 'delivered', lines=count),
+            lambda order: order.action_create_invoice(),
+            LINE_QUERY_BUDGET,
+        )
+
+    def test_07_sync_invoice_payment_state(self):
+        """Sincronizar el pago de facturas con sus pedidos: una búsqueda por modelo para todo el lote."""
+        def build(count):
+            orders = self._create_orders(count, 'delivered')
+            return self.AccountMove.create([{
+                'move_type': 'out_invoice',
+                'partner_id': self.franchisee.id,
+                'invoice_origin': order.name,
+                'invoice_line_ids': [Command.create({
+                    'product_id': self.products[0].id,
+                    'quantity': 1,
+                    'price_unit': 10.0,
+                    'tax_ids': [Command.clear()],
+                })],
+            } for order in orders])
+
+        self._assert_query_budget(
+            build,
+            lambda invoices: invoices.write({'payment_state': 'paid'}),
+            WORKFLOW_QUERY_BUDGET,
+        )
+
+    # PRODUCCIÓN
+    def test_08_production_planning_stock_order(self):
+        """Crear el pedido de una planificación: el costo por receta planificada es acotado."""
+        def build(count):
+            recipes = self.env['gelroy.recipe'].create([{
+                'name': f'Receta Rendimiento {index}',
+                'code': f'PERF-R{index}',
+                'category': 'food',
+                'ingredient_ids': [Command.create({'product_id': product.id, 'quantity': 1})],
+            } for index, product in enumerate(self.products[:count])])
+            planning = self.env['gelroy.production.planning'].create({
+                'franchise_id': self.franchise.id,
+                'period_start_date': self.today + relativedelta(days=10),
+                'period_end_date': self.today + relativedelta(days=20),
+                'planning_line_ids': [Command.create({
+                    'recipe_id': recipe.id, 'estimated_quantity': 1,
+                }) for recipe in recipes],
+            })
+            planning.action_confirm()
+            return planning
+
+        self._assert_query_budget(
+            build,
+            lambda planning: planning.action_create_stock_order(),
+            LINE_QUERY_BUDGET,
+        )
+
+    # FRANQUICIAS
+    def test_09_franchise_list_counters(self):
+        """Los contadores de la lista de franquicias se calculan con un conteo agrupado por modelo."""
+        def build(count):
+            franchises = self.Franchise.create([{
+                'name': f'Franquicia Contadores {index}',
+                'franchise_code': f'PERF-C{count}-{index}',
+                'franchisee_id': self.franchisee.id,
+                'franchise_type': 'restaurant',
+            } for index in range(count)])
+            self.StockOrder.create([{
+                'franchise_id': franchise.id,
+                'order_date': self.today,
+                'order_line_ids': [Command.create({'product_id': self.products[0].id, 'quantity': 1})],
+            } for franchise in franchises])
+            return franchises
+
+        self._assert_query_budget(
+            build,
+            lambda franchises: franchises.read([
+                'royalty_payment_count', 'overdue_royalty_payment_count',
+                'stock_order_count', 'overdue_stock_order_count',
+                'pending_royalty_payments', 'pending_stock_orders_count',
+            ]),
+            DASHBOARD_QUERY_BUDGET,
+        )
@@ -4,6 +4,7 @@ from odoo.exceptions import UserError, ValidationError
 from odoo import fields
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
+from psycopg2 import IntegrityError
 
 class TestRoyaltyPayment(TransactionCase):
 
@@ -131,9 +132,13 @@ class TestRoyaltyPayment(TransactionCase):
                 'period_revenue': -100.00, # Inválido
             })
 
-        # Pago duplicado para la misma franquicia y mes
-        self.RoyaltyPayment.create(self.payment_data_valid) # Crea para 2025-06
-        with self.assertRaises(ValidationError, msg="No debe permitir pago duplicado para el mismo mes/franquicia."):
+        # Pago duplicado para la misma franquicia y mes: lo rechaza la base de datos.
+        # Los pagos cancelados no cuentan.
+        cancelled = self.RoyaltyPayment.create(self.payment_data_valid) # Crea para 2025-06
+        cancelled.action_cancel()
+        payment = self.RoyaltyPayment.create(self.payment_data_valid)
+        self.assertEqual(payment.period_key, '2025-06')
+        with self.assertRaises(IntegrityError, msg="No debe permitir pago duplicado para el mismo mes/franquicia."):
             self.RoyaltyPayment.create({
                 'franchise_id': self.test_franchise.id,
                 'period_start_date': date(2025, 6, 10), # Inicio diferente
@@ -370,4 +375,55 @@ class TestRoyaltyPayment(TransactionCase):
             payment.action_confirm()
         
         with self.assertRaises(UserError):
-            payment.action_register_payment()
\ No newline at end of file
+            payment.action_register_payment()
+
+    def test_17_royalty_run_batch_and_resume(self):
+        """Prueba la corrida de regalías: cálculo en lote, duplicados, resultados y reanudación."""
+        franchises = self.Franchise.create([{
+            'name': f'Franquicia Corrida {index}',
+            'franchise_code': f'FRUN{index}',
+            'franchisee_id': self.franchisee_partner.id,
+            'royalty_fee_percentage': 5.0 if index else 0.0,
+            'monthly_revenue': 2000.0,
+            'currency_id': self.Currency.id,
+            'franchise_type': 'restaurant',
+        } for index in range(4)])
+        # La franquicia 1 ya tiene su regalía del mes: debe omitirse sin error
+        self.RoyaltyPayment.create(dict(self.payment_data_valid, franchise_id=franchises[1].id))
+
+        run = self.env['gelroy.royalty.run'].create({
+            'period_start_date': date(2025, 6, 1),
+            'period_end_date': date(2025, 6, 30),
+            'franchise_domain': str([('id', 'in', franchises.ids)]),
+            'chunk_size': 2,
+        })
+        run.action_start()
+        self.assertEqual(run.state, 'running')
+        run._process()
+
+        self.assertEqual(run.state, 'done')
+        self.assertEqual(run.last_franchise_id, max(franchises.ids), "El punto de control debe llegar a la última franquicia.")
+        results = {line.franchise_id: line.result for line in run.line_ids}
+        self.assertEqual(results[franchises[0]], 'no_rate')
+        self.assertEqual(results[franchises[1]], 'duplicate')
+        self.assertEqual(results[franchises[2]], 'created')
+        self.assertEqual(run.created_count, 2)
+        self.assertEqual(run.skipped_count, 2)
+        self.assertEqual(len(run.payment_ids), 2)
+        for payment in run.payment_ids:
+            self.assertAlmostEqual(payment.period_revenue, 2000.0, places=2, msg="El pago debe guardar la base de ventas.")
+            self.assertAlmostEqual(payment.calculated_amount, 100.0, places=2)
+            self.assertEqual(payment.state, 'calculated')
+
+        # Reanudar una corrida terminada no vuelve a crear pagos
+        run.write({'state': 'failed'})
+        run.action_resume()
+        run._process()
+        self.assertEqual(len(run.payment_ids), 2, "Al reanudar se continúa desde el punto de control.")
+
+    def test_18_calculate_and_create_royalty_payment(self):
+        """Prueba el cálculo individual: el pago guarda la base de ventas del período."""
+        payment = self.test_franchise._calculate_and_create_royalty_payment(date(2025, 6, 1), date(2025, 6, 30), 1500.0)
+        self.assertAlmostEqual(payment.period_revenue, 1500.0, places=2)
+        self.assertAlmostEqual(payment.calculated_amount, 150.0, places=2)
+        self.assertEqual(payment.state, 'calculated')
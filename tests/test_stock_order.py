@@ -190,4 +190,307 @@ class TestStockOrder(TransactionCase):
         
         # Debería poder eliminar en estado draft
         order.unlink()
-        self.assertFalse(self.StockOrder.search([('id', '=', order_id)]))
\ No newline at end of file
+        self.assertFalse(self.StockOrder.search([('id', '=', order_id)]))
+
+    def test_09_overdue_sweep_and_side_effect_free_read(self):
+        """Prueba que leer no modifica el estado y que el barrido marca vencidos con una nota."""
+        order = self.StockOrder.create(self.order_data_valid)
+        order.write({'state': 'delivered', 'payment_due_date': fields.Date.today() - timedelta(days=3)})
+        messages_before = len(order.message_ids)
+
+        order.read(['state', 'days_overdue', 'payment_due_date'])
+        order.invalidate_recordset()
+        self.assertEqual(order.state, 'delivered', "Leer el pedido no debe cambiar su estado.")
+
+        swept = self.env['gelroy.overdue.engine'].sweep_overdue()
+        order.invalidate_recordset()
+        self.assertEqual(order.state, 'overdue', "El barrido debe marcar el pedido como vencido.")
+        self.assertGreaterEqual(swept['gelroy.stock.order'], 1)
+        self.assertEqual(order.days_overdue, 3)
+        self.assertEqual(len(order.message_ids), messages_before + 1,
+                         "Debe registrarse una sola nota consolidada por pedido.")
+        self.assertEqual(self.StockOrder.check_overdue_orders(), 0,
+                         "Un segundo barrido no debe encontrar pedidos pendientes.")
+
+    def test_10_outstanding_amount_with_partial_payment(self):
+        """Prueba que el pendiente descuenta pagos parciales de la factura publicada."""
+        order = self.StockOrder.create(self.order_data_valid)
+        other_order = self.StockOrder.create(dict(self.order_data_valid, order_date=date(2025, 6, 11)))
+        (order | other_order).write({'state': 'delivered'})
+
+        invoice = self.AccountMove.browse(order.action_create_invoice()['res_id'])
+        self.assertEqual(invoice.stock_order_id, order, "La factura debe quedar vinculada al pedido.")
+        invoice.action_post()
+        self.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=invoice.ids,
+        ).create({'amount': 40.0})._create_payments()
+
+        self.assertAlmostEqual(invoice.amount_residual, 60.0, places=2)
+        self.assertAlmostEqual(order.outstanding_amount, 60.0, places=2,
+                               msg="El pendiente debe descontar el pago parcial de 40.")
+        self.assertAlmostEqual(other_order.outstanding_amount, 100.0, places=2,
+                               msg="El otro pedido no tiene facturas cobradas.")
+
+    def test_11_bulk_numbering_never_reuses_numbers(self):
+        """Prueba la numeración en bloque por franquicia y que los números no se reutilizan."""
+        orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_line_ids=[]) for _index in range(5)
+        ])
+        numbers = [int(name.rsplit('-', 1)[1]) for name in orders.mapped('name')]
+        self.assertEqual(len(set(orders.mapped('name'))), 5, "Cada pedido debe tener un nombre único.")
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 5)),
+                         "Un create() en bloque debe recibir números consecutivos.")
+
+        last_name = orders[-1].name
+        orders[-1].unlink()
+        new_order = self.StockOrder.create(dict(self.order_data_valid, order_line_ids=[]))
+        self.assertNotEqual(new_order.name, last_name, "Un número liberado no debe reutilizarse.")
+        self.assertEqual(int(new_order.name.rsplit('-', 1)[1]), numbers[-1] + 1)
+
+        orders[0].write({'order_date': date(2025, 6, 12)})
+        self.assertEqual(orders[0].name, f"Order-{self.test_franchise_so.franchise_code}-{numbers[0]:03d}",
+                         "Cambiar la fecha no debe renumerar el pedido.")
+
+    def test_12_batched_transit_ships_with_pickings(self):
+        """Prueba que enviar varios pedidos juntos genera un albarán validado por pedido y descuenta el stock."""
+        orders = self.StockOrder.create([self.order_data_valid, self.order_data_valid])
+        orders.write({'state': 'approved'})
+        qty_a_before = self.product_a.qty_available
+        qty_b_before = self.product_b.qty_available
+
+        orders.action_start_transit()
+
+        self.assertEqual(set(orders.mapped('state')), {'in_transit'})
+        self.assertAlmostEqual(self.product_a.qty_available, qty_a_before - 10,
+                               msg="Deben descontarse 5 unidades de A por cada pedido.")
+        self.assertAlmostEqual(self.product_b.qty_available, qty_b_before - 4,
+                               msg="Deben descontarse 2 unidades de B por cada pedido.")
+        for order in orders:
+            self.assertEqual(len(order.picking_ids), 1, "Cada pedido debe tener su propio albarán de salida.")
+            self.assertEqual(order.picking_ids.state, 'done', "El albarán debe quedar validado.")
+            self.assertEqual(order.picking_ids.origin, order.name)
+            self.assertEqual(sorted(order.picking_ids.move_ids.mapped('quantity')), [2.0, 5.0])
+
+        order_too_big = self.StockOrder.create(dict(self.order_data_valid, order_line_ids=[
+            (0, 0, {'product_id': self.product_b.id, 'quantity': qty_b_before}),
+        ]))
+        order_too_big.write({'state': 'approved'})
+        with self.assertRaises(UserError):
+            order_too_big.action_start_transit()
+
+    def test_13_bulk_approve_by_priority(self):
+        """Prueba la aprobación masiva: demanda combinada, orden por prioridad e informe por pedido."""
+        def submitted_order(priority, order_date, quantity):
+            order = self.StockOrder.create(dict(self.order_data_valid, priority=priority, order_date=order_date,
+                                                order_line_ids=[(0, 0, {'product_id': self.product_b.id,
+                                                                        'quantity': quantity})]))
+            order.write({'state': 'submitted'})
+            return order
+
+        available = self.product_b.qty_available
+        normal = submitted_order('normal', date(2025, 6, 1), available * 0.6)
+        emergency = submitted_order('emergency', date(2025, 6, 5), available * 0.6)
+        urgent = submitted_order('urgent', date(2025, 6, 3), available * 0.3)
+        draft = self.StockOrder.create(self.order_data_valid)
+
+        wizard = self.env['gelroy.stock.order.bulk.approve'].with_context(
+            active_model='gelroy.stock.order', active_ids=(normal | emergency | urgent | draft).ids,
+        ).create({})
+        wizard.action_approve()
+
+        self.assertEqual(wizard.state, 'done')
+        self.assertEqual((emergency | urgent).mapped('state'), ['approved', 'approved'],
+                         "Emergencia y urgente deben aprobarse primero.")
+        self.assertEqual(normal.state, 'submitted', "El pedido normal ya no entra en el stock restante.")
+        self.assertEqual(draft.state, 'draft')
+        self.assertEqual(wizard.approved_count, 2)
+        self.assertEqual(wizard.held_count, 2)
+        held = wizard.line_ids.filtered(lambda line: line.order_id == normal)
+        self.assertEqual(held.result, 'held')
+        self.assertIn(self.product_b.display_name, held.reason, "El motivo debe indicar el producto faltante.")
+
+    def test_14_approval_reserves_stock_until_shipment(self):
+        """Prueba que aprobar reserva stock, cancelar lo libera y enviar lo consume."""
+        Reservation = self.env['gelroy.stock.reservation']
+        location = self.StockOrder._get_transit_source_location()
+        available = self.product_b.with_context(location=location.id).qty_available
+        # El stock de otra ubicación interna no está disponible para los envíos
+        other_location = self.env['stock.location'].create({
+            'name': 'Depósito Externo',
+            'usage': 'internal',
+            'location_id': self.env.ref('stock.stock_location_locations').id,
+        })
+        self.env['stock.quant']._update_available_quantity(self.product_b, other_location, 1000)
+        order_data = dict(self.order_data_valid, order_line_ids=[
+            (0, 0, {'product_id': self.product_b.id, 'quantity': available * 0.6}),
+        ])
+        first, second = self.StockOrder.create([order_data, order_data])
+        (first | second).write({'state': 'submitted'})
+
+        first.action_approve()
+        self.assertEqual(first.reservation_ids.mapped('state'), ['reserved'])
+        self.assertAlmostEqual(Reservation._get_unreserved_quantities(self.product_b, location)[self.product_b.id],
+                               available * 0.4, msg="Lo reservado debe descontarse del disponible.")
+        with self.assertRaises(UserError):
+            second.action_approve()
+
+        first.action_cancel()
+        self.assertEqual(first.reservation_ids.mapped('state'), ['released'])
+        second.action_approve()
+        second.action_start_transit()
+        self.assertEqual(second.reservation_ids.mapped('state'), ['consumed'])
+        self.assertAlmostEqual(Reservation._get_unreserved_quantities(self.product_b, location)[self.product_b.id],
+                               available * 0.4, msg="El stock enviado ya no figura como reservado.")
+
+    def test_15_invoice_batch_in_chunks_without_duplicates(self):
+        """Prueba la facturación en lote por bloques, sin duplicar pedidos ya facturados."""
+        orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_date=date(2025, 6, day)) for day in (1, 2, 3, 4, 5)
+        ])
+        orders.write({'state': 'delivered'})
+        already_invoiced = self.AccountMove.browse(orders[0].action_create_invoice()['res_id'])
+
+        batch = self.env['gelroy.invoice.batch'].create({
+            'order_ids': [(6, 0, orders.ids)],
+            'chunk_size': 2,
+        })
+        self.assertEqual(batch.invoiced_count, 1, "El pedido ya facturado cuenta como avance.")
+        batch._process()
+
+        self.assertEqual(batch.state, 'done')
+        self.assertEqual(len(batch.invoice_ids), 4, "Solo deben facturarse los cuatro pedidos pendientes.")
+        self.assertEqual(batch.progress, 100.0)
+        self.assertEqual(batch.invoice_ids.stock_order_id, orders[1:])
+        self.assertNotIn(already_invoiced, batch.invoice_ids)
+
+        batch._process()
+        self.assertEqual(len(batch.invoice_ids), 4, "Reprocesar el lote no debe duplicar facturas.")
+        with self.assertRaises(UserError):
+            orders[1].action_create_invoice()
+
+    def test_16_consolidated_monthly_invoice(self):
+        """Prueba la factura mensual consolidada: una por período, líneas por pedido y pago propagado."""
+        self.test_franchise_so.invoicing_policy = 'monthly'
+        june_orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_date=date(2025, 6, day)) for day in (2, 9, 16)
+        ])
+        july_order = self.StockOrder.create(dict(self.order_data_valid, order_date=date(2025, 7, 1),
+                                                 requested_delivery_date=date(2025, 7, 10)))
+        (june_orders | july_order).write({'state': 'delivered'})
+
+        self.StockOrder._cron_invoice_closed_periods()
+        invoices = self.AccountMove.search([('stock_order_ids', 'in', (june_orders | july_order).ids)])
+        self.assertEqual(len(invoices), 2, "Debe haber una factura por mes cerrado.")
+        june_invoice = invoices.filtered(lambda invoice: june_orders[0] in invoice.stock_order_ids)
+        self.assertEqual(june_invoice.stock_order_ids, june_orders)
+        self.assertEqual(len(june_invoice.invoice_line_ids.filtered(lambda line: line.display_type == 'line_section')), 3,
+                         "Debe haber una sección por pedido.")
+        self.assertAlmostEqual(june_invoice.amount_untaxed, 300.0, places=2)
+
+        self.StockOrder._cron_invoice_closed_periods()
+        self.assertEqual(self.AccountMove.search_count([('stock_order_ids', 'in', june_orders.ids)]), 1,
+                         "Un período ya facturado no se vuelve a facturar.")
+
+        june_invoice.action_post()
+        self.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=june_invoice.ids,
+        ).create({'amount': 150.0})._create_payments()
+        for order in june_orders:
+            self.assertAlmostEqual(order.outstanding_amount, 50.0, places=2,
+                                   msg="El pago parcial se reparte en proporción al total de cada pedido.")
+
+        june_invoice.write({'payment_state': 'paid'})
+        self.assertEqual(set(june_orders.mapped('state')), {'paid'},
+                         "El pago de la factura consolidada debe llegar a todos sus pedidos.")
+
+    def test_17_line_amounts_match_compute_all(self):
+        """Prueba que el cálculo en lote de impuestos da exactamente lo mismo que compute_all por línea."""
+        tax = self.env['account.tax'].create({
+            'name': 'IVA Prueba 21%', 'amount_type': 'percent', 'amount': 21.0, 'type_tax_use': 'sale',
+        })
+        product = self.env['product.product'].create({
+            'name': 'Producto con impuesto', 'detailed_type': 'consu', 'list_price': 10.33,
+            'taxes_id': [(6, 0, tax.ids)],
+        })
+        quantities = [1, 3, 3, 7, 3, 0.5]
+        orders = self.StockOrder.create([dict(self.order_data_valid, order_line_ids=[
+            (0, 0, {'product_id': product.id, 'quantity': quantity}) for quantity in quantities
+        ]) for _index in range(3)])
+
+        for line in orders.order_line_ids:
+            expected = tax.compute_all(10.33, quantity=line.quantity, product=product,
+                                       partner=line.order_id.franchisee_id)
+            self.assertEqual(line.price_subtotal, expected['total_excluded'])
+            self.assertEqual(line.price_total, expected['total_included'])
+            self.assertEqual(line.price_tax, expected['total_included'] - expected['total_excluded'])
+
+    def test_18_invoice_count_follows_invoice_links(self):
+        """Prueba que el contador y la acción de facturas incluyen la factura consolidada del pedido."""
+        self.test_franchise_so.invoicing_policy = 'monthly'
+        orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_date=date(2025, 6, day)) for day in (2, 9)
+        ])
+        orders.write({'state': 'delivered'})
+        self.StockOrder._cron_invoice_closed_periods()
+        invoice = self.AccountMove.search([('stock_order_ids', 'in', orders.ids)])
+        self.assertEqual(len(invoice), 1)
+        self.assertNotEqual(invoice.invoice_origin, orders[0].name,
+                            "El origen de la factura consolidada lista todos los pedidos.")
+
+        orders.invalidate_recordset(['invoice_count'])
+        self.assertEqual(orders.mapped('invoice_count'), [1, 1],
+                         "Cada pedido debe contar la factura consolidada que lo cubre.")
+        action = orders[1].action_view_invoices()
+        self.assertEqual(action['res_id'], invoice.id, "La acción debe abrir la factura consolidada.")
+
+    def test_19_invoice_batch_keeps_consolidation_periods(self):
+        """Prueba que el lote no parte un período consolidado y que un período abierto no se factura a mano."""
+        self.test_franchise_so.invoicing_policy = 'monthly'
+        june_orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_date=date(2025, 6, day)) for day in (2, 9, 16)
+        ])
+        july_order = self.StockOrder.create(dict(self.order_data_valid, order_date=date(2025, 7, 1),
+                                                 requested_delivery_date=date(2025, 7, 10)))
+        (june_orders | july_order).write({'state': 'delivered'})
+
+        batch = self.env['gelroy.invoice.batch'].create({
+            'order_ids': [(6, 0, (june_orders | july_order).ids)],
+            'chunk_size': 2,
+        })
+        self.assertEqual(batch._get_next_chunk(), june_orders,
+                         "Un período mayor que el bloque debe facturarse entero en un solo bloque.")
+        batch._process()
+        self.assertEqual(len(batch.invoice_ids), 2, "Debe haber una factura por mes, no una por bloque.")
+        june_invoice = batch.invoice_ids.filtered(lambda invoice: june_orders[0] in invoice.stock_order_ids)
+        self.assertEqual(june_invoice.stock_order_ids, june_orders)
+
+        today = fields.Date.context_today(self.StockOrder)
+        open_order = self.StockOrder.create(dict(self.order_data_valid, order_date=today,
+                                                 requested_delivery_date=today + timedelta(days=10)))
+        open_order.write({'state': 'delivered'})
+        with self.assertRaises(UserError):
+            open_order.action_create_invoice()
+        with self.assertRaises(UserError):
+            self.env['gelroy.invoice.batch'].create({'order_ids': [(6, 0, open_order.ids)]}).action_start()
+
+    def test_20_unlink_checks_consolidated_invoices(self):
+        """Prueba que borrar pedidos respeta la factura consolidada que los cubre."""
+        self.test_franchise_so.invoicing_policy = 'monthly'
+        orders = self.StockOrder.create([
+            dict(self.order_data_valid, order_date=date(2025, 6, day)) for day in (2, 9)
+        ])
+        orders.write({'state': 'delivered'})
+        self.StockOrder._cron_invoice_closed_periods()
+        invoice = self.AccountMove.search([('stock_order_ids', 'in', orders.ids)])
+        self.assertEqual(len(invoice), 1)
+
+        with self.assertRaises(ValidationError, msg="El borrador consolidado también cubre el otro pedido."):
+            orders[0].unlink()
+
+        invoice.action_post()
+        with self.assertRaises(ValidationError, msg="Una factura consolidada confirmada bloquea el borrado."):
+            orders.unlink()
+
+        invoice.button_draft()
+        orders.unlink()
+        self.assertFalse(invoice.exists(), "El borrador consolidado se borra con todos sus pedidos.")
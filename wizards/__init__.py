@@ -0,0 +1 @@
+from . import stock_order_bulk_approve
\ No newline at end of file
@@ -0,0 +1,72 @@
+from odoo import models, fields, api, Command, _
+from odoo.exceptions import UserError
+
+
+class StockOrderBulkApprove(models.TransientModel):
+    _name = 'gelroy.stock.order.bulk.approve'
+    _description = 'Stock Order Bulk Approval'
+
+    order_ids = fields.Many2many('gelroy.stock.order', string='Orders')
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+    ], string='Status', default='draft', readonly=True)
+    line_ids = fields.One2many('gelroy.stock.order.bulk.approve.line', 'wizard_id',
+                               string='Report', readonly=True)
+    approved_count = fields.Integer(string='Approved', compute='_compute_counts')
+    held_count = fields.Integer(string='Held Back', compute='_compute_counts')
+
+    @api.model
+    def default_get(self, fields_list):
+        """Tomar los pedidos seleccionados en la lista"""
+        res = super().default_get(fields_list)
+        if self.env.context.get('active_model') == 'gelroy.stock.order' and 'order_ids' in fields_list:
+            res['order_ids'] = [Command.set(self.env.context.get('active_ids', []))]
+        return res
+
+    @api.depends('line_ids.result')
+    def _compute_counts(self):
+        for wizard in self:
+            wizard.approved_count = len(wizard.line_ids.filtered(lambda line: line.result == 'approved'))
+            wizard.held_count = len(wizard.line_ids) - wizard.approved_count
+
+    def action_approve(self):
+        """Aprobar en bloque y mostrar el informe por pedido en el mismo asistente"""
+        self.ensure_one()
+        if not self.order_ids:
+            raise UserError(_("Select at least one stock order to approve."))
+
+        report = self.order_ids._bulk_approve()
+        self.write({
+            'state': 'done',
+            'line_ids': [Command.clear()] + [Command.create({
+                'order_id': item['order'].id,
+                'result': 'approved' if item['approved'] else 'held',
+                'reason': item['reason'],
+            }) for item in report],
+        })
+        return {
+            'name': _("Bulk Approval Report"),
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class StockOrderBulkApproveLine(models.TransientModel):
+    _name = 'gelroy.stock.order.bulk.approve.line'
+    _description = 'Stock Order Bulk Approval Result'
+    _order = 'wizard_id, id'
+
+    wizard_id = fields.Many2one('gelroy.stock.order.bulk.approve', string='Wizard',
+                                required=True, ondelete='cascade')
+    order_id = fields.Many2one('gelroy.stock.order', string='Order', readonly=True)
+    priority = fields.Selection(related='order_id.priority', readonly=True)
+    order_date = fields.Date(related='order_id.order_date', readonly=True)
+    result = fields.Selection([
+        ('approved', 'Approved'),
+        ('held', 'Held Back'),
+    ], string='Result', readonly=True)
+    reason = fields.Text(string='Reason', readonly=True)